@@ -1,14 +1,9 @@
-import os
-import csv
 import time
 import threading
-import imaplib
-import smtplib
 import email
-from email.header import decode_header
-from email.mime.text import MIMEText
-import ssl
 import traceback
+from collections import OrderedDict
+from contextlib import nullcontext
 from datetime import datetime
 
 import customtkinter as ctk
@@ -16,196 +11,98 @@ from tkinter import messagebox
 import keyring
 from fpdf import FPDF
 
-# ----------------- CONSTANTS & PATHS -----------------
-
-APP_NAME = "EmailAssistantPro"
-LOG_DIR = "logs"
-ATTACH_DIR = "attachments"
-os.makedirs(LOG_DIR, exist_ok=True)
-os.makedirs(ATTACH_DIR, exist_ok=True)
-
-LOG_CSV_PATH = os.path.join(LOG_DIR, "email_log.csv")
-
-CATEGORIES = [
-    "Billing / Payment",
-    "Order / Purchase",
-    "Support Request",
-    "Client Lead",
-    "Other",
-]
-
-
-# ----------------- CLASSIFIER -----------------
-
-def classify_email(subject: str, body: str):
-    text = (subject or "") + " " + (body or "")
-    text = text.lower()
-
-    billing = ["invoice", "payment", "bill", "billing", "due", "overdue"]
-    order = ["order", "shipment", "tracking", "delivery", "purchase"]
-    support = ["issue", "error", "bug", "problem", "support", "help", "not working", "failed"]
-    lead = ["quote", "pricing", "project", "proposal", "hire", "collaboration", "work with you", "service"]
-    urgent = ["urgent", "asap", "immediately", "critical", "important"]
-
-    if any(k in text for k in billing):
-        category = "Billing / Payment"
-    elif any(k in text for k in order):
-        category = "Order / Purchase"
-    elif any(k in text for k in support):
-        category = "Support Request"
-    elif any(k in text for k in lead):
-        category = "Client Lead"
-    else:
-        category = "Other"
-
-    is_urgent = any(k in text for k in urgent)
-    return category, is_urgent
-
-
-def build_reply(category: str, sender_name: str | None = None):
-    sender_name = sender_name or "there"
-
-    templates = {
-        "Billing / Payment": f"""Hi {sender_name},
-
-Thank you for your message about billing/payment. We have received your request and will review the details shortly.
-
-If this is about a specific invoice, please include the invoice number or date.
-
-Best regards,
-[Your Name]
-""",
-        "Order / Purchase": f"""Hi {sender_name},
-
-Thank you for contacting us about your order.
-
-We will check the order status and get back to you. If you have an order ID or tracking number, please include it.
-
-Best regards,
-[Your Name]
-""",
-        "Support Request": f"""Hi {sender_name},
-
-Thank you for reaching out! We have received your support request.
-
-We will review the issue and respond with an update as soon as possible.
-
-Best regards,
-[Your Name]
-""",
-        "Client Lead": f"""Hi {sender_name},
-
-Thank you for your interest!
-
-Please share some details about your requirement (scope, timeline, and budget) so we can suggest the best next steps.
-
-Best regards,
-[Your Name]
-""",
-    }
-
-    return templates.get(category, f"""Hi {sender_name},
-
-Thank you for your email. We have received your message and will look into it shortly.
-
-Best regards,
-[Your Name]
-""")
+from imap_fetch import (
+    CLASSIFY_BYTES, FETCH_CHUNK_SIZE, FetchStats, find_text_part, iter_fetch, iter_text_prefixes,
+    select_folder,
+)
+from category_model import HybridClassifier, load_classifier
+from classifier import CATEGORIES
+from classify_cache import ClassificationCache
+from imap_idle import IdleWatcher, connect_imap
+from mail_record import BodyStore, MailRecord
+from mail_stats import MailStats, ReplyHistory, format_duration
+from message_store import MessageStore
+from metrics import Exporter, profiled, timed
+from mailparse import PARSE_WORKERS, ParsePipeline, extract_body, save_attachments
+from reply_jobs import ReplyJob, SentLedger, reply_key
+from reply_log import ensure_log_csv, flush_logs, log_reply, summarize_log
+from reply_templates import build_reply_message, build_reply_messages, default_templates, ensure_templates
+from reports import REPORT_RANGES, build_report, mode_split, range_text
+from smtp_pool import SmtpPool, connect_smtp
+from settings import (
+    ACCOUNTS_PATH, APP_NAME, BODY_SPILL_DIR, CLASSIFY_CACHE_PATH, HISTORY_PATH, LEDGER_PATH, LOG_CSV_PATH, LOG_PDF_PATH,
+    METRICS_JSON_PATH, METRICS_PROM_PATH, PROFILE_DIR, STORE_PATH, SYNC_STATE_PATH, ensure_dirs,
+)
+from sync_engine import FETCH_LIMIT, SyncEngine, fetch_pages, load_accounts, mail_key, mail_sort_key
+from sync_state import SyncState
+from thread_index import ThreadIndex
+from ui_dispatch import UiDispatcher
+from virtual_list import VirtualList
+
+# ----------------- CONSTANTS -----------------
+
+ensure_dirs()
+
+BODY_CACHE_SIZE = 50  # bodies kept in memory in headers-only mode
+ALL_MAILBOXES = (None, None, None)  # emails_source of the unified multi-mailbox list
+
+URGENT_COLOR = "#e05d5d"
+REPLIED_COLOR = "gray55"
+
+# List filters and sort orders: label -> predicate / (key, reverse); key None = fetch order
+LIST_FILTERS = {
+    "All": None,
+    "Unreplied": lambda m: not m.get("replied"),
+    "Urgent": lambda m: m.get("urgent"),
+    "Unclassified": lambda m: m["category"] == "Unclassified",
+    **{c: (lambda m, c=c: m["category"] == c) for c in CATEGORIES},
+}
+LIST_SORTS = {
+    "Newest first": (None, False),
+    "Oldest first": (None, True),
+    "Sender": (lambda m: (m.get("from") or "").lower(), False),
+    "Subject": (lambda m: (m.get("subject") or "").lower(), False),
+    "Category": (lambda m: m["category"], False),
+    "Urgent first": (lambda m: not m.get("urgent"), False),
+}
 
 
 # ----------------- UTILS -----------------
 
-def decode_str(s):
-    if not s:
-        return ""
-    parts = decode_header(s)
-    out = []
-    for text, enc in parts:
-        if isinstance(text, bytes):
-            try:
-                out.append(text.decode(enc or "utf-8", errors="ignore"))
-            except Exception:
-                out.append(text.decode("utf-8", errors="ignore"))
-        else:
-            out.append(text)
-    return " ".join(out)
-
-
-def extract_body(msg: email.message.Message):
-    if msg.is_multipart():
-        for part in msg.walk():
-            ctype = part.get_content_type()
-            disp = (part.get("Content-Disposition") or "").lower()
-            if ctype == "text/plain" and "attachment" not in disp:
-                try:
-                    return part.get_payload(decode=True).decode(errors="ignore")
-                except Exception:
-                    continue
-    else:
-        if msg.get_content_type() == "text/plain":
-            try:
-                return msg.get_payload(decode=True).decode(errors="ignore")
-            except Exception:
-                pass
-    return ""
-
-
-def save_attachments(msg: email.message.Message, uid: str):
-    saved = []
-    folder = os.path.join(ATTACH_DIR, f"email_{uid}")
-    os.makedirs(folder, exist_ok=True)
-
-    if msg.is_multipart():
-        for part in msg.walk():
-            disp = (part.get("Content-Disposition") or "").lower()
-            if "attachment" in disp:
-                filename = part.get_filename()
-                filename = decode_str(filename) if filename else f"file_{int(time.time())}.bin"
-                path = os.path.join(folder, filename)
-                try:
-                    with open(path, "wb") as f:
-                        f.write(part.get_payload(decode=True))
-                    saved.append(path)
-                except Exception:
-                    continue
-    return saved
+class LRUCache:
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
 
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
 
-def ensure_log_csv():
-    if not os.path.exists(LOG_CSV_PATH):
-        with open(LOG_CSV_PATH, "w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow([
-                "timestamp",
-                "from",
-                "subject",
-                "category",
-                "urgent",
-                "attachments",
-                "mode",  # manual/auto
-            ])
+    def clear(self):
+        with self._lock:
+            self._data.clear()
 
 
 # ----------------- PDF LOG SUMMARY -----------------
 
-def generate_pdf_log_summary(csv_path: str, pdf_path: str):
-    if not os.path.exists(csv_path):
-        raise FileNotFoundError("No log CSV found.")
-
-    counts = {c: 0 for c in CATEGORIES}
-    urgent_count = 0
-    total = 0
-
-    with open(csv_path, "r", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            total += 1
-            cat = row.get("category", "Other")
-            if cat not in counts:
-                counts[cat] = 0
-            counts[cat] += 1
-            if row.get("urgent", "").lower() in ("1", "true", "yes"):
-                urgent_count += 1
+def generate_pdf_log_summary(csv_path: str, pdf_path: str, range_label: str = "All time") -> dict:
+    # All-time totals (from the log checkpoint) followed by one section per
+    # period of the chosen range; returns the report
+    summary = summarize_log(csv_path, CATEGORIES)
+    total, urgent_count, counts = summary["total"], summary["urgent"], summary["categories"]
+    start, end, period = REPORT_RANGES[range_label](datetime.now())
+    report = build_report(csv_path, start, end, period, CATEGORIES)
 
     pdf = FPDF()
     pdf.add_page()
@@ -225,14 +122,56 @@ def generate_pdf_log_summary(csv_path: str, pdf_path: str):
     for cat, n in counts.items():
         pdf.cell(0, 7, f"{cat}: {n}", 0, 1)
 
+    pdf.ln(6)
+    pdf.set_font("Arial", "B", 13)
+    pdf.cell(0, 9, f"{range_label}: {range_text(report)}", 0, 1)
+    _pdf_section(pdf, "Whole range", report["totals"])
+    for label, section in report["sections"]:
+        _pdf_section(pdf, label, section)
+
     pdf.output(pdf_path)
+    return report
+
+
+def _pdf_section(pdf, title: str, section: dict):
+    # Heading, category x (replies, urgent) table, manual/automatic split
+    manual, auto = mode_split(section)
+    pdf.ln(3)
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, title, 0, 1)
+    pdf.set_font("Arial", "B", 10)
+    pdf.cell(80, 7, "Category", 1, 0)
+    pdf.cell(30, 7, "Replies", 1, 0, "R")
+    pdf.cell(30, 7, "Urgent", 1, 1, "R")
+    pdf.set_font("Arial", "", 10)
+    for cat, (n, urg) in section["categories"].items():
+        pdf.cell(80, 6, cat, 1, 0)
+        pdf.cell(30, 6, str(n), 1, 0, "R")
+        pdf.cell(30, 6, str(urg), 1, 1, "R")
+    pdf.set_font("Arial", "B", 10)
+    pdf.cell(80, 6, "Total", 1, 0)
+    pdf.cell(30, 6, str(section["total"]), 1, 0, "R")
+    pdf.cell(30, 6, str(section["urgent"]), 1, 1, "R")
+    pdf.set_font("Arial", "", 10)
+    modes = ", ".join(f"{mode} {n}" for mode, n in sorted(section["modes"].items()))
+    pdf.cell(0, 6, f"Manual: {manual}   Automatic: {auto}   ({modes})", 0, 1)
 
 
 # ----------------- PROGRESS POPUP -----------------
 
 class LoadingPopup:
-    def __init__(self, parent, title="Processing", status="Please wait..."):
-        self.win = ctk.CTkToplevel(parent)
+    # Progress window driven from worker threads: every widget call goes through
+    # the UiDispatcher, and progress updates are coalesced to one per frame
+    def __init__(self, ui, title="Processing", status="Please wait..."):
+        self.ui = ui
+        self.win = None
+        self.closed = False
+        ui.call(self._build, title, status)
+
+    def _build(self, title, status):
+        if self.closed:
+            return
+        self.win = ctk.CTkToplevel(self.ui.root)
         self.win.title(title)
         self.win.geometry("320x140")
         self.win.resizable(False, False)
@@ -248,25 +187,43 @@ class LoadingPopup:
         self.percent = ctk.CTkLabel(self.win, text="0%", font=ctk.CTkFont(size=12))
         self.percent.pack()
 
-        self.win.update()
-
     def set(self, value: float, text: str | None = None):
-        if value < 0:
-            value = 0
-        if value > 1:
-            value = 1
-        self.bar.set(value)
-        self.percent.configure(text=f"{int(value * 100)}%")
+        value = min(1.0, max(0.0, value))
+        self.ui.latest((id(self), "value"), self._set_value, value)
         if text:
+            self.ui.latest((id(self), "text"), self._set_text, text)
+
+    def _set_value(self, value: float):
+        if self.win is not None:
+            self.bar.set(value)
+            self.percent.configure(text=f"{int(value * 100)}%")
+
+    def _set_text(self, text: str):
+        if self.win is not None:
             self.label.configure(text=text)
-        self.win.update_idletasks()
 
     def close(self):
+        self.ui.call(self._close)
+
+    def _close(self):
+        self.closed = True
+        if self.win is None:
+            return
         try:
             self.win.grab_release()
             self.win.destroy()
         except Exception:
             pass
+        self.win = None
+
+
+class NullPopup:
+    # Stand-in for LoadingPopup in background cycles (auto-check, push)
+    def set(self, value: float, text: str | None = None):
+        pass
+
+    def close(self):
+        pass
 
 
 # ----------------- MAIN APP -----------------
@@ -281,16 +238,52 @@ class EmailAssistantPro:
         ctk.set_default_color_theme("blue")
 
         self.imap_conn = None
-        self.smtp_conn = None
-
-        self.emails = []  # list of dicts with keys: sub, from, body, date, uid, cat, urgent, attachments, replied
-        self.selected_index = None
+        self.smtp_pool = None
+
+        # MailRecords (dict-like: subject, from, body, date, uid, category, urgent, replied, ...).
+        # Workers replace the list, never change it in place: the list widget keeps
+        # indexing the one it shows until render_list hands it the new one on the Tk thread.
+        self.emails = []
+        self.bodies = BodyStore(BODY_SPILL_DIR)  # body/preview text of loaded records, on disk
+        self.stats = MailStats(CATEGORIES)  # dashboard counters over self.emails, kept in step with it
+        self.history = ReplyHistory(HISTORY_PATH)  # long-term reply aggregates per day
+        self.selected_mail = None
+        self.emails_source = None  # (account, folder, uidvalidity) the loaded list mirrors
+        self.sync_state = SyncState(SYNC_STATE_PATH)
+        self.body_cache = LRUCache(BODY_CACHE_SIZE)
+        self.parse_pipeline = ParsePipeline(PARSE_WORKERS)
+        self.store = MessageStore(STORE_PATH)
+        self.ledger = SentLedger(LEDGER_PATH)  # replies sent, keyed by Message-ID
+        # Trained model + keyword rules when data/category_model.npz exists, else the rules;
+        # results cached by content hash + classifier version
+        classifier, classifier_error = load_classifier()
+        self.model_loaded = isinstance(classifier, HybridClassifier)
+        self.classify_cache = ClassificationCache(CLASSIFY_CACHE_PATH, classifier)
+        self.threads = ThreadIndex()  # conversations over loaded + stored mail
+        self.reply_job = None
+        self.search_results = None  # list shown instead of self.emails while searching
+        self.imap_lock = threading.RLock()
+        self.classify_bytes = 0  # bytes downloaded for classification (partial fetch metric)
+        self.classify_count = 0
 
         self.auto_check_enabled = False
         self.auto_check_interval_min = 5
+        self.imap_params = None  # (host, port, ssl, user, password) for extra connections
+        self.sync_engine = None  # concurrent multi-account/folder sync, set up on connect
+        self.idle_watcher = None
+        self.metrics_exporter = Exporter(METRICS_PROM_PATH, METRICS_JSON_PATH, on_error=self.set_status).start()
 
         ensure_log_csv()
+        ensure_templates()
+        self.ui = UiDispatcher(root)  # widget updates from worker threads
         self._build_ui()
+        self.stats.subscribe(self.update_dashboard)
+        self.history.subscribe(self.update_dashboard)
+        self.ui.start()
+        self.update_dashboard()
+        if classifier_error:
+            self.set_status(classifier_error)
+        self.run_async(self.load_threads)
 
         # Try autofill password when email field loses focus
         self.entry_email.bind("<FocusOut>", self.autofill_password)
@@ -327,9 +320,16 @@ class EmailAssistantPro:
         chk_ssl.grid(row=1, column=2, padx=5, pady=4, sticky="w")
 
         btn_connect = ctk.CTkButton(top, text="Connect", width=140,
-                                    command=lambda: self.run_async(self.connect_accounts))
+                                    command=lambda: self.run_async(self.connect_accounts, self.connection_form()))
         btn_connect.grid(row=1, column=3, padx=5, pady=4)
 
+        self.var_lazy = ctk.BooleanVar(value=False)
+        chk_lazy = ctk.CTkCheckBox(top, text="Headers only (load bodies on open)", variable=self.var_lazy)
+        chk_lazy.grid(row=1, column=4, padx=5, pady=4, sticky="w")
+
+        self.entry_folders = ctk.CTkEntry(top, placeholder_text="Folders to sync (e.g. INBOX, Support)", width=220)
+        self.entry_folders.grid(row=0, column=4, padx=5, pady=4)
+
         # Middle area: left list + center details + right dashboard
         middle = ctk.CTkFrame(main)
         middle.pack(fill="both", expand=True, padx=8, pady=(4, 8))
@@ -341,24 +341,61 @@ class EmailAssistantPro:
         lbl_list = ctk.CTkLabel(left, text="Emails", font=ctk.CTkFont(size=14, weight="bold"))
         lbl_list.pack(pady=(6, 4))
 
-        self.text_list = ctk.CTkTextbox(left, width=360, height=360, state="disabled")
-        self.text_list.pack(fill="both", expand=True, padx=6, pady=4)
+        search_row = ctk.CTkFrame(left)
+        search_row.pack(fill="x", padx=6, pady=(0, 4))
+
+        self.entry_search = ctk.CTkEntry(search_row, placeholder_text="Search stored mail (subject, from, body)")
+        self.entry_search.pack(side="left", fill="x", expand=True, padx=(0, 3))
+        self.entry_search.bind("<Return>", self.search_emails)
+
+        btn_search = ctk.CTkButton(search_row, text="Search", width=70, command=self.search_emails)
+        btn_search.pack(side="left")
+
+        view_row = ctk.CTkFrame(left)
+        view_row.pack(fill="x", padx=6, pady=(0, 4))
+
+        self.var_filter = ctk.StringVar(value="All")
+        opt_filter = ctk.CTkOptionMenu(view_row, values=list(LIST_FILTERS), variable=self.var_filter,
+                                       command=self.apply_list_view, width=170)
+        opt_filter.pack(side="left", padx=(0, 3))
+
+        self.var_sort = ctk.StringVar(value="Newest first")
+        opt_sort = ctk.CTkOptionMenu(view_row, values=list(LIST_SORTS), variable=self.var_sort,
+                                     command=self.apply_list_view, width=140)
+        opt_sort.pack(side="left")
+
+        self.var_threads = ctk.BooleanVar(value=False)
+        chk_threads = ctk.CTkCheckBox(view_row, text="Threads", variable=self.var_threads,
+                                      command=self.apply_list_view, width=70)
+        chk_threads.pack(side="left", padx=(6, 0))
+
+        self.email_list = VirtualList(left, formatter=self.format_row, on_select=self.on_select_mail,
+                                      width=360, height=360)
+        self.email_list.pack(fill="both", expand=True, padx=6, pady=4)
 
         btn_row = ctk.CTkFrame(left)
         btn_row.pack(fill="x", padx=6, pady=(4, 6))
 
         btn_fetch = ctk.CTkButton(btn_row, text="Fetch latest",
-                                  command=lambda: self.run_async(self.fetch_emails), width=120)
+                                  command=lambda: self.run_async(self.fetch_emails, self.var_lazy.get(),
+                                                                 profile=self.take_profile()),
+                                  width=120)
         btn_fetch.pack(side="left", padx=3)
 
         btn_classify = ctk.CTkButton(btn_row, text="Classify all",
-                                     command=self.classify_all, width=100)
+                                     command=lambda: self.run_async(self.classify_all), width=100)
         btn_classify.pack(side="left", padx=3)
 
         btn_reply = ctk.CTkButton(btn_row, text="Auto-reply selected",
-                                  command=lambda: self.run_async(self.auto_reply_selected), width=150)
+                                  command=lambda: self.run_async(self.auto_reply_selected,
+                                                                 profile=self.take_profile()),
+                                  width=150)
         btn_reply.pack(side="left", padx=3)
 
+        self.btn_bulk_reply = ctk.CTkButton(btn_row, text="Auto-reply all",
+                                            command=self.toggle_bulk_reply, width=110)
+        self.btn_bulk_reply.pack(side="left", padx=3)
+
         # Center: email details
         center = ctk.CTkFrame(middle)
         center.pack(side="left", fill="both", expand=True, padx=(0, 8), pady=4)
@@ -378,9 +415,17 @@ class EmailAssistantPro:
         self.text_body = ctk.CTkTextbox(center, state="disabled", height=260)
         self.text_body.pack(fill="both", expand=True, padx=6, pady=4)
 
-        btn_log_pdf = ctk.CTkButton(center, text="Generate PDF Log Summary",
-                                    command=lambda: self.run_async(self.generate_pdf_log))
-        btn_log_pdf.pack(pady=(4, 6))
+        report_row = ctk.CTkFrame(center)
+        report_row.pack(pady=(4, 6))
+
+        self.var_report_range = ctk.StringVar(value="Last 30 days")
+        opt_range = ctk.CTkOptionMenu(report_row, values=list(REPORT_RANGES), variable=self.var_report_range,
+                                      width=140)
+        opt_range.pack(side="left", padx=(0, 3))
+
+        btn_log_pdf = ctk.CTkButton(report_row, text="Generate PDF Log Summary",
+                                    command=lambda: self.run_async(self.generate_pdf_log, self.var_report_range.get()))
+        btn_log_pdf.pack(side="left")
 
         # Right: dashboard & auto-check
         right = ctk.CTkFrame(middle, width=230)
@@ -401,6 +446,9 @@ class EmailAssistantPro:
         self.lbl_cat_stats = ctk.CTkLabel(right, text="By category:\n", anchor="w", justify="left")
         self.lbl_cat_stats.pack(fill="x", padx=6, pady=(4, 8))
 
+        self.lbl_history = ctk.CTkLabel(right, text="All time:\n", anchor="w", justify="left")
+        self.lbl_history.pack(fill="x", padx=6, pady=(0, 8))
+
         # Auto-check controls
         sep = ctk.CTkLabel(right, text="────────────", anchor="center")
         sep.pack(pady=(4, 4))
@@ -416,18 +464,53 @@ class EmailAssistantPro:
         self.entry_interval = ctk.CTkEntry(right, placeholder_text="Interval (min, default 5)", width=180)
         self.entry_interval.pack(padx=6, pady=(2, 4))
 
+        self.var_push = ctk.BooleanVar(value=False)
+        chk_push = ctk.CTkCheckBox(right, text="Push mode (IMAP IDLE)", variable=self.var_push,
+                                   command=self.toggle_push)
+        chk_push.pack(padx=6, pady=(2, 4), anchor="w")
+
+        btn_sync_all = ctk.CTkButton(right, text="Sync all mailboxes", width=180,
+                                     command=lambda: self.run_async(self.sync_all_mailboxes))
+        btn_sync_all.pack(padx=6, pady=(4, 4))
+
+        self.var_profile = ctk.BooleanVar(value=False)
+        chk_profile = ctk.CTkCheckBox(right, text="Profile next fetch/reply", variable=self.var_profile)
+        chk_profile.pack(padx=6, pady=(2, 4), anchor="w")
+
         # Status bar
         self.lbl_status = ctk.CTkLabel(main, text="Ready.", anchor="w")
         self.lbl_status.pack(fill="x", padx=8, pady=(0, 4))
 
-        # Bind clicks on list pane
-        self.text_list.bind("<Button-1>", self.on_list_click)
-
     # ------------- GENERAL HELPERS -------------
 
     def set_status(self, text: str):
-        self.lbl_status.configure(text=text)
-        self.root.update_idletasks()
+        # Safe from any thread; only the latest text per frame is drawn
+        self.ui.latest("status", self.lbl_status.configure, text=text)
+
+    @property
+    def connected_account(self) -> str:
+        # The account connected to (the Email field may have been edited since)
+        return self.imap_params[3] if self.imap_params else ""
+
+    def take_profile(self) -> bool:
+        # On the Tk thread: whether "Profile next" is ticked; unticks it
+        if not self.var_profile.get():
+            return False
+        self.var_profile.set(False)
+        return True
+
+    def profile_run(self, name: str, profile: bool):
+        # cProfile + tracemalloc capture of one run when take_profile() said so
+        if not profile:
+            return nullcontext()
+        self.set_status(f"Profiling this {name}; results go to {PROFILE_DIR}.")
+        return profiled(name, PROFILE_DIR)
+
+    def report_template_errors(self):
+        # Template files that failed to load fall back to the previous/built-in text
+        errors = default_templates().take_errors()
+        if errors:
+            self.set_status(errors[-1] if len(errors) == 1 else f"{errors[-1]} (+{len(errors) - 1} more)")
 
     def run_async(self, func, *args, **kwargs):
         t = threading.Thread(target=func, args=args, kwargs=kwargs, daemon=True)
@@ -443,298 +526,675 @@ class EmailAssistantPro:
 
     # ------------- CONNECTION -------------
 
-    def connect_accounts(self):
-        popup = LoadingPopup(self.root, "Connecting", "Starting connection...")
+    def connection_form(self) -> dict:
+        # On the Tk thread: the connection fields, for connect_accounts on a worker
+        return {
+            "email": self.entry_email.get().strip(),
+            "password": self.entry_pass.get().strip(),
+            "imap_host": self.entry_imap.get().strip(),
+            "smtp_host": self.entry_smtp.get().strip(),
+            "imap_port": self.entry_imap_port.get().strip(),
+            "smtp_port": self.entry_smtp_port.get().strip(),
+            "ssl": self.var_ssl.get(),
+            "folders": [f.strip() for f in self.entry_folders.get().split(",") if f.strip()] or ["INBOX"],
+        }
+
+    def connect_accounts(self, form: dict):
+        popup = LoadingPopup(self.ui, "Connecting", "Starting connection...")
         try:
-            email_addr = self.entry_email.get().strip()
-            password = self.entry_pass.get().strip()
-            imap_host = self.entry_imap.get().strip()
-            smtp_host = self.entry_smtp.get().strip()
-            imap_port = int(self.entry_imap_port.get().strip() or "993")
-            smtp_port = int(self.entry_smtp_port.get().strip() or "465")
+            email_addr = form["email"]
+            password = form["password"]
+            imap_host = form["imap_host"]
+            smtp_host = form["smtp_host"]
+            imap_port = int(form["imap_port"] or "993")
+            smtp_port = int(form["smtp_port"] or "465")
 
             if not (email_addr and imap_host and smtp_host):
                 popup.close()
-                messagebox.showerror("Missing fields", "Email, IMAP and SMTP are required.")
+                self.ui.call(messagebox.showerror, "Missing fields", "Email, IMAP and SMTP are required.")
                 return
 
             if not password:
                 stored = keyring.get_password(APP_NAME, email_addr)
                 if stored:
                     password = stored
-                    self.entry_pass.insert(0, stored)
+                    self.ui.call(self.entry_pass.insert, 0, stored)
 
             if not password:
                 popup.close()
-                messagebox.showerror("Missing password", "Enter the app password at least once.")
+                self.ui.call(messagebox.showerror, "Missing password", "Enter the app password at least once.")
                 return
 
-            popup.set(0.2, "Connecting IMAP...")
-            if self.var_ssl.get():
-                self.imap_conn = imaplib.IMAP4_SSL(imap_host, imap_port)
-            else:
-                self.imap_conn = imaplib.IMAP4(imap_host, imap_port)
-            self.imap_conn.login(email_addr, password)
+            with timed("connect_accounts"):
+                popup.set(0.2, "Connecting IMAP...")
+                self.imap_params = (imap_host, imap_port, form["ssl"], email_addr, password)
+                self.imap_conn = connect_imap(*self.imap_params)
+                skipped = self.setup_sync_engine(form["folders"])
 
-            popup.set(0.6, "Connecting SMTP...")
-            if self.var_ssl.get():
-                context = ssl.create_default_context()
-                self.smtp_conn = smtplib.SMTP_SSL(smtp_host, smtp_port, context=context)
-            else:
-                self.smtp_conn = smtplib.SMTP(smtp_host, smtp_port)
-                self.smtp_conn.starttls()
-            self.smtp_conn.login(email_addr, password)
+                popup.set(0.6, "Connecting SMTP...")
+                if self.smtp_pool:
+                    self.smtp_pool.close()
+                smtp_params = (smtp_host, smtp_port, form["ssl"], email_addr, password)
+                self.smtp_pool = SmtpPool(lambda: connect_smtp(*smtp_params))
+                self.smtp_pool.warm_up()
 
             keyring.set_password(APP_NAME, email_addr, password)
 
             popup.set(1.0, "Connected ✓")
             time.sleep(0.4)
             popup.close()
-            self.set_status("Connected.")
-            messagebox.showinfo("Connected", "IMAP and SMTP connected.\nPassword saved securely.")
+            self.set_status("Connected." if not skipped else
+                            f"Connected. No saved password for {', '.join(skipped)}; not syncing them.")
+            self.ui.call(messagebox.showinfo, "Connected", "IMAP and SMTP connected.\nPassword saved securely.")
         except Exception as e:
             popup.close()
             traceback.print_exc()
             self.set_status("Connection failed.")
-            messagebox.showerror("Connection error", str(e))
+            self.ui.call(messagebox.showerror, "Connection error", str(e))
 
     # ------------- FETCH EMAILS -------------
 
-    def fetch_emails(self, limit=20):
+    def fetch_emails(self, lazy: bool, limit=FETCH_LIMIT, chunk_size=FETCH_CHUNK_SIZE, incremental=True,
+                     silent=False, profile=False):
+        # lazy: the "Headers only" setting, read on the Tk thread by the caller.
+        # Returns the newly fetched mails.
+        with self.profile_run("fetch", profile):
+            return self._fetch_emails(lazy, limit, chunk_size, incremental, silent) or []
+
+    def _fetch_emails(self, lazy, limit, chunk_size, incremental, silent):
         if not self.imap_conn:
-            messagebox.showerror("Not connected", "Connect before fetching emails.")
+            self.ui.call(messagebox.showerror, "Not connected", "Connect before fetching emails.")
             return
 
-        popup = LoadingPopup(self.root, "Fetching", "Reading inbox...")
+        popup = NullPopup() if silent else LoadingPopup(self.ui, "Fetching", "Reading inbox...")
         try:
             self.set_status("Fetching emails...")
-            self.imap_conn.select("INBOX")
-            status, data = self.imap_conn.search(None, "ALL")
-            if status != "OK":
-                popup.close()
-                raise RuntimeError("IMAP search failed")
+            folder = "INBOX"
+            account = self.connected_account
+
+            with self.imap_lock:
+                _, uidvalidity = select_folder(self.imap_conn, folder)
+
+                # Incremental only when the loaded list already mirrors this mailbox;
+                # after a restart it is first reloaded from the local store
+                last_uid = None
+                source = (account, folder, uidvalidity)
+                if incremental and self.emails_source != source:
+                    mark = self.sync_state.last_uid(account, folder, uidvalidity)
+                    stored = self.compact(self.store.recent(account, folder, uidvalidity, limit)
+                                          if mark is not None else [])
+                    if stored:
+                        self.emails = stored
+                        self.stats.reset(stored)
+                        self.body_cache.clear()
+                        self.emails_source = source
+                if incremental and self.emails_source == source:
+                    last_uid = self.sync_state.last_uid(account, folder, uidvalidity)
+
+                if last_uid is None:
+                    self.emails = []
+                    self.stats.reset()
+                    self.body_cache.clear()
+                    self.emails_source = source
+
+                stats = FetchStats()
+                added = []
+                top_uid = None
+                for new_mails, top_uid in fetch_pages(
+                        self.imap_conn, account, folder, uidvalidity, last_uid, limit=limit, lazy=lazy,
+                        pipeline=self.parse_pipeline, chunk_size=chunk_size, stats=stats, bodies=self.bodies,
+                        progress=lambda idx, n: popup.set(idx / n * 0.9, f"Fetching {idx}/{n}... "
+                                                                          f"({stats.rate:.1f} msg/s)")):
+                    # Newest first: each page is newer than what is already loaded
+                    self.emails = new_mails + self.emails
+                    self.stats.add(new_mails)
+                    self.store.upsert_many(account, folder, uidvalidity, new_mails)
+                    self.sync_state.update(account, folder, uidvalidity, top_uid)
+                    self.render_list()
+                    added += new_mails
+
+                if top_uid is None:
+                    popup.close()
+                    if last_uid is None:
+                        self.render_list()
+                    self.set_status("No new emails." if last_uid is not None else "No emails found.")
+                    return
 
-            ids = data[0].split()
-            if not ids:
-                popup.close()
-                self.set_status("No emails found.")
-                return
-
-            ids_to_fetch = ids[-limit:]
-            self.emails.clear()
-            self.text_list.configure(state="normal")
-            self.text_list.delete("0.0", "end")
-
-            n = len(ids_to_fetch)
-            for idx, mail_id in enumerate(reversed(ids_to_fetch), start=1):
-                frac = idx / n
-                popup.set(frac * 0.9, f"Fetching {idx}/{n}...")
-                status, msg_data = self.imap_conn.fetch(mail_id, "(RFC822)")
-                if status != "OK":
-                    continue
-                raw = msg_data[0][1]
-                msg = email.message_from_bytes(raw)
-
-                subject = decode_str(msg.get("Subject", ""))
-                from_ = decode_str(msg.get("From", ""))
-                date = decode_str(msg.get("Date", ""))
-                body = extract_body(msg)
-                uid = mail_id.decode() if isinstance(mail_id, bytes) else str(mail_id)
-
-                attach_paths = save_attachments(msg, uid)
-
-                self.emails.append({
-                    "uid": uid,
-                    "subject": subject,
-                    "from": from_,
-                    "date": date,
-                    "body": body,
-                    "category": "Unclassified",
-                    "urgent": False,
-                    "attachments": attach_paths,
-                    "replied": False,
-                })
-
-                self.text_list.insert("end", f"[{idx}] {subject} | {from_}\n")
-
-            self.text_list.configure(state="disabled")
             popup.set(1.0, "Done ✓")
             time.sleep(0.4)
             popup.close()
-            self.set_status(f"Fetched {len(self.emails)} emails.")
-            self.update_dashboard()
+            self.set_status(f"Fetched {len(added)} new emails ({stats.summary()}, "
+                            f"{stats.bytes / 1024:.0f} KB).")
+            return added
         except Exception as e:
             popup.close()
             traceback.print_exc()
             self.set_status("Fetch failed.")
-            messagebox.showerror("Fetch error", str(e))
+            self.ui.call(messagebox.showerror, "Fetch error", str(e))
+
+    def setup_sync_engine(self, folders: list) -> list:
+        # Main account (folders from the Folders field) + extra accounts from
+        # data/accounts.json whose passwords are in the keyring. Returns the
+        # extra accounts skipped for lack of a saved password.
+        if self.sync_engine:
+            self.sync_engine.close()
+        engine = SyncEngine(self.store, self.sync_state, self.parse_pipeline, limit=FETCH_LIMIT)
+        host, port, use_ssl, user, password = self.imap_params
+        engine.add_account(user, lambda: connect_imap(host, port, use_ssl, user, password), folders)
+        skipped = []
+        for acc in load_accounts(ACCOUNTS_PATH):
+            if acc["email"].lower() == user.lower():
+                continue
+            acc_password = keyring.get_password(APP_NAME, acc["email"])
+            if not acc_password:
+                skipped.append(acc["email"])
+                continue
+            engine.add_account(acc["email"], lambda a=acc, p=acc_password: connect_imap(
+                a["imap_host"], a["imap_port"], a["ssl"], a["email"], p), acc["folders"])
+        self.sync_engine = engine
+        return skipped
+
+    def sync_all_mailboxes(self):
+        if not self.sync_engine:
+            self.ui.call(messagebox.showerror, "Not connected", "Connect before syncing.")
+            return
+        sources = self.sync_engine.sources
+        self.set_status(f"Syncing {len(sources)} mailboxes...")
+        try:
+            t0 = time.perf_counter()
+            results = self.sync_engine.sync()
+            elapsed = time.perf_counter() - t0
+
+            # Unified list: the newest FETCH_LIMIT of every mailbox, newest first
+            unified = []
+            for r in results:
+                if r["error"] is None:
+                    unified += self.compact(self.store.recent(r["account"], r["folder"], r["uidvalidity"],
+                                                              FETCH_LIMIT))
+            unified.sort(key=mail_sort_key, reverse=True)
+            self.emails = unified
+            self.stats.reset(unified)
+            self.emails_source = ALL_MAILBOXES
+            self.search_results = None
+            self.render_list()
+
+            new = sum(len(r["new"]) for r in results)
+            failed = [f"{r['account']}/{r['folder']}: {r['error']}" for r in results if r["error"]]
+            slowest = max((r["elapsed"] for r in results), default=0.0)
+            status = (f"Synced {len(results)} mailboxes in {elapsed:.1f}s (slowest {slowest:.1f}s), "
+                      f"{new} new emails.")
+            if failed:
+                status += f" Failed: {'; '.join(failed)}"
+            self.set_status(status)
+        except Exception as e:
+            traceback.print_exc()
+            self.set_status("Sync failed.")
+            self.ui.call(messagebox.showerror, "Sync error", str(e))
+
+    def on_mailbox(self, account: str | None, folder: str | None, uidvalidity: int | None, fn):
+        # Run fn(conn) against the mailbox a message came from (search results may
+        # be from any stored mailbox): the main connection for the connected
+        # account's INBOX, a pooled sync-engine connection for anything else. The
+        # folder is selected first unless the loaded list already has it selected;
+        # if its UIDVALIDITY is no longer `uidvalidity`, the UIDs name other
+        # messages now and fn is not called.
+        def selected(conn, select):
+            if folder is not None and select:
+                _, current = select_folder(conn, folder, readonly=conn is not self.imap_conn)
+                if uidvalidity is not None and current != uidvalidity:
+                    return None
+            return fn(conn)
+
+        if self.imap_conn and (account is None
+                               or (account.lower(), folder) == (self.connected_account.lower(), "INBOX")):
+            with self.imap_lock:
+                loaded, loaded_folder, loaded_uidvalidity = self.emails_source or ALL_MAILBOXES
+                return selected(self.imap_conn, (loaded or "").lower() != (account or "").lower()
+                                or (loaded_folder, loaded_uidvalidity) != (folder, uidvalidity))
+        if self.sync_engine and self.sync_engine.has_account(account):
+            return self.sync_engine.call(account, None, lambda conn: selected(conn, True))
+        raise RuntimeError(f"Mailbox {account}/{folder} is not connected.")
+
+    @staticmethod
+    def by_mailbox(mails) -> dict:
+        # {(account, folder, uidvalidity): [mail, ...]}
+        groups = {}
+        for mail in mails:
+            groups.setdefault((mail.get("account"), mail.get("folder"), mail.get("uidvalidity")), []).append(mail)
+        return groups
+
+    def load_bodies(self, mails: list, chunk_size=FETCH_CHUNK_SIZE) -> dict:
+        # Return {mail_key: body} for `mails`, batch-fetching the ones not in memory
+        bodies = {}
+        missing = []
+        for mail in mails:
+            body = self.loaded_body(mail)
+            if body is None:
+                missing.append(mail)
+            else:
+                bodies[mail_key(mail)] = body
+        if not missing:
+            return bodies
+
+        def fetch(conn, by_uid):
+            for uid, fields in iter_fetch(conn, list(by_uid), "(RFC822)",
+                                          chunk_size=chunk_size, use_uid=True):
+                raw = fields.get("RFC822")
+                if not raw:
+                    continue
+                msg = email.message_from_bytes(raw)
+                body = extract_body(msg)
+                mail = by_uid[uid]
+                if not mail["loaded"]:
+                    mail["attachments"] = save_attachments(
+                        msg, uid, mailbox=(mail.get("account") or self.connected_account,
+                                           mail.get("folder") or "INBOX", mail.get("uidvalidity")))
+                    mail["attachment_count"] = len(mail["attachments"])
+                    mail["loaded"] = True
+                self.body_cache.put(mail_key(mail), body)
+                bodies[mail_key(mail)] = body
+
+        for (account, folder, uidvalidity), group in self.by_mailbox(missing).items():
+            by_uid = {m["uid"]: m for m in group}
+            self.on_mailbox(account, folder, uidvalidity, lambda conn: fetch(conn, by_uid))
+        self.store.update_many([(m.get("store_id"), {"body": bodies[mail_key(m)],
+                                                     "attachment_count": m["attachment_count"]})
+                                for m in missing if mail_key(m) in bodies])
+        return bodies
+
+    def loaded_body(self, mail: dict) -> str | None:
+        # Body without network access (spill file or body cache), None if not downloaded
+        body = mail["body"]  # one read from the spill file
+        return body if body is not None else self.body_cache.get(mail_key(mail))
+
+    def get_body(self, mail: dict) -> str | None:
+        # None when the server returned nothing (message deleted or moved away)
+        return self.load_bodies([mail]).get(mail_key(mail))
+
+    def classification_texts(self, mails: list, max_bytes=CLASSIFY_BYTES) -> dict:
+        # {mail_key: text} for classify_email: the body when it is in memory, otherwise
+        # only a max_bytes prefix of the text part (full download waits for open)
+        texts = {}
+        missing = []
+        for mail in mails:
+            body = self.loaded_body(mail)
+            if body is None:
+                body = mail.get("preview")
+            if body is None:
+                missing.append(mail)
+            else:
+                texts[mail_key(mail)] = body
+        if not missing:
+            return texts
+
+        stats = FetchStats()
+
+        def fetch(conn, by_uid):
+            # Messages reloaded from the store have no BODYSTRUCTURE yet
+            unknown = [uid for uid, m in by_uid.items() if "text_part" not in m]
+            for uid, fields in iter_fetch(conn, unknown, "(BODYSTRUCTURE)", use_uid=True, stats=stats):
+                by_uid[uid]["text_part"] = find_text_part(fields.get("BODYSTRUCTURE"))
+
+            parts = {uid: m.get("text_part") for uid, m in by_uid.items()}
+            for uid, text in iter_text_prefixes(conn, parts, max_bytes, stats=stats):
+                by_uid[uid]["preview"] = text
+                texts[mail_key(by_uid[uid])] = text
+
+        for (account, folder, uidvalidity), group in self.by_mailbox(missing).items():
+            by_uid = {m["uid"]: m for m in group}
+            self.on_mailbox(account, folder, uidvalidity, lambda conn: fetch(conn, by_uid))
+        self.classify_bytes += stats.bytes
+        self.store.save_previews([(m.get("store_id"), m.get("preview")) for m in missing])
+        return texts
+
+    def load_threads(self):
+        # Stored mail joins the thread index, so threads answered in earlier
+        # sessions are known before the first fetch
+        try:
+            if self.threads.add_many(self.store.iter_threading()):
+                self.render_list()
+        except Exception:
+            traceback.print_exc()
+
+    def compact(self, mails: list) -> list:
+        # Store rows -> MailRecords whose text lives in the body spill file
+        return [MailRecord.from_dict(m, self.bodies) for m in mails]
+
+    def visible_emails(self) -> list:
+        return self.search_results if self.search_results is not None else self.emails
+
+    def render_list(self):
+        # Safe from any thread; repeated calls within a frame rebuild the list once
+        self.ui.latest("list", self._render_list)
+
+    def _render_list(self):
+        # Point the list at the current data; only the rows on screen are drawn.
+        # A selection no longer in the list is dropped.
+        self.email_list.set_items(self.visible_emails())
+        if self.email_list.selected is not self.selected_mail:
+            self.selected_mail = self.email_list.selected
+
+    def format_row(self, mail: dict):
+        line = f"{mail['subject']} | {mail['from']}"
+        # Rows not from the loaded mailbox (unified list, search results) say where they are
+        source = self.emails_source or ALL_MAILBOXES
+        if mail.get("account") and (source == ALL_MAILBOXES
+                                    or (mail.get("folder"), mail.get("uidvalidity")) != source[1:]):
+            line = f"({mail['account']}/{mail['folder']}) {line}"
+        if mail["category"] != "Unclassified":
+            tag = " [URGENT]" if mail["urgent"] else ""
+            line += f" | {mail['category']}{tag}"
+        count = self.email_list.view.group_size(mail)
+        if count > 1:
+            line = f"[{count}] {line}"
+        if mail.get("replied"):
+            return "↩ " + line, REPLIED_COLOR
+        return line, URGENT_COLOR if mail["urgent"] else None
+
+    def apply_list_view(self, _choice=None):
+        # "Threads" shows one row per conversation: the first one in the current order
+        key, reverse = LIST_SORTS[self.var_sort.get()]
+        group = self.threads.thread if self.var_threads.get() else None
+        self.email_list.set_view(LIST_FILTERS[self.var_filter.get()], key, reverse, group)
+
+    # ------------- SEARCH -------------
+
+    def search_emails(self, event=None):
+        query = self.entry_search.get().strip()
+        self.selected_mail = None
+        if not query:
+            self.search_results = None
+            self.render_list()
+            self.set_status(f"Showing {len(self.emails)} loaded emails.")
+            return
+
+        # Scope to the loaded mailbox, or to the typed account before the first fetch
+        scope = self.emails_source or (self.entry_email.get().strip() or None, None, None)
+        account, folder, uidvalidity = scope
+        t0 = time.perf_counter()
+        results = self.store.search(query, account, folder, uidvalidity)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+        # Prefer the loaded dicts so replies/classification stay in sync with the list
+        loaded = {m.get("store_id"): m for m in self.emails}
+        self.search_results = [loaded.get(r["store_id"]) or MailRecord(self.bodies, r) for r in results]
+        self.render_list()
+        self.set_status(f"{len(results)} stored emails match '{query}' ({elapsed_ms:.1f} ms).")
 
     # ------------- CLASSIFY -------------
 
-    def classify_all(self):
-        if not self.emails:
-            messagebox.showwarning("No emails", "Fetch emails before classifying.")
+    def classify_mails(self, mails: list) -> list:
+        # (category, urgent) per mail, through the cache; text is fetched only for these
+        texts = self.classification_texts(mails)
+        return self.classify_cache.classify_many((m["subject"], texts.get(mail_key(m), "")) for m in mails)
+
+    def classify_all(self, only_unclassified=False, targets=None):
+        # targets: the mails to classify, all loaded ones by default
+        targets = self.emails if targets is None else targets
+        if only_unclassified:
+            targets = [m for m in targets if m["category"] == "Unclassified"]
+            if not targets:
+                return
+        if not targets:
+            self.ui.call(messagebox.showwarning, "No emails", "Fetch emails before classifying.")
             return
 
         self.set_status("Classifying emails...")
         try:
-            for mail in self.emails:
-                cat, urg = classify_email(mail["subject"], mail["body"])
-                mail["category"] = cat
-                mail["urgent"] = urg
-
-            self.text_list.configure(state="normal")
-            self.text_list.delete("0.0", "end")
-            for idx, mail in enumerate(self.emails, start=1):
-                tag = " [URGENT]" if mail["urgent"] else ""
-                self.text_list.insert(
-                    "end",
-                    f"[{idx}] {mail['subject']} | {mail['from']} | {mail['category']}{tag}\n"
-                )
-            self.text_list.configure(state="disabled")
-
-            self.set_status("Classification complete.")
-            self.update_dashboard()
+            bytes_before = self.classify_bytes
+            hits_before, misses_before = self.classify_cache.hits, self.classify_cache.misses
+            # One message per thread is classified; new mail in a classified
+            # thread takes its category
+            results = self.threads.classify_many(targets, self.classify_mails, reuse=only_unclassified)
+            changed = [(mail, cat, urg) for mail, (cat, urg) in zip(targets, results)
+                       if (mail["category"], bool(mail["urgent"])) != (cat, urg)]
+            for mail, cat, urg in changed:
+                self.stats.update(mail, category=cat, urgent=urg)
+            self.store.update_many([(m.get("store_id"), {"category": cat, "urgent": urg})
+                                    for m, cat, urg in changed])
+            self.classify_count += len(targets)
+
+            # Rows are updated in place; re-filter/sort since categories changed
+            if changed:
+                self.render_list()
+
+            per_msg = (self.classify_bytes - bytes_before) / len(targets)
+            classified = self.classify_cache.misses - misses_before
+            cached = self.classify_cache.hits - hits_before
+            self.set_status(f"Classification complete: {classified} classified, {cached} cached, "
+                            f"{len(targets) - classified - cached} from their thread "
+                            f"({per_msg:.0f} bytes fetched/msg this run, "
+                            f"{self.classify_bytes / max(1, self.classify_count):.0f} avg).")
         except Exception as e:
             traceback.print_exc()
             self.set_status("Classification failed.")
-            messagebox.showerror("Classification error", str(e))
+            self.ui.call(messagebox.showerror, "Classification error", str(e))
 
-    # ------------- LIST CLICK -------------
+    # ------------- LIST SELECTION -------------
 
-    def on_list_click(self, event):
-        index = self.text_list.index(f"@{event.x},{event.y}")
-        try:
-            line = int(str(index).split(".")[0]) - 1
-        except Exception:
-            return
-        if 0 <= line < len(self.emails):
-            self.selected_index = line
-            self.show_email_detail(line)
+    def on_select_mail(self, mail: dict):
+        self.selected_mail = mail
+        self.show_email_detail(mail)
 
-    def show_email_detail(self, idx: int):
-        mail = self.emails[idx]
+    def show_email_detail(self, mail: dict, body: str | None = None):
         self.lbl_subject.configure(text=f"Subject: {mail['subject']}")
         self.lbl_from.configure(text=f"From: {mail['from']}")
         urg = "URGENT" if mail["urgent"] else "Normal"
         self.lbl_meta.configure(
-            text=f"Category: {mail['category']}   |   Urgency: {urg}   |   Attachments: {len(mail['attachments'])}"
+            text=f"Category: {mail['category']}   |   Urgency: {urg}   |   Attachments: {mail['attachment_count']}"
         )
 
+        if body is None:
+            body = self.loaded_body(mail)
+        if body is None:
+            self.run_async(self._load_detail, mail)
+            self.show_body_text("(Loading message...)")
+        else:
+            self.show_body_text(body or "(No text content)")
+
+    def show_body_text(self, text: str):
         self.text_body.configure(state="normal")
         self.text_body.delete("0.0", "end")
-        self.text_body.insert("0.0", mail["body"] or "(No text content)")
+        self.text_body.insert("0.0", text)
         self.text_body.configure(state="disabled")
 
+    def _load_detail(self, mail: dict):
+        def show(body):
+            # On the Tk thread; the user may have selected another message meanwhile
+            if self.selected_mail is not mail:
+                return
+            if body is None:
+                # Not retried until the message is selected again
+                self.show_body_text("(Message unavailable)")
+                self.set_status("The message is no longer on the server.")
+            else:
+                self.show_email_detail(mail, body)  # not re-read: the body cache may have evicted it
+
+        try:
+            self.ui.call(show, self.get_body(mail))
+        except Exception as e:
+            traceback.print_exc()
+            self.set_status(f"Loading message failed: {e}")
+
     # ------------- AUTO REPLY -------------
 
-    def auto_reply_selected(self, mode="manual"):
-        if not self.smtp_conn:
-            messagebox.showerror("Not connected", "Connect before sending replies.")
-            return
-        if self.selected_index is None:
-            messagebox.showwarning("No selection", "Click an email from the list first.")
-            return
+    def reply_key(self, mail: dict) -> str:
+        account = mail.get("account") or self.connected_account
+        return reply_key(mail, account, mail.get("folder") or "INBOX", mail.get("uidvalidity"))
 
-        mail = self.emails[self.selected_index]
-        sender_raw = mail["from"]
-        if "<" in sender_raw and ">" in sender_raw:
-            addr = sender_raw.split("<")[-1].split(">")[0].strip()
-            name = sender_raw.split("<")[0].strip().strip('"')
-        else:
-            addr = sender_raw.strip()
-            name = None
+    def mark_replied(self, mail: dict, mode: str):
+        self.stats.update(mail, replied=True)
+        self.threads.mark_replied(mail)
+        self.store.update(mail, replied=True, category=mail["category"], urgent=mail["urgent"])
+        log_reply(mail, mode=mode)
+        self.history.record(mail)
+
+    def auto_reply_selected(self, mode="manual", profile=False):
+        with self.profile_run("reply", profile):
+            self._auto_reply_selected(mode)
 
-        if not addr or "@" not in addr:
-            messagebox.showerror("Invalid sender", f"Cannot parse email from: {sender_raw}")
+    def _auto_reply_selected(self, mode):
+        if not self.smtp_pool:
+            self.ui.call(messagebox.showerror, "Not connected", "Connect before sending replies.")
+            return
+        mail = self.selected_mail
+        if mail is None:
+            self.ui.call(messagebox.showwarning, "No selection", "Click an email from the list first.")
             return
 
         if mail["category"] == "Unclassified":
-            cat, urg = classify_email(mail["subject"], mail["body"])
-            mail["category"] = cat
-            mail["urgent"] = urg
+            [(cat, urg)] = self.threads.classify_many([mail], self.classify_mails)
+            self.stats.update(mail, category=cat, urgent=urg)
 
         category = mail["category"]
-        reply_body = build_reply(category, name)
-        from_addr = self.entry_email.get().strip()
+        from_addr = self.connected_account
         if not from_addr:
-            messagebox.showerror("Missing from address", "Your email address is missing.")
+            self.ui.call(messagebox.showerror, "Missing from address", "Your email address is missing.")
             return
-
-        popup = LoadingPopup(self.root, "Sending reply", "Preparing message...")
         try:
-            msg = MIMEText(reply_body)
-            msg["Subject"] = f"Re: {mail['subject'] or ''}"
-            msg["From"] = from_addr
-            msg["To"] = addr
+            msg, addr = build_reply_message(mail, from_addr)
+        except ValueError as e:
+            self.ui.call(messagebox.showerror, "Invalid sender", str(e))
+            return
+        self.report_template_errors()
+
+        key = self.reply_key(mail)
+        if not self.ledger.claim(key, addr):
+            if not mail.get("replied"):
+                self.stats.update(mail, replied=True)
+                self.store.update(mail, replied=True)
+                self.threads.mark_replied(mail)
+            self.ui.call(messagebox.showinfo, "Already replied",
+                         f"A reply to this message was already sent to {addr}.")
+            return
 
+        popup = LoadingPopup(self.ui, "Sending reply", "Preparing message...")
+        try:
             popup.set(0.5, "Sending...")
-            self.smtp_conn.send_message(msg)
+            try:
+                latency = self.smtp_pool.send_message(msg)
+            except Exception as e:
+                self.ledger.mark_error(key, e)
+                raise
+            self.ledger.mark_sent(key)
 
-            mail["replied"] = True
-            self.log_reply(mail, mode=mode)
-            self.update_dashboard()
+            self.mark_replied(mail, mode)
+            self.ui.call(self.email_list.update_item, mail)
 
             popup.set(1.0, "Sent ✓")
             time.sleep(0.4)
             popup.close()
-            self.set_status(f"Reply sent to {addr}")
-            messagebox.showinfo("Sent", f"Auto reply sent to {addr}\nCategory: {category}")
+            stats = self.smtp_pool.stats()
+            self.set_status(f"Reply sent to {addr} in {latency * 1000:.0f} ms "
+                            f"(SMTP reconnects: {stats['reconnects']})")
+            self.ui.call(messagebox.showinfo, "Sent", f"Auto reply sent to {addr}\nCategory: {category}")
         except Exception as e:
             popup.close()
             traceback.print_exc()
             self.set_status("Reply failed.")
-            messagebox.showerror("Reply error", str(e))
+            self.ui.call(messagebox.showerror, "Reply error", str(e))
+
+    def toggle_bulk_reply(self):
+        if self.reply_job and not self.reply_job.done:
+            self.reply_job.cancel()
+            self.set_status("Stopping bulk reply...")
+            return
+        self.start_bulk_reply()
+
+    def start_bulk_reply(self):
+        # Reply to every classified, unreplied message in the loaded list
+        if not self.smtp_pool:
+            self.ui.call(messagebox.showerror, "Not connected", "Connect before sending replies.")
+            return
+        from_addr = self.connected_account
+        if not from_addr:
+            self.ui.call(messagebox.showerror, "Missing from address", "Your email address is missing.")
+            return
+
+        candidates = [m for m in self.emails if not m.get("replied") and m["category"] != "Unclassified"]
+        keys = {mail_key(m): self.reply_key(m) for m in candidates}
+        already = self.ledger.replied(keys.values())
+        to_send = []
+        for mail in candidates:
+            if keys[mail_key(mail)] in already:
+                # Replied in an earlier session (or before a re-fetch)
+                self.stats.update(mail, replied=True)
+                self.store.update(mail, replied=True)
+                self.threads.mark_replied(mail)
+                continue
+            to_send.append(mail)
+        # One reply per conversation, none to conversations already answered
+        to_send = self.threads.reply_targets(to_send)
+        items = [(keys[mail_key(mail)], addr, msg, mail)
+                 for mail, msg, addr in build_reply_messages(to_send, from_addr)]
+        self.report_template_errors()
+
+        if not items:
+            self.render_list()
+            self.set_status("Bulk reply: nothing to send (classify first; replied messages and answered threads "
+                            "are skipped).")
+            return
+
+        self.reply_job = ReplyJob(self.smtp_pool.send_message, self.ledger, items,
+                                  on_sent=lambda mail: self.mark_replied(mail, "bulk"))
+        self.reply_job.start()
+        self.btn_bulk_reply.configure(text="Stop auto-reply")
+        self.watch_bulk_reply()
+
+    def watch_bulk_reply(self):
+        # Polled from the Tk loop so the UI stays responsive while the job runs
+        job = self.reply_job
+        self.set_status(job.summary())
+        if not job.done:
+            self.email_list.refresh()  # replied markers on the rows in view
+            self.root.after(500, self.watch_bulk_reply)
+            return
+        self.btn_bulk_reply.configure(text="Auto-reply all")
+        self.email_list.refresh(rebuild=True)
+        if job.errors:
+            recipient, error = job.errors[-1]
+            self.set_status(f"{job.summary()} - last error ({recipient}): {error}")
 
     # ------------- LOGGING -------------
 
-    def log_reply(self, mail: dict, mode: str = "manual"):
-        ensure_log_csv()
-        with open(LOG_CSV_PATH, "a", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow([
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                mail.get("from", ""),
-                mail.get("subject", ""),
-                mail.get("category", ""),
-                "1" if mail.get("urgent") else "0",
-                len(mail.get("attachments", [])),
-                mode,
-            ])
-
-    def generate_pdf_log(self):
+    def generate_pdf_log(self, report_range: str):
         try:
-            pdf_path = os.path.join(LOG_DIR, "email_log_summary.pdf")
-            generate_pdf_log_summary(LOG_CSV_PATH, pdf_path)
-            self.set_status(f"PDF log created: {pdf_path}")
-            messagebox.showinfo("PDF created", f"Summary saved to:\n{pdf_path}")
+            pdf_path = LOG_PDF_PATH
+            t0 = time.perf_counter()
+            report = generate_pdf_log_summary(LOG_CSV_PATH, pdf_path, report_range)
+            self.set_status(f"PDF log created: {pdf_path} ({len(report['sections'])} periods, "
+                            f"{report['bytes_read'] / 1024:.0f} KB of log read, "
+                            f"{time.perf_counter() - t0:.1f}s)")
+            self.ui.call(messagebox.showinfo, "PDF created", f"Summary saved to:\n{pdf_path}")
         except Exception as e:
             traceback.print_exc()
-            messagebox.showerror("PDF error", str(e))
+            self.ui.call(messagebox.showerror, "PDF error", str(e))
 
     # ------------- DASHBOARD -------------
 
     def update_dashboard(self):
-        total = len(self.emails)
-        replied = sum(1 for m in self.emails if m.get("replied"))
-        urgent = sum(1 for m in self.emails if m.get("urgent"))
-
-        cats = {c: 0 for c in CATEGORIES}
-        for m in self.emails:
-            c = m.get("category", "Other")
-            if c not in cats:
-                cats[c] = 0
-            cats[c] += 1
+        # Subscribed to self.stats and self.history; drawn at most once per frame
+        self.ui.latest("dashboard", self._draw_dashboard)
 
-        self.lbl_total.configure(text=f"Total loaded: {total}")
-        self.lbl_replied.configure(text=f"Total replied: {replied}")
-        self.lbl_urgent.configure(text=f"Urgent emails: {urgent}")
+    def _draw_dashboard(self):
+        # Reads the running counters; nothing here walks the email list or the log
+        snap = self.stats.snapshot()
+        self.lbl_total.configure(text=f"Total loaded: {snap['total']}")
+        self.lbl_replied.configure(text=f"Total replied: {snap['replied']}")
+        self.lbl_urgent.configure(text=f"Urgent emails: {snap['urgent']}")
 
         lines = ["By category:"]
         for c in CATEGORIES:
-            lines.append(f"- {c}: {cats.get(c, 0)}")
+            lines.append(f"- {c}: {snap['categories'].get(c, 0)}")
         self.lbl_cat_stats.configure(text="\n".join(lines))
 
+        alltime = self.history.totals()
+        today = self.history.totals(since=time.strftime("%Y-%m-%d"))
+        self.lbl_history.configure(text=(
+            f"All time: {alltime['replied']} replied, {alltime['urgent']} urgent\n"
+            f"Today: {today['replied']} replied\n"
+            f"Avg reply latency: {format_duration(alltime['avg_latency'])}"))
+
     # ------------- AUTO-CHECK -------------
 
     def toggle_auto_check(self):
@@ -755,17 +1215,17 @@ class EmailAssistantPro:
     def schedule_auto_check(self):
         if not self.auto_check_enabled:
             return
-        # schedule next run
-        self.root.after(self.auto_check_interval_min * 60 * 1000,
-                        lambda: self.run_async(self.auto_check_cycle))
+        # schedule next run; the callback runs on the Tk thread and reads the settings there
+        self.ui.call(self.root.after, self.auto_check_interval_min * 60 * 1000,
+                     lambda: self.run_async(self.auto_check_cycle, self.var_lazy.get()))
 
-    def auto_check_cycle(self):
+    def auto_check_cycle(self, lazy: bool):
         if not self.auto_check_enabled:
             return
         try:
             # Silent fetch + classify (no popups, just status)
             self.set_status("Auto-check: fetching + classifying...")
-            self.fetch_emails(limit=10)
+            self.fetch_emails(lazy, limit=10, silent=True)
             self.classify_all()
             self.set_status("Auto-check done.")
         except Exception:
@@ -774,13 +1234,68 @@ class EmailAssistantPro:
             # schedule next
             self.schedule_auto_check()
 
+    # ------------- PUSH (IMAP IDLE) -------------
+
+    def toggle_push(self):
+        if not self.var_push.get():
+            if self.idle_watcher:
+                self.idle_watcher.stop()
+                self.idle_watcher = None
+            self.set_status("Push mode disabled.")
+            return
+
+        if not (self.imap_conn and self.imap_params):
+            self.var_push.set(False)
+            self.ui.call(messagebox.showerror, "Not connected", "Connect before enabling push mode.")
+            return
+
+        try:
+            poll_min = max(1, int(self.entry_interval.get().strip() or "5"))
+        except ValueError:
+            poll_min = 5
+        params = self.imap_params
+        lazy = self.var_lazy.get()  # push fetches use the setting from when push was switched on
+        self.idle_watcher = IdleWatcher(lambda: connect_imap(*params), lambda: self.push_cycle(lazy),
+                                        on_status=self.set_status, poll_sec=poll_min * 60)
+        self.idle_watcher.start()
+
+    def push_cycle(self, lazy: bool):
+        # Runs on the watcher thread when the server reports new mail
+        t0 = time.perf_counter()
+        new = self.fetch_emails(lazy, silent=True)
+        if new:
+            # Full fetches were classified by the rules while parsing: with a trained
+            # model loaded all new mail is classified again (as the daemon does),
+            # otherwise only leftovers, which take their thread's category
+            self.classify_all(only_unclassified=not self.model_loaded, targets=new)
+            self.set_status(f"Push: {len(new)} new emails classified "
+                            f"{time.perf_counter() - t0:.1f}s after notification.")
+
 
 # ----------------- RUN -----------------
 
 def main():
     root = ctk.CTk()
     app = EmailAssistantPro(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        app.ui.close()
+        if app.idle_watcher:
+            app.idle_watcher.stop()
+        if app.reply_job:
+            app.reply_job.cancel()
+        if app.smtp_pool:
+            app.smtp_pool.close()
+        if app.sync_engine:
+            app.sync_engine.close()
+        app.parse_pipeline.shutdown()
+        flush_logs()
+        app.metrics_exporter.stop()
+        app.store.close()
+        app.ledger.close()
+        app.classify_cache.close()
+        app.bodies.close()
 
 
 if __name__ == "__main__":
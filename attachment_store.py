@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import binascii
+
+# ----------------- CONSTANTS -----------------
+
+DECODE_CHUNK = 64 * 1024  # encoded characters decoded per step
+
+_WS_RE = re.compile(r"[^A-Za-z0-9+/=]")
+
+
+# ----------------- STREAMING DECODE -----------------
+
+def _encode_raw(text: str) -> bytes:
+    # Same fallback email.message uses for undecoded payloads
+    try:
+        return text.encode("ascii", "surrogateescape")
+    except UnicodeError:
+        return text.encode("raw-unicode-escape")
+
+
+def _encoded_payload(part):
+    # The part's body as parsed, still transfer-encoded. This is Message._payload,
+    # which get_payload() reads too. The public call is not used because, for a
+    # str payload, get_payload() first encodes all of it once to look for
+    # surrogates (a full copy of every attachment), and when it finds them
+    # (8bit bodies) it returns the text re-decoded with "replace", so raw bytes
+    # are lost. _payload has held the body of every email.message.Message
+    # (EmailMessage included) since Python 3.0; should that change, this
+    # returns None and iter_decoded falls back to get_payload(decode=True).
+    return getattr(part, "_payload", None)
+
+
+def iter_decoded(part, chunk: int = DECODE_CHUNK):
+    # Yield the decoded payload of a MIME part in chunks, never materializing the
+    # whole decoded attachment (unlike part.get_payload(decode=True))
+    payload = _encoded_payload(part)
+    if not isinstance(payload, str) or part.is_multipart():
+        data = part.get_payload(decode=True)
+        if data:
+            yield data
+        return
+
+    cte = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+    if cte == "base64":
+        carry = ""
+        for i in range(0, len(payload), chunk):
+            piece = carry + _WS_RE.sub("", payload[i:i + chunk])
+            cut = len(piece) - len(piece) % 4
+            carry = piece[cut:]
+            if cut:
+                try:
+                    yield binascii.a2b_base64(piece[:cut])
+                except binascii.Error:
+                    return
+        if carry.strip("="):
+            try:
+                yield binascii.a2b_base64(carry + "=" * (-len(carry) % 4))
+            except binascii.Error:
+                pass
+    elif cte == "quoted-printable":
+        i = 0
+        while i < len(payload):
+            end = payload.rfind("\n", i, i + chunk)
+            end = len(payload) if end == -1 or i + chunk >= len(payload) else end + 1
+            yield binascii.a2b_qp(_encode_raw(payload[i:end]))
+            i = end
+    elif cte in ("x-uuencode", "uuencode", "uue", "x-uue"):
+        data = part.get_payload(decode=True)
+        if data:
+            yield data
+    else:
+        for i in range(0, len(payload), chunk):
+            yield _encode_raw(payload[i:i + chunk])
+
+
+# ----------------- CONTENT-ADDRESSED STORE -----------------
+
+def safe_filename(name: str, fallback: str) -> str:
+    name = os.path.basename((name or "").replace("\\", "/")).strip().strip(".")
+    name = re.sub(r'[<>:"|?*\x00-\x1f]', "_", name)
+    return name or fallback
+
+
+def mailbox_key(account: str | None, folder: str | None, uidvalidity: int | None) -> str:
+    # Short id of a mailbox for file names: UIDs are only unique within one
+    return hashlib.sha1(json.dumps([(account or "").lower(), folder or "", uidvalidity or 0])
+                        .encode()).hexdigest()[:12]
+
+
+class AttachmentStore:
+    # blobs/<aa>/<sha256>              - each distinct attachment content, stored once
+    # manifests/email_<uid>-<key>.json - filename -> blob mapping for one message;
+    #                                    <key> is mailbox_key() of its mailbox
+
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.manifest_dir = os.path.join(root, "manifests")
+        self.writes = 0  # blob files written by this instance (0 on re-fetches)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def manifest_path(self, uid: str, mailbox: tuple | None = None) -> str:
+        # mailbox: (account, folder, uidvalidity); None for a message outside any
+        # mailbox (no key in the name)
+        name = safe_filename(str(uid), "unknown")
+        if mailbox is not None:
+            name += "-" + mailbox_key(*mailbox)
+        return os.path.join(self.manifest_dir, f"email_{name}.json")
+
+    def load_manifest(self, uid: str, mailbox: tuple | None = None) -> dict | None:
+        try:
+            with open(self.manifest_path(uid, mailbox), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _fingerprint(parts) -> list:
+        # Cheap identity of a message's attachments (names + encoded sizes), so a
+        # reused UID is not served a stale manifest
+        return [[filename or "", len(str(_encoded_payload(part) or ""))] for filename, part in parts]
+
+    def _store_part(self, part) -> tuple[str, int]:
+        # One decoding pass, hashed while it is written to a temp file in the
+        # blob directory; the temp file becomes the blob, or is dropped when a
+        # blob with that hash is already stored
+        os.makedirs(self.blob_dir, exist_ok=True)
+        tmp = os.path.join(self.blob_dir, f"{uuid.uuid4().hex}.tmp")
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for data in iter_decoded(part):
+                    h.update(data)
+                    size += len(data)
+                    f.write(data)
+            digest = h.hexdigest()
+            path = self.blob_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+                self.writes += 1
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return digest, size
+
+    def save_message(self, uid: str, parts, mailbox: tuple | None = None) -> list[dict]:
+        # parts: [(filename, MIME part)]; mailbox: (account, folder, uidvalidity)
+        # the UID belongs to. Returns manifest entries with blob paths. A message
+        # whose manifest and blobs already exist is not touched at all.
+        parts = list(parts)
+        fingerprint = self._fingerprint(parts)
+        existing = self.load_manifest(uid, mailbox)
+        if (existing and existing.get("fingerprint") == fingerprint
+                and all(os.path.exists(e["path"]) for e in existing.get("files", []))):
+            return existing["files"]
+
+        entries = []
+        seen = set()
+        for n, (filename, part) in enumerate(parts, start=1):
+            name = safe_filename(filename, f"file_{n}.bin")
+            base, ext = os.path.splitext(name)
+            k = 2
+            while name.lower() in seen:
+                name = f"{base} ({k}){ext}"
+                k += 1
+            seen.add(name.lower())
+            try:
+                digest, size = self._store_part(part)
+            except OSError:
+                continue
+            entries.append({
+                "filename": name,
+                "sha256": digest,
+                "size": size,
+                "content_type": part.get_content_type(),
+                "path": self.blob_path(digest),
+            })
+
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = self.manifest_path(uid, mailbox)
+        tmp = path + ".tmp"
+        manifest = {"uid": str(uid), "fingerprint": fingerprint, "files": entries}
+        if mailbox is not None:
+            manifest["account"], manifest["folder"], manifest["uidvalidity"] = mailbox
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+        return entries
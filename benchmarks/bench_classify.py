@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import CATEGORY_RULES, URGENT_KEYWORDS, classify_email, classify_many, default_matcher  # noqa: E402
+
+
+# ----------------- LEGACY CLASSIFIER (pre-matcher, for comparison) -----------------
+
+def legacy_classify_email(subject: str, body: str):
+    text = (subject or "") + " " + (body or "")
+    text = text.lower()
+
+    billing = ["invoice", "payment", "bill", "billing", "due", "overdue"]
+    order = ["order", "shipment", "tracking", "delivery", "purchase"]
+    support = ["issue", "error", "bug", "problem", "support", "help", "not working", "failed"]
+    lead = ["quote", "pricing", "project", "proposal", "hire", "collaboration", "work with you", "service"]
+    urgent = ["urgent", "asap", "immediately", "critical", "important"]
+
+    if any(k in text for k in billing):
+        category = "Billing / Payment"
+    elif any(k in text for k in order):
+        category = "Order / Purchase"
+    elif any(k in text for k in support):
+        category = "Support Request"
+    elif any(k in text for k in lead):
+        category = "Client Lead"
+    else:
+        category = "Other"
+
+    is_urgent = any(k in text for k in urgent)
+    return category, is_urgent
+
+
+# ----------------- SYNTHETIC CORPUS -----------------
+
+FILLER = ("thanks for the update we will produce the report and schedule a meeting next week "
+          "the team reviewed everything and the numbers look fine please let me know "
+          "regarding our previous conversation subscribers borderline issuer reorder helpdesk").split()
+# The same words without those that hold a keyword inside them (produce, issuer, ...)
+TRAPS = {"produce", "subscribers", "borderline", "issuer", "reorder", "helpdesk"}
+PLAIN_FILLER = [w for w in FILLER if w not in TRAPS]
+
+
+def make_corpus(n: int, body_words: int = 200, seed: int = 7, filler=FILLER):
+    rng = random.Random(seed)
+    keywords = [kw for _, kws in CATEGORY_RULES for kw in kws] + URGENT_KEYWORDS
+    corpus = []
+    for _ in range(n):
+        words = [rng.choice(filler) for _ in range(body_words)]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        subject = " ".join(rng.choice(filler + keywords) for _ in range(rng.randint(2, 7)))
+        corpus.append((subject.capitalize(), " ".join(words)))
+    return corpus
+
+
+# ----------------- RUN -----------------
+
+def bench(func, corpus, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(corpus)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Classifier cost and behavior vs. the legacy substring rules")
+    p.add_argument("-n", type=int, default=10000, help="messages in the synthetic corpus")
+    p.add_argument("--words", type=int, default=200, help="body words per message")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--show", type=int, default=5, help="example differences to print")
+    args = p.parse_args(argv)
+
+    corpus = make_corpus(args.n, args.words)
+
+    # Timed on the trap corpus (words like "issuer" make the matcher run its
+    # regex after a substring hit) and on one without those words. "matcher" is
+    # KeywordMatcher.classify alone, without the metrics timing of the others.
+    matcher = default_matcher()
+    for label, timed in (("with trap words", corpus),
+                         ("plain", make_corpus(args.n, args.words, filler=PLAIN_FILLER))):
+        t_legacy = bench(lambda c: [legacy_classify_email(s, b) for s, b in c], timed, args.repeat)
+        t_matcher = bench(lambda c: [matcher.classify(s, b) for s, b in c], timed, args.repeat)
+        t_single = bench(lambda c: [classify_email(s, b) for s, b in c], timed, args.repeat)
+        t_batch = bench(classify_many, timed, args.repeat)
+        print(f"corpus ({label}): {args.n} messages x ~{args.words} words")
+        for name, t in (("legacy", t_legacy), ("matcher", t_matcher), ("classify_email", t_single),
+                        ("classify_many", t_batch)):
+            print(f"  {name:15s} {t * 1e6 / args.n:8.2f} us/msg  ({args.n / t:,.0f} msg/s)")
+
+    old = [legacy_classify_email(s, b) for s, b in corpus]
+    new = classify_many(corpus)
+    diffs = [(i, o, n) for i, (o, n) in enumerate(zip(old, new)) if o != n]
+    print(f"behavioral diff: {len(diffs)}/{args.n} messages changed "
+          f"({100 * len(diffs) / max(1, args.n):.1f}%)")
+    transitions = Counter((o[0], n[0]) for _, o, n in diffs if o[0] != n[0])
+    for (o, n), count in transitions.most_common():
+        print(f"  {o} -> {n}: {count}")
+    urgent_changes = sum(1 for _, o, n in diffs if o[1] != n[1])
+    print(f"  urgency flag changed: {urgent_changes}")
+    for i, o, n in diffs[:args.show]:
+        print(f"  e.g. #{i} {o} -> {n}: {corpus[i][0]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import gc
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_parse import make_raw_messages  # noqa: E402
+from mail_record import BodyStore, MailRecord  # noqa: E402
+from mailparse import parse_record  # noqa: E402
+
+# Memory held by N loaded messages: plain dicts (full body in memory) vs.
+# MailRecords with text in the BodyStore spill file. Each layout is measured
+# in a fresh process so resident sizes do not mix.
+
+
+def rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def measure(layout: str, n: int, body_words: int) -> dict:
+    raws = make_raw_messages(n, body_words=body_words)
+    with tempfile.TemporaryDirectory() as tmp:
+        bodies = BodyStore(tmp)
+        raw_bytes = sum(len(r) for _, r in raws)
+        gc.collect()
+        rss0 = rss_bytes()
+        tracemalloc.start()
+        mails = []
+        for uid, raw in raws:
+            mail = dict(parse_record(uid, raw, attach_dir=tmp), loaded=True, replied=False)
+            mail.update(account="me@example.com", folder="INBOX", uidvalidity=1)
+            mails.append(MailRecord.from_dict(mail, bodies) if layout == "records" else mail)
+            raw = mail = None
+        raws = None
+        gc.collect()
+        heap, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss1 = rss_bytes()
+        spill = bodies.size
+        bodies.close()
+    return {"layout": layout, "n": len(mails), "raw": raw_bytes, "heap": heap, "spill": spill,
+            "rss": None if rss0 is None or rss1 is None else rss1 - rss0}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Memory per loaded message: dicts vs compact records")
+    p.add_argument("-n", type=int, default=10_000, help="messages to load")
+    p.add_argument("--body-words", type=int, default=400, help="words per message body")
+    p.add_argument("--layout", choices=("dicts", "records"), help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.layout:
+        print(json.dumps(measure(args.layout, args.n, args.body_words)))
+        return
+
+    per = 10_000 / args.n
+    print(f"{args.n} messages, {args.body_words} body words each; figures per 10k messages")
+    for layout in ("dicts", "records"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--layout", layout,
+                              "-n", str(args.n), "--body-words", str(args.body_words)],
+                             capture_output=True, text=True, check=True).stdout
+        r = json.loads(out)
+        rss = f"{r['rss'] * per / 1e6:7.1f} MB" if r["rss"] is not None else "    n/a"
+        print(f"  {layout:8s} python heap {r['heap'] * per / 1e6:7.1f} MB   resident +{rss}   "
+              f"spill file {r['spill'] * per / 1e6:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailparse import ParsePipeline  # noqa: E402
+
+WORDS = ("invoice order shipment help error quote project urgent please thanks team report "
+         "meeting schedule numbers update review customer account issue").split()
+
+
+def make_raw_messages(n: int, body_words: int = 400, attach_every: int = 10, seed: int = 3):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        body = " ".join(rng.choice(WORDS) for _ in range(body_words))
+        if attach_every and i % attach_every == 0:
+            msg = MIMEMultipart()
+            msg.attach(MIMEText(body))
+            part = MIMEApplication(rng.randbytes(8 * 1024), Name=f"doc{i}.bin")
+            part["Content-Disposition"] = f'attachment; filename="doc{i}.bin"'
+            msg.attach(part)
+        else:
+            msg = MIMEText(body)
+        msg["Subject"] = " ".join(rng.choice(WORDS) for _ in range(5))
+        msg["From"] = f"Customer {i} <c{i}@example.com>"
+        msg["Date"] = "Mon, 01 Jan 2024 10:00:00 +0000"
+        out.append((str(i + 1), msg.as_bytes()))
+    return out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Parse+classify throughput vs. process pool size")
+    p.add_argument("-n", type=int, default=5000, help="messages to parse")
+    p.add_argument("--workers", type=int, nargs="+",
+                   default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = p.parse_args(argv)
+
+    raws = make_raw_messages(args.n)
+    mb = sum(len(r) for _, r in raws) / 1e6
+    print(f"{args.n} messages, {mb:.1f} MB raw, {os.cpu_count()} CPUs")
+
+    base = None
+    with tempfile.TemporaryDirectory() as attach_dir:
+        for workers in args.workers:
+            pipeline = ParsePipeline(workers, min_batch=0, attach_dir=attach_dir)
+            try:
+                list(pipeline.imap(raws[:workers * 8]))  # warm up worker processes
+                t0 = time.perf_counter()
+                records = list(pipeline.imap(iter(raws), expected=len(raws)))
+                elapsed = time.perf_counter() - t0
+            finally:
+                pipeline.shutdown()
+            assert [r["uid"] for r in records] == [u for u, _ in raws], "out-of-order delivery"
+            base = base or elapsed
+            print(f"  workers={workers:2d}  {elapsed:6.2f}s  {args.n / elapsed:8.0f} msg/s  "
+                  f"speedup x{base / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
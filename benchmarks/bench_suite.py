@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import email
+import shutil
+import smtplib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import classify_email  # noqa: E402
+from fake_servers import FakeImapServer, FakeSmtpServer, Mailbox  # noqa: E402
+from imap_fetch import (  # noqa: E402
+    CLASSIFY_BYTES, FETCH_CHUNK_SIZE, iter_fetch, iter_text_prefixes, select_folder,
+)
+from imap_idle import connect_imap  # noqa: E402
+from mailgen import MailboxSpec, generate  # noqa: E402
+from mailparse import (  # noqa: E402
+    PARSE_WORKERS, ParsePipeline, decode_str, extract_body, parse_record, save_attachments,
+)
+from reply_jobs import ReplyJob, SentLedger  # noqa: E402
+from reply_templates import build_reply_message  # noqa: E402
+from smtp_pool import SmtpPool  # noqa: E402
+from sync_engine import fetch_new  # noqa: E402
+
+# End-to-end benchmark suite, fully offline: a synthetic mailbox is served by
+# local stand-in IMAP/SMTP servers (fake_servers.py) and the engine's fetch,
+# parse, classify, attachment and reply paths are driven headlessly. Each
+# stage reports msg/s, p50/p99 latency, bytes transferred and peak traced
+# memory; results are written as JSON and can be compared with an earlier run:
+#
+#   python benchmarks/bench_suite.py -n 2000 --latency-ms 20
+#   python benchmarks/bench_suite.py --compare benchmarks/results/<earlier>.json
+
+USER, PASSWORD = "bench@example.com", "secret"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+# ----------------- MEASUREMENT -----------------
+
+def percentile(samples: list, p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+class Stage:
+    # Times one stage: `latencies` holds per-unit seconds (unit = message,
+    # FETCH command or send, see `unit`), server byte counters are diffed
+    def __init__(self, name: str, unit: str, servers=(), trace_memory: bool = True):
+        self.name = name
+        self.unit = unit
+        self.servers = servers
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.messages = 0
+        self.bytes_processed = 0  # input handled locally (parse stages)
+
+    def __enter__(self):
+        self._net0 = [s.counters() for s in self.servers]
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._mem0 = tracemalloc.get_traced_memory()[0]
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._t0
+        self.peak = tracemalloc.get_traced_memory()[1] - self._mem0 if self.trace_memory else None
+        net = [s.counters() for s in self.servers]
+        self.bytes_in = sum(b["bytes_in"] - a["bytes_in"] for a, b in zip(self._net0, net))
+        self.bytes_out = sum(b["bytes_out"] - a["bytes_out"] for a, b in zip(self._net0, net))
+        self.commands = sum(b["commands"] - a["commands"] for a, b in zip(self._net0, net))
+        return False
+
+    def result(self) -> dict:
+        return {
+            "stage": self.name,
+            "messages": self.messages,
+            "elapsed_s": self.elapsed,
+            "msg_per_s": self.messages / self.elapsed if self.elapsed else 0.0,
+            "latency_unit": self.unit,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+            "bytes_sent": self.bytes_in,  # client -> server
+            "bytes_received": self.bytes_out,  # server -> client
+            "server_commands": self.commands,
+            "bytes_processed": self.bytes_processed,
+            "peak_mem_bytes": self.peak,
+        }
+
+
+# ----------------- STAGES -----------------
+
+def run_suite(args) -> dict:
+    spec = MailboxSpec(count=args.n, attach_ratio=args.attach_ratio, seed=args.seed)
+    t0 = time.perf_counter()
+    raws = generate(spec)
+    gen_s = time.perf_counter() - t0
+
+    latency = args.latency_ms / 1000
+    imap_srv = FakeImapServer({"INBOX": Mailbox(raws)}, latency=latency).start()
+    smtp_srv = FakeSmtpServer(latency=latency).start()
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    trace = not args.no_memory
+    if trace:
+        tracemalloc.start()
+    results = []
+
+    def stage(name, unit, servers=()):
+        return Stage(name, unit, servers, trace)
+
+    try:
+        conn = connect_imap("127.0.0.1", imap_srv.port, False, USER, PASSWORD)
+        _, uidvalidity = select_folder(conn, "INBOX")
+
+        # Raw batched FETCH (network + imaplib + response parser)
+        uids = [str(i) for i in range(len(raws), 0, -1)]
+        with stage("imap_fetch_rfc822", "FETCH command", [imap_srv]) as st:
+            t = time.perf_counter()
+            fetched = {}
+            for i, (uid, fields) in enumerate(iter_fetch(conn, uids, "(RFC822)", chunk_size=args.chunk,
+                                                         use_uid=True), start=1):
+                fetched[uid] = fields["RFC822"]
+                if i % args.chunk == 0 or i == len(uids):
+                    st.latencies.append(time.perf_counter() - t)
+                    t = time.perf_counter()
+            st.messages = len(fetched)
+        results.append(st.result())
+        fetched_raws = [(uid, fetched[uid]) for uid in uids if uid in fetched]
+        del fetched
+
+        # Headers-only list fetch + partial text for classification
+        with stage("fetch_headers", "message", [imap_srv]) as st:
+            t = time.perf_counter()
+            marks = []
+            mails, _ = fetch_new(conn, USER, "INBOX", uidvalidity, None, limit=len(raws), lazy=True,
+                                 chunk_size=args.chunk, progress=lambda i, n: marks.append(time.perf_counter()))
+            st.latencies = [b - a for a, b in zip([t] + marks, marks)]
+            st.messages = len(mails)
+        results.append(st.result())
+
+        with stage("classify_partial", "message", [imap_srv]) as st:
+            parts = {m["uid"]: m["text_part"] for m in mails}
+            t = time.perf_counter()
+            for uid, text in iter_text_prefixes(conn, parts, CLASSIFY_BYTES, chunk_size=args.chunk):
+                classify_email("", text)
+                now = time.perf_counter()
+                st.latencies.append(now - t)
+                t = now
+                st.messages += 1
+        results.append(st.result())
+        del mails
+
+        # Local stages over the fetched bytes
+        with stage("parse_mime", "message") as st:
+            bodies = []
+            for _, raw in fetched_raws:
+                t = time.perf_counter()
+                msg = email.message_from_bytes(raw)
+                subject = decode_str(msg.get("Subject", ""))
+                decode_str(msg.get("From", ""))
+                bodies.append((subject, extract_body(msg)))
+                st.latencies.append(time.perf_counter() - t)
+                st.bytes_processed += len(raw)
+            st.messages = len(bodies)
+        results.append(st.result())
+
+        with stage("classify", "message") as st:
+            for subject, body in bodies:
+                t = time.perf_counter()
+                classify_email(subject, body)
+                st.latencies.append(time.perf_counter() - t)
+                st.bytes_processed += len(body)
+            st.messages = len(bodies)
+        results.append(st.result())
+        del bodies
+
+        attach_dir = os.path.join(tmp, "attachments")
+        with_attachments = [(uid, raw) for uid, raw in fetched_raws
+                            if b"Content-Disposition: attachment" in raw]
+        with stage("save_attachments", "message") as st:
+            for uid, raw in with_attachments:
+                msg = email.message_from_bytes(raw)
+                t = time.perf_counter()
+                save_attachments(msg, uid, attach_dir)
+                st.latencies.append(time.perf_counter() - t)
+                st.bytes_processed += len(raw)
+            st.messages = len(with_attachments)
+        results.append(st.result())
+
+        with stage("parse_record", "message") as st:
+            for uid, raw in fetched_raws:
+                t = time.perf_counter()
+                parse_record(uid, raw, attach_dir=os.path.join(tmp, "attachments_rec"))
+                st.latencies.append(time.perf_counter() - t)
+                st.bytes_processed += len(raw)
+            st.messages = len(fetched_raws)
+        results.append(st.result())
+        del fetched_raws
+
+        # Full fetch as the app does it: batched FETCH feeding the parse pool
+        pipeline = ParsePipeline(args.workers, attach_dir=os.path.join(tmp, "attachments_pipe"))
+        try:
+            with stage("fetch_pipeline", "message", [imap_srv]) as st:
+                t = time.perf_counter()
+                marks = []
+                mails, _ = fetch_new(conn, USER, "INBOX", uidvalidity, None, limit=len(raws), pipeline=pipeline,
+                                     chunk_size=args.chunk, progress=lambda i, n: marks.append(time.perf_counter()))
+                st.latencies = [b - a for a, b in zip([t] + marks, marks)]
+                st.messages = len(mails)
+        finally:
+            pipeline.shutdown()
+        results.append(st.result())
+        conn.logout()
+
+        # Replies: one at a time (auto_reply_selected path), then a bulk job
+        def connect():
+            s = smtplib.SMTP("127.0.0.1", smtp_srv.port, timeout=30)
+            s.login(USER, PASSWORD)
+            return s
+
+        replies = [build_reply_message(m, USER)[0] for m in mails[:args.replies]]
+        pool = SmtpPool(connect)
+        ledger = SentLedger(os.path.join(tmp, "ledger.db"))
+        try:
+            with stage("reply_single", "send", [smtp_srv]) as st:
+                for i, msg in enumerate(replies):
+                    key = f"single-{i}"
+                    ledger.claim(key, msg["To"])
+                    st.latencies.append(pool.send_message(msg))
+                    ledger.mark_sent(key)
+                st.messages = len(replies)
+            results.append(st.result())
+
+            items = [(f"bulk-{i}", msg["To"], msg, None) for i, msg in enumerate(replies)]
+            with stage("reply_bulk_job", "send", [smtp_srv]) as st:
+                job = ReplyJob(lambda msg: st.latencies.append(pool.send_message(msg)), ledger, items,
+                               concurrency=args.reply_concurrency, per_minute=0)
+                job.start()
+                job.wait()
+                st.messages = job.sent
+            results.append(st.result())
+        finally:
+            pool.close()
+            ledger.close()
+    finally:
+        if trace:
+            tracemalloc.stop()
+        imap_srv.stop()
+        smtp_srv.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {"n": args.n, "latency_ms": args.latency_ms, "chunk": args.chunk, "workers": args.workers,
+                   "replies": args.replies, "reply_concurrency": args.reply_concurrency,
+                   "attach_ratio": args.attach_ratio, "seed": args.seed, "trace_memory": trace},
+        "mailbox": {"messages": len(raws), "bytes": sum(len(r) for r in raws), "generate_s": gen_s},
+        "stages": results,
+    }
+
+
+# ----------------- REPORTING -----------------
+
+def print_report(report: dict, baseline: dict | None = None):
+    mb = report["mailbox"]
+    p = report["params"]
+    print(f"{mb['messages']} messages ({mb['bytes'] / 1e6:.1f} MB), latency {p['latency_ms']} ms, "
+          f"chunk {p['chunk']}, {p['workers']} parse workers"
+          f"{', memory traced (slower)' if p['trace_memory'] else ''}")
+    base = {s["stage"]: s for s in (baseline or {}).get("stages", [])}
+    print(f"  {'stage':20s} {'msg/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} {'per':14s} "
+          f"{'KB in':>9s} {'KB out':>8s} {'peak MB':>8s}")
+    for s in report["stages"]:
+        peak = f"{s['peak_mem_bytes'] / 1e6:8.1f}" if s["peak_mem_bytes"] is not None else "     n/a"
+        line = (f"  {s['stage']:20s} {s['msg_per_s']:9.1f} {s['p50_ms']:8.2f} {s['p99_ms']:8.2f} "
+                f"{s['latency_unit']:14s} {s['bytes_received'] / 1024:9.0f} {s['bytes_sent'] / 1024:8.0f} {peak}")
+        old = base.get(s["stage"])
+        if old and old["msg_per_s"]:
+            line += f"  {(s['msg_per_s'] / old['msg_per_s'] - 1) * 100:+6.1f}% msg/s"
+        print(line)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Offline fetch/classify/reply benchmark suite")
+    p.add_argument("-n", type=int, default=1000, help="messages in the synthetic mailbox")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="server delay per round trip")
+    p.add_argument("--chunk", type=int, default=FETCH_CHUNK_SIZE, help="messages per FETCH")
+    p.add_argument("--workers", type=int, default=PARSE_WORKERS, help="parse processes for fetch_pipeline")
+    p.add_argument("--replies", type=int, default=200, help="replies sent per reply stage")
+    p.add_argument("--reply-concurrency", type=int, default=2, help="bulk job concurrency")
+    p.add_argument("--attach-ratio", type=float, default=0.15, help="share of messages with an attachment")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--no-memory", action="store_true", help="skip tracemalloc (faster, no peak memory)")
+    p.add_argument("--out", help="result JSON path (default: benchmarks/results/suite-<time>.json)")
+    p.add_argument("--compare", help="earlier result JSON to compare msg/s against")
+    args = p.parse_args(argv)
+
+    report = run_suite(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"suite-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import re
+import time
+import email
+import socket
+import threading
+import socketserver
+from email.utils import getaddresses
+
+# Local stand-in IMAP and SMTP servers for offline benchmarks. They speak
+# just enough of each protocol for imaplib/smtplib and this app: LOGIN,
+# SELECT/EXAMINE, UID SEARCH, UID FETCH (RFC822, RFC822.SIZE, ENVELOPE,
+# BODYSTRUCTURE, BODY.PEEK[section]<0.N>, BODY.PEEK[HEADER.FIELDS (...)])
+# and EHLO/AUTH PLAIN/PIPELINING/
+# MAIL/RCPT/DATA. `latency` (seconds) is added once per client round trip,
+# i.e. per batch of input the server reads, so pipelined commands pay it
+# once, like a network RTT. Plain TCP only.
+
+
+# ----------------- SHARED -----------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    # Reads client flights, sleeps `latency`, feeds complete lines to the
+    # session and writes its replies in one send
+    def handle(self):
+        server = self.server
+        session = server.session_cls(server)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send(session.greeting())
+        buf = b""
+        while not session.closed:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            server.count(bytes_in=len(data))
+            if server.latency:
+                time.sleep(server.latency)
+            buf += data
+            out = []
+            while not session.closed:
+                consumed, reply = session.feed(buf)
+                if not consumed:
+                    break
+                buf = buf[consumed:]
+                if reply:
+                    out.append(reply)
+            if out:
+                self._send(b"".join(out))
+
+    def _send(self, data: bytes):
+        self.request.sendall(data)
+        self.server.count(bytes_out=len(data))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    session_cls = None
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def count(self, bytes_in: int = 0, bytes_out: int = 0, commands: int = 0):
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.commands += commands
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {"bytes_in": self.bytes_in, "bytes_out": self.bytes_out, "commands": self.commands}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# ----------------- IMAP -----------------
+
+def _quote(value) -> bytes:
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if b"\r" in value or b"\n" in value or not value.isascii():
+        return b"{%d}\r\n" % len(value) + value
+    return b'"' + value.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def _addresses(header) -> bytes:
+    if not header:
+        return b"NIL"
+    out = []
+    for name, addr in getaddresses([str(header)]):
+        mailbox, _, host = addr.partition("@")
+        out.append(b"(" + b" ".join([_quote(name or None), b"NIL", _quote(mailbox), _quote(host or None)])
+                   + b")")
+    return b"(" + b"".join(out) + b")" if out else b"NIL"
+
+
+def _envelope(msg) -> bytes:
+    def h(name):
+        v = msg.get(name)
+        return None if v is None else str(v)
+
+    sender = msg.get("Sender") or msg.get("From")
+    fields = [_quote(h("Date")), _quote(h("Subject")), _addresses(msg.get("From")), _addresses(sender),
+              _addresses(msg.get("Reply-To") or msg.get("From")), _addresses(msg.get("To")),
+              _addresses(msg.get("Cc")), _addresses(msg.get("Bcc")), _quote(h("In-Reply-To")),
+              _quote(h("Message-ID"))]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _params(pairs) -> bytes:
+    if not pairs:
+        return b"NIL"
+    return b"(" + b" ".join(_quote(k.upper()) + b" " + _quote(v) for k, v in pairs) + b")"
+
+
+def _raw_payload(part) -> bytes:
+    payload = part.get_payload(decode=False)
+    if isinstance(payload, bytes):
+        return payload
+    return (payload or "").encode("utf-8", "surrogateescape")
+
+
+def _bodystructure(part) -> bytes:
+    if part.is_multipart():
+        children = b"".join(_bodystructure(p) for p in part.get_payload())
+        return b"(" + children + b" " + _quote(part.get_content_subtype().upper()) + b")"
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    params = [(k, v) for k, v in part.get_params(header="content-type")[1:]] if part.get_params() else []
+    raw = _raw_payload(part)
+    fields = [_quote(maintype.upper()), _quote(subtype.upper()), _params(params), b"NIL", b"NIL",
+              _quote((part.get("Content-Transfer-Encoding") or "7bit").upper()), str(len(raw)).encode()]
+    if maintype == "text":
+        fields.append(str(raw.count(b"\n") + 1).encode())
+    fields.append(b"NIL")  # md5
+    disp = part.get("Content-Disposition")
+    if disp:
+        kind = disp.split(";")[0].strip()
+        dparams = [(k, v) for k, v in part.get_params(header="content-disposition")[1:]]
+        fields.append(b"(" + _quote(kind.upper()) + b" " + _params(dparams) + b")")
+    else:
+        fields.append(b"NIL")
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _section(msg, section: str):
+    part = msg
+    for n in section.split("."):
+        if part.is_multipart():
+            part = part.get_payload()[int(n) - 1]
+        elif n != "1":
+            return None
+    return part
+
+
+class Mailbox:
+    # One folder: raw messages with precomputed ENVELOPE/BODYSTRUCTURE
+    def __init__(self, raws, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.messages = []  # (uid, raw, envelope, bodystructure, Message)
+        for raw in raws:
+            self.append(raw)
+
+    def append(self, raw: bytes):
+        msg = email.message_from_bytes(raw)
+        uid = (self.messages[-1][0] + 1) if self.messages else 1
+        self.messages.append((uid, raw, _envelope(msg), _bodystructure(msg), msg))
+
+
+_SEQ_RE = re.compile(r"^(\d+|\*)(?::(\d+|\*))?$")
+_PEEK_RE = re.compile(r"BODY(?:\.PEEK)?\[([\d.]*)\](?:<(\d+)\.(\d+)>)?", re.IGNORECASE)
+_HEADER_FIELDS_RE = re.compile(r"BODY(?:\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]", re.IGNORECASE)
+
+
+def _expand(seq_set: str, top: int) -> list[int]:
+    # Sequence set -> sorted UIDs in 1..top (this server's UIDs have no gaps)
+    uids = set()
+    for piece in seq_set.split(","):
+        m = _SEQ_RE.match(piece)
+        if not m:
+            continue
+        a = top if m.group(1) == "*" else int(m.group(1))
+        b = a if m.group(2) is None else (top if m.group(2) == "*" else int(m.group(2)))
+        uids.update(range(max(1, min(a, b)), min(top, max(a, b)) + 1))
+    return sorted(uids)
+
+
+class _ImapSession:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.folder = None
+
+    def greeting(self) -> bytes:
+        return b"* OK [CAPABILITY IMAP4rev1] bench IMAP ready\r\n"
+
+    def feed(self, buf: bytes):
+        end = buf.find(b"\r\n")
+        if end < 0:
+            return 0, b""
+        line = buf[:end].decode("utf-8", "replace")
+        self.server.count(commands=1)
+        return end + 2, self.command(line)
+
+    def command(self, line: str) -> bytes:
+        parts = line.split(" ", 2)
+        tag = parts[0]
+        cmd = parts[1].upper() if len(parts) > 1 else ""
+        args = parts[2] if len(parts) > 2 else ""
+        if cmd == "CAPABILITY":
+            return b"* CAPABILITY IMAP4rev1\r\n" + f"{tag} OK CAPABILITY done\r\n".encode()
+        if cmd == "LOGIN":
+            return f"{tag} OK LOGIN done\r\n".encode()
+        if cmd in ("SELECT", "EXAMINE"):
+            name = args.strip().strip('"')
+            box = self.server.folders.get(name)
+            if box is None:
+                return f"{tag} NO no such mailbox\r\n".encode()
+            self.folder = box
+            top = box.messages[-1][0] if box.messages else 0
+            return (f"* {len(box.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                    f"* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid\r\n"
+                    f"* OK [UIDNEXT {top + 1}] next\r\n"
+                    f"{tag} OK [READ-WRITE] {cmd} done\r\n").encode()
+        if cmd == "UID":
+            sub, _, rest = args.partition(" ")
+            if self.folder is None:
+                return f"{tag} NO select first\r\n".encode()
+            if sub.upper() == "SEARCH":
+                return self.search(tag, rest)
+            if sub.upper() == "FETCH":
+                return self.fetch(tag, rest)
+        if cmd == "NOOP":
+            return f"{tag} OK NOOP done\r\n".encode()
+        if cmd == "LOGOUT":
+            self.closed = True
+            return b"* BYE\r\n" + f"{tag} OK LOGOUT done\r\n".encode()
+        return f"{tag} BAD unsupported\r\n".encode()
+
+    def search(self, tag: str, criteria: str) -> bytes:
+        msgs = self.folder.messages
+        top = msgs[-1][0] if msgs else 0
+        m = re.search(r"UID (\S+)", criteria, re.IGNORECASE)
+        uids = _expand(m.group(1), top) if m else [u for u, *_ in msgs]
+        return (f"* SEARCH {' '.join(map(str, uids))}\r\n".encode()
+                + f"{tag} OK SEARCH done\r\n".encode())
+
+    def fetch(self, tag: str, rest: str) -> bytes:
+        seq_set, _, items = rest.partition(" ")
+        items_u = items.upper()
+        msgs = self.folder.messages
+        top = msgs[-1][0] if msgs else 0
+        out = []
+        for uid in _expand(seq_set, top):
+            seq = uid
+            _, raw, env, bs, msg = msgs[uid - 1]
+            fields = [b"UID %d" % uid]
+            if "RFC822.SIZE" in items_u:
+                fields.append(b"RFC822.SIZE %d" % len(raw))
+            if "ENVELOPE" in items_u:
+                fields.append(b"ENVELOPE " + env)
+            if "BODYSTRUCTURE" in items_u:
+                fields.append(b"BODYSTRUCTURE " + bs)
+            if re.search(r"RFC822(?![.\w])", items_u):
+                fields.append(b"RFC822 {%d}\r\n" % len(raw) + raw)
+            for m in _PEEK_RE.finditer(items):
+                part = _section(msg, m.group(1) or "1")
+                data = _raw_payload(part) if part is not None else b""
+                name = f"BODY[{m.group(1)}]"
+                if m.group(2) is not None:
+                    start, length = int(m.group(2)), int(m.group(3))
+                    data = data[start:start + length]
+                    name += f"<{start}>"
+                fields.append(name.encode() + b" {%d}\r\n" % len(data) + data)
+            for m in _HEADER_FIELDS_RE.finditer(items):
+                names = m.group(1).upper().split()
+                data = "".join(f"{n.title()}: {msg[n]}\r\n" for n in names if msg[n] is not None).encode() + b"\r\n"
+                fields.append(f"BODY[HEADER.FIELDS ({' '.join(names)})]".encode() + b" {%d}\r\n" % len(data) + data)
+            out.append(b"* %d FETCH (" % seq + b" ".join(fields) + b")\r\n")
+        out.append(f"{tag} OK FETCH done\r\n".encode())
+        return b"".join(out)
+
+
+class FakeImapServer(_Server):
+    session_cls = _ImapSession
+
+    def __init__(self, folders: dict, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        # folders: {name: Mailbox}
+        super().__init__(host, port, latency)
+        self.folders = folders
+
+
+# ----------------- SMTP -----------------
+
+class _SmtpSession:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.in_data = False
+        self.auth_login = None
+
+    def greeting(self) -> bytes:
+        return b"220 bench ESMTP ready\r\n"
+
+    def feed(self, buf: bytes):
+        if self.in_data:
+            end = buf.find(b"\r\n.\r\n")
+            if end < 0:
+                return 0, b""
+            self.in_data = False
+            self.server.delivered(buf[:end + 2])
+            return end + 5, b"250 OK queued\r\n"
+        end = buf.find(b"\r\n")
+        if end < 0:
+            return 0, b""
+        self.server.count(commands=1)
+        return end + 2, self.command(buf[:end].decode("utf-8", "replace"))
+
+    def command(self, line: str) -> bytes:
+        verb = line.split(" ", 1)[0].upper()
+        if verb == "EHLO":
+            return b"250-bench\r\n250-PIPELINING\r\n250-SIZE 52428800\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n"
+        if verb == "HELO":
+            return b"250 bench\r\n"
+        if verb == "AUTH":
+            return b"235 2.7.0 Authentication successful\r\n"
+        if verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+            return b"250 OK\r\n"
+        if verb == "DATA":
+            self.in_data = True
+            return b"354 End data with <CR><LF>.<CR><LF>\r\n"
+        if verb == "QUIT":
+            self.closed = True
+            return b"221 bye\r\n"
+        return b"502 unsupported\r\n"
+
+
+class FakeSmtpServer(_Server):
+    session_cls = _SmtpSession
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__(host, port, latency)
+        self.messages = 0
+
+    def delivered(self, data: bytes):
+        with self._lock:
+            self.messages += 1
+
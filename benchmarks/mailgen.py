@@ -0,0 +1,119 @@
+import random
+from email.charset import BASE64, QP, Charset
+from email.header import Header
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime, make_msgid
+from datetime import datetime, timedelta, timezone
+
+# Synthetic mailbox generator for the benchmarks: realistic mixes of MIME
+# structures, transfer encodings, charsets and attachments, reproducible
+# from a seed.
+
+WORDS = ("invoice order shipment help error quote project urgent please thanks team report "
+         "meeting schedule numbers update review customer account issue payment delivery "
+         "proposal pricing support problem tracking bill overdue collaboration").split()
+ACCENTED = "café naïve façade résumé Zürich São Paulo déjà vu".split()
+
+STRUCTURES = ("plain", "alternative", "mixed", "nested", "html")
+ENCODINGS = ("7bit", "quoted-printable", "base64")
+CHARSETS = ("utf-8", "iso-8859-1")
+
+
+def _words(rng, n: int, accented: bool) -> str:
+    pool = WORDS + ACCENTED if accented else WORDS
+    return " ".join(rng.choice(pool) for _ in range(n))
+
+
+def _text_part(text: str, subtype: str, charset: str, encoding: str):
+    cs = Charset(charset)
+    if encoding == "7bit" and not text.isascii():
+        encoding = "quoted-printable"
+    cs.body_encoding = {"7bit": None, "quoted-printable": QP, "base64": BASE64}[encoding]
+    if encoding == "7bit":
+        return MIMEText(text, subtype, "us-ascii")
+    return MIMEText(text, subtype, cs)
+
+
+class MailboxSpec:
+    # Knobs for generate(); weights are relative frequencies
+    def __init__(self, count: int = 1000, body_words: tuple = (50, 800), attach_ratio: float = 0.15,
+                 attach_kb: tuple = (4, 256), attach_dup_ratio: float = 0.3, structures=None,
+                 encodings=None, charsets=None, accented_ratio: float = 0.2, seed: int = 7):
+        self.count = count
+        self.body_words = body_words
+        self.attach_ratio = attach_ratio
+        self.attach_kb = attach_kb
+        self.attach_dup_ratio = attach_dup_ratio  # attachments reusing an earlier file (dedupe)
+        self.structures = structures or {"plain": 5, "alternative": 3, "mixed": 1, "nested": 1, "html": 0.5}
+        self.encodings = encodings or {"7bit": 4, "quoted-printable": 3, "base64": 2}
+        self.charsets = charsets or {"utf-8": 4, "iso-8859-1": 1}
+        self.accented_ratio = accented_ratio
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _pick(rng, weights: dict):
+    keys = list(weights)
+    return rng.choices(keys, weights=[weights[k] for k in keys])[0]
+
+
+def generate(spec: MailboxSpec) -> list[bytes]:
+    # Raw RFC822 messages, oldest first
+    rng = random.Random(spec.seed)
+    attachments = []  # earlier (name, data), for duplicates
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    out = []
+    for i in range(spec.count):
+        accented = rng.random() < spec.accented_ratio
+        charset = _pick(rng, spec.charsets) if accented else "us-ascii"
+        if charset == "us-ascii":
+            charset = "utf-8"
+        encoding = _pick(rng, spec.encodings)
+        structure = _pick(rng, spec.structures)
+        text = _words(rng, rng.randint(*spec.body_words), accented)
+        html = f"<html><body><p>{text}</p></body></html>"
+
+        if structure == "plain":
+            msg = _text_part(text, "plain", charset, encoding)
+        elif structure == "html":
+            msg = _text_part(html, "html", charset, encoding)
+        else:
+            alt = MIMEMultipart("alternative")
+            alt.attach(_text_part(text, "plain", charset, encoding))
+            alt.attach(_text_part(html, "html", charset, encoding))
+            if structure == "alternative":
+                msg = alt
+            else:
+                msg = MIMEMultipart("mixed")
+                if structure == "nested":
+                    msg.attach(alt)
+                else:
+                    msg.attach(_text_part(text, "plain", charset, encoding))
+
+        if rng.random() < spec.attach_ratio:
+            if not isinstance(msg, MIMEMultipart) or msg.get_content_subtype() != "mixed":
+                outer = MIMEMultipart("mixed")
+                outer.attach(msg)
+                msg = outer
+            if attachments and rng.random() < spec.attach_dup_ratio:
+                name, data = rng.choice(attachments)
+            else:
+                name = f"file{i}.{rng.choice(['pdf', 'bin', 'zip'])}"
+                data = rng.randbytes(rng.randint(*spec.attach_kb) * 1024)
+                attachments.append((name, data))
+            part = MIMEApplication(data, Name=name)
+            part["Content-Disposition"] = f'attachment; filename="{name}"'
+            msg.attach(part)
+
+        subject = _words(rng, rng.randint(3, 8), accented)
+        msg["Subject"] = Header(subject, "utf-8").encode() if not subject.isascii() else subject
+        msg["From"] = f"Customer {i} <customer{i}@example.com>"
+        msg["To"] = "support@example.com"
+        msg["Date"] = format_datetime(start + timedelta(minutes=7 * i))
+        msg["Message-ID"] = make_msgid(idstring=str(i), domain="bench.example.com")
+        out.append(msg.as_bytes())
+    return out
@@ -0,0 +1,266 @@
+import io
+import os
+import json
+import time
+import zlib
+import hashlib
+import zipfile
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy only the keyword rules are used
+    np = None
+
+from classifier import CATEGORIES, default_matcher
+from metrics import timed
+from reply_log import iter_log_rows
+from settings import LOG_CSV_PATH, MODEL_PATH
+
+# ----------------- CONSTANTS -----------------
+
+MODEL_FEATURES = 1 << 18  # hashed word buckets
+MODEL_ALPHA = 0.1  # additive smoothing
+MODEL_MIN_CONFIDENCE = 0.9  # below this the keyword rules decide
+MODEL_MIN_EXAMPLES = 50  # fewer labelled messages are not worth a model
+MODEL_HOLDOUT = 0.1  # share of examples kept aside to report accuracy
+_BUCKET_MEMO = 500_000  # word -> bucket lookups remembered
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _norm(text: str) -> str:
+    # Log rows have newlines flattened; compare on collapsed whitespace
+    return " ".join((text or "").split())
+
+
+# ----------------- FEATURES -----------------
+
+class _Buckets(dict):
+    # word -> bucket memo; crc32 is stable across runs, unlike hash(). A dict
+    # subclass so hits stay in C (map(memo.__getitem__, words)).
+
+    def __missing__(self, word: str) -> int:
+        if len(self) > _BUCKET_MEMO:
+            self.clear()
+        b = self[word] = zlib.crc32(word.encode("utf-8", "surrogatepass")) & (MODEL_FEATURES - 1)
+        return b
+
+
+_buckets = _Buckets()
+
+
+def message_features(subject: str, words) -> list:
+    # Bucket ids for a message; `words` is the word set of subject + body
+    # (KeywordMatcher.prepare). Subject words also count as "s:<word>".
+    subject_words = default_matcher().prepare(subject, "")[1]
+    out = set(map(_buckets.__getitem__, words))
+    out.update(map(_buckets.__getitem__, ["s:" + word for word in subject_words]))
+    return list(out)
+
+
+def _flatten(features: list):
+    lengths = np.fromiter((len(f) for f in features), dtype=np.int64, count=len(features))
+    idx = np.fromiter((b for f in features for b in f), dtype=np.int64, count=int(lengths.sum()))
+    return idx, lengths
+
+
+# ----------------- MODEL -----------------
+
+class CategoryModel:
+    # Multinomial naive Bayes over hashed word presence. Subject words get
+    # their own features ("s:" prefix) on top of the body's, so a word in the
+    # subject weighs more. Scoring a batch gathers the weight rows of every
+    # (message, word) pair and sums them per message with NumPy.
+
+    def __init__(self, categories: list, log_prior, log_prob, meta: dict | None = None):
+        self.categories = list(categories)
+        self.log_prior = log_prior  # (categories,)
+        self.log_prob = log_prob  # (MODEL_FEATURES, categories), float32
+        self.meta = meta or {}
+        self.version = self.meta.get("version") or self._digest()
+
+    def _digest(self) -> str:
+        h = hashlib.sha1(json.dumps(self.categories).encode())
+        h.update(self.log_prior.tobytes())
+        h.update(self.log_prob.tobytes())
+        return h.hexdigest()[:16]
+
+    def score(self, features: list):
+        # features: one bucket list per message -> (category index, confidence) arrays
+        n = len(features)
+        idx, lengths = _flatten(features)
+        doc = np.repeat(np.arange(n), lengths)
+        gathered = self.log_prob[idx]
+        scores = np.empty((n, len(self.categories)))
+        for c in range(len(self.categories)):
+            scores[:, c] = np.bincount(doc, weights=gathered[:, c], minlength=n)
+        scores += self.log_prior
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return best, probs[np.arange(n), best]
+
+    def predict_many(self, items) -> list:
+        # items: (subject, body) -> [(category, confidence)]
+        matcher = default_matcher()
+        feats = [message_features(s, matcher.prepare(s, b)[1]) for s, b in items]
+        if not feats:
+            return []
+        best, conf = self.score(feats)
+        return [(self.categories[i], float(p)) for i, p in zip(best, conf)]
+
+    @classmethod
+    def train(cls, examples, alpha: float = MODEL_ALPHA):
+        # examples: [(subject, body, category)]
+        matcher = default_matcher()
+        categories = sorted({cat for _, _, cat in examples})
+        index = {cat: i for i, cat in enumerate(categories)}
+        feats = [message_features(s, matcher.prepare(s, b)[1]) for s, b, _ in examples]
+        labels = np.array([index[cat] for _, _, cat in examples], dtype=np.int64)
+        idx, lengths = _flatten(feats)
+        counts = np.bincount(idx * len(categories) + np.repeat(labels, lengths),
+                             minlength=MODEL_FEATURES * len(categories)).reshape(MODEL_FEATURES, len(categories))
+        totals = counts.sum(axis=0)
+        log_prob = np.log(counts + alpha) - np.log(totals + alpha * MODEL_FEATURES)
+        docs = np.bincount(labels, minlength=len(categories))
+        log_prior = np.log(docs / docs.sum())
+        meta = {"trained": time.time(), "examples": len(examples), "alpha": alpha,
+                "per_category": dict(zip(categories, docs.tolist()))}
+        return cls(categories, log_prior, log_prob.astype(np.float32), meta)
+
+    def save(self, path: str = MODEL_PATH):
+        meta = dict(self.meta, version=self.version)
+        buf = io.BytesIO()
+        np.savez(buf, log_prior=self.log_prior, log_prob=self.log_prob,
+                 categories=np.array(self.categories), meta=np.array(json.dumps(meta)))
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH):
+        # ValueError when the file does not fit this version of the app (other
+        # feature count, unknown categories)
+        with np.load(path) as data:
+            model = cls([str(c) for c in data["categories"]], data["log_prior"], data["log_prob"],
+                        json.loads(str(data["meta"])))
+        n = len(model.categories)
+        if not n or len(set(model.categories)) != n or not set(model.categories) <= set(CATEGORIES):
+            raise ValueError(f"unexpected categories {model.categories}")
+        if model.log_prob.shape != (MODEL_FEATURES, n) or model.log_prior.shape != (n,):
+            raise ValueError(f"weights have shape {model.log_prob.shape}, expected {(MODEL_FEATURES, n)}")
+        return model
+
+
+# ----------------- MODEL + RULES -----------------
+
+class HybridClassifier:
+    # The model picks the category when it is confident; otherwise the keyword
+    # rules do. Urgency always comes from the rules. Drop-in for KeywordMatcher
+    # (classify_many, version) wherever results are cached.
+
+    def __init__(self, model: CategoryModel, matcher=None, min_confidence: float = MODEL_MIN_CONFIDENCE):
+        self.model = model
+        self.matcher = matcher or default_matcher()
+        self.min_confidence = min_confidence
+        self.version = f"{self.matcher.version}+{model.version}@{min_confidence}"
+        self.model_decided = 0
+        self.rules_decided = 0
+
+    def classify(self, subject: str, body: str):
+        return self.classify_many([(subject, body)])[0]
+
+    def classify_many(self, items) -> list:
+        items = list(items)
+        if not items:
+            return []
+        with timed("classify_model"):
+            prepared = [self.matcher.prepare(s, b) for s, b in items]
+            feats = [message_features(s, words) for (s, _), (_, words) in zip(items, prepared)]
+            best, conf = self.model.score(feats)
+            results = []
+            for (subject, body), prep, i, p in zip(items, prepared, best, conf):
+                category, urgent = self.matcher.classify(subject, body, prep)
+                if p >= self.min_confidence:
+                    category = self.model.categories[i]
+                    self.model_decided += 1
+                else:
+                    self.rules_decided += 1
+                results.append((category, urgent))
+        return results
+
+
+def load_classifier(path: str = MODEL_PATH) -> tuple:
+    # (classifier, error): HybridClassifier when a trained model and NumPy are
+    # there, else the rules; error says why an existing model was not used
+    if not os.path.exists(path):
+        return default_matcher(), None
+    if np is None:
+        return default_matcher(), f"{path} found but NumPy is not installed; using the keyword rules"
+    try:
+        return HybridClassifier(CategoryModel.load(path)), None
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+        return default_matcher(), f"Could not load {path} ({e}); using the keyword rules"
+
+
+# ----------------- TRAINING DATA -----------------
+
+def training_examples(store, log_path: str = LOG_CSV_PATH) -> list:
+    # Labels are the categories replies were sent under (reply log, rotated
+    # files included); text comes from the stored message with the same sender
+    # and subject, or just the subject when it is no longer stored.
+    labels = {}
+    for row in iter_log_rows(log_path):
+        category = row.get("category") or ""
+        if category in CATEGORIES:  # not "Unclassified" or names a model could not load
+            labels[(_norm(row.get("from")).lower(), _norm(row.get("subject")))] = category
+    examples = []
+    matched = set()
+    for sender, subject, body, _ in store.iter_texts():
+        key = (_norm(sender).lower(), _norm(subject))
+        category = labels.get(key)
+        if category:
+            examples.append((subject, body, category))
+            matched.add(key)
+    for (sender, subject), category in labels.items():
+        if (sender, subject) not in matched:
+            examples.append((subject, "", category))
+    return examples
+
+
+def train_from_log(store, log_path: str = LOG_CSV_PATH, path: str = MODEL_PATH,
+                   holdout: float = MODEL_HOLDOUT) -> dict:
+    # Train, report held-out accuracy (model alone, with rule fallback, rules
+    # alone), then retrain on everything and save
+    if np is None:
+        raise RuntimeError("NumPy is required to train the classifier (pip install numpy)")
+    examples = training_examples(store, log_path)
+    if len(examples) < MODEL_MIN_EXAMPLES:
+        raise RuntimeError(f"Only {len(examples)} labelled messages; need at least {MODEL_MIN_EXAMPLES}")
+    order = np.random.default_rng(0).permutation(len(examples))
+    n_test = int(len(examples) * holdout)
+    report = {"examples": len(examples)}
+    if n_test:
+        test = [examples[i] for i in order[:n_test]]
+        train = [examples[i] for i in order[n_test:]]
+        model = CategoryModel.train(train)
+        items = [(s, b) for s, b, _ in test]
+        truth = [cat for _, _, cat in test]
+        hybrid = HybridClassifier(model)
+
+        def accuracy(predicted):
+            return sum(p == t for p, t in zip(predicted, truth)) / len(truth)
+
+        report["model_accuracy"] = accuracy([c for c, _ in model.predict_many(items)])
+        report["hybrid_accuracy"] = accuracy([c for c, _ in hybrid.classify_many(items)])
+        report["rules_accuracy"] = accuracy([c for c, _ in default_matcher().classify_many(items)])
+        report["test"] = n_test
+    model = CategoryModel.train(examples)
+    model.save(path)
+    report["categories"] = model.meta["per_category"]
+    report["path"] = path
+    return report
@@ -0,0 +1,156 @@
+import re
+import json
+import string
+import hashlib
+
+from metrics import instrumented, timed
+
+# ----------------- RULES -----------------
+
+CATEGORIES = [
+    "Billing / Payment",
+    "Order / Purchase",
+    "Support Request",
+    "Client Lead",
+    "Other",
+]
+
+# First matching category wins, in this order
+CATEGORY_RULES = [
+    ("Billing / Payment", ["invoice", "payment", "bill", "billing", "due", "overdue"]),
+    ("Order / Purchase", ["order", "shipment", "tracking", "delivery", "purchase"]),
+    ("Support Request", ["issue", "error", "bug", "problem", "support", "help", "not working", "failed"]),
+    ("Client Lead", ["quote", "pricing", "project", "proposal", "hire", "collaboration", "work with you",
+                     "service"]),
+]
+URGENT_KEYWORDS = ["urgent", "asap", "immediately", "critical", "important"]
+
+# Bump when the matching itself changes; rule table edits change the version on their own
+MATCHER_REVISION = 3
+
+_URGENT = "urgent"
+
+
+# ----------------- COMPILED MATCHER -----------------
+
+def _inflected(word: str) -> tuple[str, list, bool]:
+    # (stem, suffixes, bare stem allowed) for a keyword and its inflections:
+    # order -> orders/ordered/ordering, bug -> bugged, delivery -> delivered,
+    # purchase -> purchased/purchasing, shipment -> shipped/shipping
+    if len(word) > 7 and word.endswith("ment"):
+        stem, suffixes, bare = _inflected(word[:-4])
+        return stem, suffixes + ["ment", "ments"], bare
+    if len(word) >= 3 and word.endswith("e"):
+        return word[:-1], ["e", "es", "ed", "ing"], False
+    if len(word) > 3 and word.endswith("y") and word[-2] not in "aeiou":
+        return word[:-1], ["y", "ies", "ied", "s", "ed", "ing"], False
+    if word[-1] not in "aeiouy":
+        return word, ["s", "es", "ed", "ing", word[-1] + "ed", word[-1] + "ing"], True
+    return word, ["s", "es", "ed", "ing"], True
+
+
+def _keyword_pattern(words: list) -> tuple[str, str]:
+    # (literal every match starts with, rest of the regex) for a keyword split into words
+    stem, suffixes, bare = _inflected(words[-1])
+    last = "(?:" + "|".join(sorted(map(re.escape, suffixes), key=len, reverse=True)) + ")" + ("?" if bare else "")
+    if len(words) == 1:
+        return stem, last
+    parts = [re.escape(w) for w in words[1:-1]] + [re.escape(stem) + last]
+    return words[0], "".join(r"[\W_]+" + part for part in parts)
+
+
+class KeywordMatcher:
+    # Rule tables compiled once. Every keyword becomes a regex matching it as a
+    # whole word with inflections ("order" hits ordered, not reorder or
+    # borderline; "due" not produce) plus the literal it starts with. A text is
+    # only searched with a keyword's regex when that literal occurs in it (a
+    # substring test in C), and categories are tried in order, stopping at the
+    # first that matches.
+
+    _SEPARATORS = str.maketrans({ch: " " for ch in string.punctuation})
+
+    def __init__(self, category_rules=CATEGORY_RULES, urgent_keywords=URGENT_KEYWORDS):
+        self.categories = [cat for cat, _ in category_rules]
+        # Identifies these rules, e.g. for cached results
+        self.version = hashlib.sha1(json.dumps(
+            [MATCHER_REVISION, category_rules, urgent_keywords]).encode()).hexdigest()[:16]
+        self._rules = [self._compile(kws) for _, kws in category_rules]  # [(probe, regex)] per category
+        self._urgent = self._compile(urgent_keywords)
+
+    @classmethod
+    def _compile(cls, keywords) -> list:
+        # [(probe, regex)]: keywords starting with the same literal share one
+        # regex, e.g. bill(?<!\wbill)(?:...)\b covers bill/billed/billing. The
+        # regex starts with the literal, so re scans for it quickly, and the
+        # lookbehind after it checks that the literal starts a word. The probe
+        # is the whole keyword when the literal is shorter than three letters
+        # ("du" of "due" is in too many words). Keywords that an earlier one already matches
+        # ("billing" after "bill") are left out.
+        tails = {}
+        for kw in keywords:
+            words = kw.lower().translate(cls._SEPARATORS).split()
+            if not words or any(re.fullmatch(cls._regex(literal, alternatives), " ".join(words))
+                                for literal, alternatives in tails.items()):
+                continue
+            literal, tail = _keyword_pattern(words)
+            tails.setdefault(literal, {})[tail] = " ".join(words) if len(literal) < 3 else literal
+        return [(min(alternatives.values(), key=len), re.compile(cls._regex(literal, alternatives)))
+                for literal, alternatives in tails.items()]
+
+    @staticmethod
+    def _regex(literal: str, tails) -> str:
+        # Letters and digits make words; punctuation (underscore included) and
+        # spaces separate them, so raw text matches as prepare() text does
+        head = re.escape(literal)
+        return f"{head}(?<![^\\W_]{head})(?:{'|'.join(tails)})(?![^\\W_])"
+
+    @staticmethod
+    def _matches(text: str, rule: list) -> bool:
+        # Every match starts with the probe, so the search starts at its first
+        # occurrence
+        for probe, regex in rule:
+            i = text.find(probe)
+            if i >= 0 and regex.search(text, i):
+                return True
+        return False
+
+    def prepare(self, subject: str, body: str) -> tuple[str, set]:
+        # (normalized text, word set), e.g. for model features; pass as
+        # `prepared` to classify() to reuse the normalized text
+        text = ((subject or "") + " " + (body or "")).lower().translate(self._SEPARATORS)
+        return text, set(text.split())
+
+    def classify(self, subject: str, body: str, prepared: tuple | None = None):
+        text = prepared[0] if prepared else ((subject or "") + " " + (body or "")).lower()
+        category = "Other"
+        for name, rule in zip(self.categories, self._rules):
+            if self._matches(text, rule):
+                category = name
+                break
+        return category, self._matches(text, self._urgent)
+
+    def classify_many(self, items) -> list:
+        results = []
+        for subject, body in items:
+            with timed("classify"):
+                results.append(self.classify(subject, body))
+        return results
+
+
+_default_matcher = KeywordMatcher()
+
+
+# ----------------- API -----------------
+
+@instrumented("classify")
+def classify_email(subject: str, body: str):
+    return _default_matcher.classify(subject, body)
+
+
+def default_matcher() -> KeywordMatcher:
+    return _default_matcher
+
+
+def classify_many(items, matcher: KeywordMatcher | None = None):
+    # items: iterable of (subject, body); returns [(category, is_urgent), ...]
+    return (matcher or _default_matcher).classify_many(items)
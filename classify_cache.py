@@ -0,0 +1,136 @@
+import time
+import sqlite3
+import hashlib
+import threading
+
+from classifier import default_matcher
+from metrics import METRICS
+
+# ----------------- CONSTANTS -----------------
+
+CLASSIFY_CACHE_SIZE = 200_000  # cached results kept; least recently used are dropped first
+CLASSIFY_CACHE_EVICT = 0.1  # share of the capacity freed at once when it is exceeded
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    category TEXT NOT NULL,
+    urgent INTEGER NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def content_key(version: str, subject: str, text: str) -> bytes:
+    # Rule version + the exact text the classifier sees
+    h = hashlib.blake2b(digest_size=16)
+    h.update(version.encode())
+    h.update(b"\0")
+    h.update((subject or "").encode("utf-8", "surrogatepass"))
+    h.update(b"\0")
+    h.update((text or "").encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+
+# ----------------- CACHE -----------------
+
+class ClassificationCache:
+    # Persistent (category, urgent) per content hash (SQLite, WAL). Keys include
+    # the rule version, and opening the cache with different rules clears it,
+    # so edited keyword tables never serve stale results. Past `capacity`
+    # entries the least recently used are evicted. Safe to share between threads.
+
+    def __init__(self, path: str, matcher=None, capacity: int = CLASSIFY_CACHE_SIZE):
+        # matcher: KeywordMatcher or anything with .version and .classify_many(items)
+        self.path = path
+        self.matcher = matcher or default_matcher()
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._check_version()
+        self._count = self._db.execute("SELECT count(*) FROM results").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self):
+        version = self.matcher.version
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'rules'").fetchone()
+        if row is not None and row[0] == version:
+            return
+        with self._db:
+            self._db.execute("DELETE FROM results")
+            self._db.execute("INSERT INTO meta (name, value) VALUES ('rules', ?) "
+                             "ON CONFLICT (name) DO UPDATE SET value = excluded.value", (version,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, keys) -> dict:
+        # {key: (category, urgent)} for the keys that are cached; marks them used
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock, self._db:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                hits = self._db.execute(f"SELECT key, category, urgent FROM results WHERE key IN ({marks})",
+                                        part).fetchall()
+                found.update((key, (category, bool(urgent))) for key, category, urgent in hits)
+                if hits:
+                    self._db.executemany("UPDATE results SET used = ? WHERE key = ?", [(now, k) for k, _, _ in hits])
+        return found
+
+    def put_many(self, entries):
+        # entries: iterable of (key, (category, urgent))
+        now = time.time()
+        rows = [(key, category, int(bool(urgent)), now) for key, (category, urgent) in entries]
+        if not rows:
+            return
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO results (key, category, urgent, used) VALUES (?, ?, ?, ?)",
+                                 rows)
+            self._count += self._db.total_changes - before
+            if self._count > self.capacity:
+                drop = self._count - self.capacity + int(self.capacity * CLASSIFY_CACHE_EVICT)
+                self._db.execute("DELETE FROM results WHERE key IN "
+                                 "(SELECT key FROM results ORDER BY used LIMIT ?)", (drop,))
+                self._count = self._db.execute("SELECT count(*) FROM results").fetchone()[0]
+
+    def classify_many(self, items) -> list:
+        # Same as classifier.classify_many, but only texts not seen before (with
+        # these rules) are classified
+        items = list(items)
+        version = self.matcher.version
+        keys = [content_key(version, subject, body) for subject, body in items]
+        cached = self.get_many(keys)
+        missing = {}
+        for key, item in zip(keys, items):
+            if key not in cached and key not in missing:
+                missing[key] = item
+        if missing:
+            fresh = dict(zip(missing, self.matcher.classify_many(list(missing.values()))))
+            self.put_many(fresh.items())
+            cached.update(fresh)
+        with self._lock:
+            self.hits += len(items) - len(missing)
+            self.misses += len(missing)
+        METRICS.inc("cache_total", len(items) - len(missing), stage="classify", result="hit")
+        METRICS.inc("cache_total", len(missing), stage="classify", result="miss")
+        return [cached[key] for key in keys]
+
+    def classify(self, subject: str, body: str):
+        return self.classify_many([(subject, body)])[0]
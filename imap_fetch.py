@@ -0,0 +1,399 @@
+import re
+import time
+import base64
+import binascii
+import quopri
+
+from metrics import METRICS, timed
+
+# ----------------- CONSTANTS -----------------
+
+FETCH_CHUNK_SIZE = 50  # messages per FETCH command
+CLASSIFY_BYTES = 4096  # body prefix downloaded for classification
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}\s*$")
+
+
+# ----------------- SEQUENCE SETS -----------------
+
+def _as_int(msg_id) -> int:
+    if isinstance(msg_id, bytes):
+        msg_id = msg_id.decode()
+    return int(msg_id)
+
+
+def build_sequence_set(ids) -> str:
+    # Collapse ids into an IMAP sequence set, e.g. [1, 2, 3, 7, 9, 10] -> "1:3,7,9:10"
+    nums = sorted({_as_int(i) for i in ids})
+    if not nums:
+        return ""
+    ranges = []
+    start = prev = nums[0]
+    for n in nums[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = n
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+
+def chunked(items, size: int):
+    size = max(1, int(size))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ----------------- MAILBOX / UID SEARCH -----------------
+
+def select_folder(conn, folder: str = "INBOX", readonly: bool = False):
+    # SELECT a folder and return (message_count, uidvalidity)
+    status, data = conn.select(folder, readonly=readonly)
+    if status != "OK":
+        raise RuntimeError(f"IMAP select {folder} failed")
+    try:
+        count = int(data[0])
+    except (TypeError, ValueError, IndexError):
+        count = 0
+
+    uidvalidity = None
+    _, resp = conn.response("UIDVALIDITY")
+    if resp and resp[0]:
+        uidvalidity = _as_int(resp[-1])
+    else:
+        status, data = conn.status(folder, "(UIDVALIDITY)")
+        m = re.search(rb"UIDVALIDITY (\d+)", data[0] or b"") if status == "OK" else None
+        if m:
+            uidvalidity = int(m.group(1))
+    return count, uidvalidity
+
+
+def search_uids(conn, criteria: str = "ALL") -> list[int]:
+    with timed("imap_search"):
+        status, data = conn.uid("SEARCH", None, criteria)
+        if status != "OK":
+            raise RuntimeError("IMAP search failed")
+    return sorted(int(x) for x in (data[0] or b"").split())
+
+
+def search_new_uids(conn, last_uid: int) -> list[int]:
+    # "UID n:*" always matches the newest message even when its UID < n, so filter
+    return [u for u in search_uids(conn, f"UID {last_uid + 1}:*") if u > last_uid]
+
+
+# ----------------- FETCH RESPONSE PARSER -----------------
+
+class _Literal(bytes):
+    # Marks a {N} literal so the tokenizer never re-scans its content
+    pass
+
+
+def _segments(data):
+    # imaplib returns FETCH data as a mix of (line_with_literal_marker, literal)
+    # tuples and plain trailer lines; flatten into text/literal segments.
+    for item in data or []:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            head, literal = item[0], item[1]
+            yield _LITERAL_RE.sub(b"", head)
+            yield _Literal(literal or b"")
+        else:
+            yield item
+
+
+def _tokenize(data):
+    for seg in _segments(data):
+        if isinstance(seg, _Literal):
+            yield seg
+            continue
+        i, n = 0, len(seg)
+        while i < n:
+            c = seg[i:i + 1]
+            if c in b" \r\n\t":
+                i += 1
+            elif c in b"()":
+                yield c
+                i += 1
+            elif c == b'"':
+                j = i + 1
+                buf = bytearray()
+                while j < n and seg[j:j + 1] != b'"':
+                    if seg[j:j + 1] == b"\\" and j + 1 < n:
+                        j += 1
+                    buf += seg[j:j + 1]
+                    j += 1
+                yield _Literal(bytes(buf))
+                i = j + 1
+            else:
+                # Atom; section specs like BODY[HEADER.FIELDS (FROM)]<0> may contain spaces/parens
+                j = i
+                depth = 0
+                while j < n:
+                    ch = seg[j:j + 1]
+                    if ch in b"[<":
+                        depth += 1
+                    elif ch in b"]>":
+                        depth -= 1
+                    elif depth == 0 and ch in b" ()\r\n\t":
+                        break
+                    j += 1
+                yield seg[i:j]
+                i = j
+
+
+def _parse_value(tokens, tok):
+    if tok == b"(":
+        out = []
+        for t in tokens:
+            if t == b")":
+                return out
+            out.append(_parse_value(tokens, t))
+        return out
+    if isinstance(tok, _Literal):
+        return bytes(tok)
+    if tok.upper() == b"NIL":
+        return None
+    return tok
+
+
+def parse_fetch_response(data):
+    # Returns [(seq, {ITEM_NAME: value})] for every FETCH response in `data`.
+    # Item names are upper-cased str (e.g. "RFC822", "UID", "BODY[1]<0>");
+    # lists become Python lists, literals and strings become bytes, NIL is None.
+    results = []
+    tokens = _tokenize(data)
+    for tok in tokens:
+        if isinstance(tok, _Literal) or not tok.isdigit():
+            continue
+        seq = int(tok)
+        start = next(tokens, None)
+        if start != b"(":
+            continue
+        items = _parse_value(tokens, start)
+        fields = {}
+        for k in range(0, len(items) - 1, 2):
+            name = items[k]
+            if isinstance(name, bytes):
+                fields[name.decode(errors="ignore").upper()] = items[k + 1]
+        results.append((seq, fields))
+    return results
+
+
+# ----------------- ENVELOPE / BODYSTRUCTURE -----------------
+
+# ENVELOPE has In-Reply-To but not References, which threading also needs
+REFERENCES_ITEM = "BODY.PEEK[HEADER.FIELDS (REFERENCES)]"
+ENVELOPE_ITEMS = f"(UID RFC822.SIZE ENVELOPE BODYSTRUCTURE {REFERENCES_ITEM})"
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="ignore")
+    return str(value)
+
+
+def _format_addresses(addrs) -> str:
+    # ENVELOPE address: (name adl mailbox host)
+    out = []
+    for addr in addrs or []:
+        if not isinstance(addr, list) or len(addr) < 4:
+            continue
+        name, mailbox, host = _text(addr[0]), _text(addr[2]), _text(addr[3])
+        address = f"{mailbox}@{host}" if host else mailbox
+        out.append(f"{name} <{address}>" if name else address)
+    return ", ".join(out)
+
+
+def parse_envelope(env) -> dict:
+    # Header values are returned undecoded (RFC 2047 words intact)
+    env = list(env or []) + [None] * 10
+    return {
+        "date": _text(env[0]),
+        "subject": _text(env[1]),
+        "from": _format_addresses(env[2]),
+        "reply_to": _format_addresses(env[4]),
+        "to": _format_addresses(env[5]),
+        "in_reply_to": _text(env[8]),
+        "message_id": _text(env[9]),
+    }
+
+
+def header_field(fields: dict) -> str:
+    # Unfolded value of the header fetched with BODY[HEADER.FIELDS (NAME)]
+    # ("" when the message has none or the server left it out)
+    for name, value in fields.items():
+        if name.startswith("BODY[HEADER.FIELDS") and value:
+            text = " ".join(_text(value).split())
+            return text.partition(":")[2].strip()
+    return ""
+
+
+def _params(value) -> dict:
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]).lower(): _text(value[i + 1]) for i in range(0, len(value) - 1, 2)}
+
+
+def iter_body_parts(bs, section: str = ""):
+    # Walk a parsed BODYSTRUCTURE and yield one dict per leaf part with its
+    # IMAP section number ("1", "2.1", ...), content type, encoding and size.
+    if not isinstance(bs, list) or not bs:
+        return
+    if isinstance(bs[0], list):
+        n = 0
+        for child in bs:
+            if not isinstance(child, list):
+                break
+            n += 1
+            yield from iter_body_parts(child, f"{section}.{n}" if section else str(n))
+        return
+
+    ctype = _text(bs[0]).lower()
+    subtype = _text(bs[1]).lower() if len(bs) > 1 else ""
+    try:
+        size = int(bs[6]) if len(bs) > 6 and bs[6] is not None else 0
+    except (TypeError, ValueError):
+        size = 0
+
+    # Extension data (md5, disposition, ...) follows the type-specific fields
+    ext_start = 7
+    if ctype == "text":
+        ext_start = 8
+    elif ctype == "message" and subtype == "rfc822":
+        ext_start = 10
+    disposition, disp_params = "", {}
+    if len(bs) > ext_start + 1 and isinstance(bs[ext_start + 1], list) and bs[ext_start + 1]:
+        disposition = _text(bs[ext_start + 1][0]).lower()
+        disp_params = _params(bs[ext_start + 1][1] if len(bs[ext_start + 1]) > 1 else None)
+
+    params = _params(bs[2] if len(bs) > 2 else None)
+    yield {
+        "section": section or "1",
+        "type": f"{ctype}/{subtype}",
+        "charset": params.get("charset", ""),
+        "encoding": _text(bs[5]).lower() if len(bs) > 5 else "",
+        "size": size,
+        "disposition": disposition,
+        "filename": disp_params.get("filename") or params.get("name", ""),
+    }
+
+
+def attachment_parts(bs) -> list[dict]:
+    return [p for p in iter_body_parts(bs) if p["disposition"] == "attachment"]
+
+
+def find_text_part(bs) -> dict | None:
+    # Same choice as extract_body: first text/plain part that is not an attachment
+    for part in iter_body_parts(bs):
+        if part["type"] == "text/plain" and part["disposition"] != "attachment":
+            return part
+    return None
+
+
+# ----------------- BATCHED FETCH -----------------
+
+class FetchStats:
+    def __init__(self):
+        self.messages = 0
+        self.commands = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.messages / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.messages} msgs in {self.elapsed:.2f}s "
+                f"({self.rate:.1f} msg/s, {self.commands} FETCH)")
+
+
+def _response_bytes(data) -> int:
+    return sum(len(item[0]) + len(item[1] or b"") if isinstance(item, tuple) else len(item or b"")
+               for item in data or [])
+
+
+def iter_fetch(conn, ids, items: str = "(RFC822)", chunk_size: int = FETCH_CHUNK_SIZE,
+               use_uid: bool = False, stats: FetchStats | None = None):
+    # Fetch `ids` in chunks of `chunk_size` using one FETCH per chunk and yield
+    # (id, fields) in the order `ids` was given, as each chunk arrives.
+    # With use_uid=True `ids` are UIDs and UID FETCH is used.
+    ids = [i.decode() if isinstance(i, bytes) else str(i) for i in ids]
+    for chunk in chunked(ids, chunk_size):
+        seq_set = build_sequence_set(chunk)
+        with timed("imap_fetch"):
+            if use_uid:
+                status, data = conn.uid("FETCH", seq_set, items)
+            else:
+                status, data = conn.fetch(seq_set, items)
+            if status != "OK":
+                raise RuntimeError("IMAP fetch failed")
+        METRICS.inc("bytes_total", _response_bytes(data), stage="imap_fetch", direction="in")
+
+        by_id = {}
+        for seq, fields in parse_fetch_response(data):
+            key = fields.get("UID") if use_uid else seq
+            if key is None:
+                continue
+            key = key.decode() if isinstance(key, bytes) else str(key)
+            by_id.setdefault(key, {}).update(fields)
+
+        if stats is not None:
+            stats.commands += 1
+
+        for msg_id in chunk:
+            fields = by_id.get(msg_id)
+            if not fields:
+                continue
+            if stats is not None:
+                stats.messages += 1
+                stats.bytes += sum(len(v) for v in fields.values() if isinstance(v, bytes))
+                stats.elapsed = time.perf_counter() - stats.started
+            yield msg_id, fields
+
+
+# ----------------- PARTIAL TEXT FETCH -----------------
+
+def decode_part(data: bytes, encoding: str = "", charset: str = "") -> str:
+    # Decode a (possibly truncated) body part; incomplete trailing units are dropped
+    data = data or b""
+    encoding = (encoding or "").lower()
+    try:
+        if encoding == "base64":
+            compact = re.sub(rb"[^A-Za-z0-9+/=]", b"", data)
+            compact = compact[:len(compact) - len(compact) % 4]
+            data = base64.b64decode(compact)
+        elif encoding == "quoted-printable":
+            data = quopri.decodestring(re.sub(rb"=[0-9A-Fa-f]?$", b"", data))
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return data.decode(charset or "utf-8", errors="ignore")
+    except LookupError:
+        return data.decode("utf-8", errors="ignore")
+
+
+def iter_text_prefixes(conn, parts: dict, max_bytes: int = CLASSIFY_BYTES,
+                       chunk_size: int = FETCH_CHUNK_SIZE, stats: FetchStats | None = None):
+    # parts: {uid: text part dict from find_text_part (or None)}. Fetches only the
+    # first `max_bytes` of each text part with BODY.PEEK[section]<0.max_bytes>
+    # (one UID FETCH per section/chunk, \Seen untouched) and yields (uid, text).
+    by_section = {}
+    for uid, part in parts.items():
+        if part is None:
+            yield uid, ""
+            continue
+        by_section.setdefault(part["section"], []).append(uid)
+
+    for section, uids in by_section.items():
+        items = f"(BODY.PEEK[{section}]<0.{int(max_bytes)}>)"
+        for uid, fields in iter_fetch(conn, uids, items, chunk_size=chunk_size,
+                                      use_uid=True, stats=stats):
+            data = next((v for k, v in fields.items() if k.startswith(f"BODY[{section}]")), b"")
+            part = parts[uid]
+            yield uid, decode_part(data, part["encoding"], part["charset"])
@@ -0,0 +1,174 @@
+import re
+import ssl
+import time
+import select
+import imaplib
+import threading
+import traceback
+
+from metrics import METRICS, instrumented
+
+# ----------------- CONSTANTS -----------------
+
+IDLE_RENEW_SEC = 25 * 60  # re-issue IDLE well before the server's 29-minute cutoff
+POLL_FALLBACK_SEC = 5 * 60  # poll interval when the server has no IDLE
+WAKE_CHECK_SEC = 1.0  # how often a waiting IDLE checks for stop()
+RECONNECT_MAX_SEC = 60
+
+_MAILBOX_CHANGE_RE = re.compile(rb"^\* \d+ (EXISTS|RECENT)\b", re.IGNORECASE)
+
+
+@instrumented("imap_connect")
+def connect_imap(host: str, port: int, use_ssl: bool, user: str, password: str):
+    conn = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
+    conn.login(user, password)
+    return conn
+
+
+def supports_idle(conn) -> bool:
+    return "IDLE" in getattr(conn, "capabilities", ())
+
+
+# ----------------- IDLE WATCHER -----------------
+
+class IdleWatcher:
+    # Keeps a dedicated IMAP connection in IDLE on one folder and calls
+    # on_new() whenever the server reports EXISTS/RECENT. Falls back to calling
+    # on_new() every poll_sec when the server lacks the IDLE capability.
+    # on_status(text) receives human-readable state changes.
+
+    def __init__(self, connect, on_new, folder: str = "INBOX", on_status=None,
+                 renew_sec: int = IDLE_RENEW_SEC, poll_sec: int = POLL_FALLBACK_SEC):
+        self.connect = connect
+        self.on_new = on_new
+        self.on_status = on_status or (lambda text: None)
+        self.folder = folder
+        self.renew_sec = renew_sec
+        self.poll_sec = poll_sec
+        self.mode = None  # "idle" or "poll" once connected
+        self.wakeups = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+        self._tag_n = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        backoff = 5
+        while not self._stop.is_set():
+            try:
+                self._conn = self.connect()
+                status, _ = self._conn.select(self.folder, readonly=True)
+                if status != "OK":
+                    raise RuntimeError(f"IMAP select {self.folder} failed")
+                backoff = 5
+                if supports_idle(self._conn):
+                    self.mode = "idle"
+                    self.on_status("Push: waiting for new mail (IDLE).")
+                    self._idle_loop()
+                else:
+                    self.mode = "poll"
+                    self.on_status(f"Push: server has no IDLE, polling every {self.poll_sec // 60 or 1} min.")
+                    self._poll_loop()
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                traceback.print_exc()
+                METRICS.inc("retries_total", stage="imap_idle")
+                self.on_status(f"Push: connection lost ({e}); retrying in {backoff}s.")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SEC)
+            finally:
+                self._close()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_sec):
+            self._conn.noop()
+            self._notify()
+
+    def _idle_loop(self):
+        while not self._stop.is_set():
+            changed = self._idle_once()
+            if changed:
+                self._notify()
+
+    def _idle_once(self) -> bool:
+        # One IDLE ... DONE round; returns True if the mailbox changed
+        conn = self._conn
+        self._tag_n += 1
+        tag = f"IDL{self._tag_n}".encode()
+        conn.send(tag + b" IDLE\r\n")
+        line = conn.readline()
+        if not line.startswith(b"+"):
+            raise RuntimeError(f"IDLE rejected: {line.strip()!r}")
+
+        deadline = time.monotonic() + self.renew_sec
+        lines = []
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            if self._readable(min(WAKE_CHECK_SEC, max(0.0, deadline - time.monotonic()))):
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                lines.append(line)
+                break  # any untagged update ends this round; the rest is drained below
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            if line.startswith(tag + b" "):
+                break
+            lines.append(line)
+        return any(_MAILBOX_CHANGE_RE.match(ln) for ln in lines)
+
+    def _readable(self, timeout: float) -> bool:
+        if self._buffered():
+            return True
+        r, _, _ = select.select([self._conn.sock], [], [], timeout)
+        return bool(r)
+
+    def _buffered(self) -> bool:
+        # imaplib reads lines through conn.file, which may already hold the
+        # next line (e.g. "* 3 EXISTS" sent in the same packet as "+ idling");
+        # select() on the socket cannot see that. A non-blocking peek returns
+        # buffered bytes, and also pulls in whatever the socket or the TLS
+        # layer already has, without waiting.
+        sock = self._conn.sock
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            return bool(self._conn.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def _notify(self):
+        self.wakeups += 1
+        try:
+            self.on_new()
+        except Exception:
+            traceback.print_exc()
+
+    def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.logout()
+        except Exception:
+            pass
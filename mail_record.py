@@ -0,0 +1,156 @@
+import os
+import tempfile
+import threading
+
+# ----------------- BODY STORE -----------------
+
+class BodyStore:
+    # Append-only spill file for message text. put() writes UTF-8 text at the end
+    # and returns an (offset, length) reference; get() reads it back. Loaded
+    # records keep only the reference, so list memory does not grow with
+    # mailbox text. Text that is already in the file (a mailbox reloaded from
+    # the store, search results, a body set again) gets its earlier reference,
+    # so the file grows with distinct text only. The file is an unnamed
+    # temporary file in `folder`, private to this process and gone when it is
+    # closed or the process exits (the SQLite message store is what persists
+    # bodies), so several instances can share a data directory.
+
+    def __init__(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._f = tempfile.TemporaryFile(dir=folder, prefix="bodies-", suffix=".spill")
+        self._end = 0
+        self._refs = {}  # hash of the bytes -> reference of the latest text with that hash
+        self.reads = 0
+        self.reused = 0  # put()s answered with an existing reference
+
+    def put(self, text: str) -> tuple[int, int]:
+        data = text.encode("utf-8")
+        key = hash(data)
+        with self._lock:
+            ref = self._refs.get(key)
+            # Compared byte for byte, so a hash collision only costs a read
+            if ref is not None and ref[1] == len(data) and self._read(ref) == data:
+                self.reused += 1
+                return ref
+            ref = (self._end, len(data))
+            self._f.seek(self._end)
+            self._f.write(data)
+            self._end += len(data)
+            self._refs[key] = ref
+        return ref
+
+    def _read(self, ref: tuple[int, int]) -> bytes:
+        offset, length = ref
+        self._f.flush()
+        self._f.seek(offset)
+        return self._f.read(length)
+
+    def get(self, ref: tuple[int, int]) -> str:
+        with self._lock:
+            data = self._read(ref)
+            self.reads += 1
+        return data.decode("utf-8")
+
+    @property
+    def size(self) -> int:
+        return self._end
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+# ----------------- COMPACT RECORD -----------------
+
+# Mapping keys -> slot names ("from" is a keyword)
+_FIELDS = {
+    "uid": "uid", "subject": "subject", "from": "sender", "date": "date", "message_id": "message_id",
+    "in_reply_to": "in_reply_to", "references": "references",
+    "category": "category", "urgent": "urgent", "replied": "replied", "attachments": "attachments",
+    "attachment_count": "attachment_count", "size": "size", "account": "account", "folder": "folder",
+    "uidvalidity": "uidvalidity", "store_id": "store_id", "loaded": "loaded", "text_part": "text_part",
+}
+_SPILLED = {"body": "_body", "preview": "_preview"}  # text kept in the BodyStore
+
+
+class MailRecord:
+    # Slots-based stand-in for the mail dicts used by the list, dashboard and
+    # reply code. It supports the dict operations they use (m[key], m.get,
+    # m.update, `key in m`), so it is a drop-in replacement. "body" and
+    # "preview" live in a BodyStore and are read from disk only when accessed
+    # (opening a message, classification). Unset slots behave like missing keys.
+
+    __slots__ = tuple(_FIELDS.values()) + tuple(_SPILLED.values()) + ("_bodies", "_extra")
+
+    def __init__(self, bodies: BodyStore, fields: dict | None = None):
+        self._bodies = bodies
+        self._body = None
+        self._preview = None
+        self._extra = None
+        if fields:
+            self.update(fields)
+
+    @classmethod
+    def from_dict(cls, mail: dict, bodies: BodyStore) -> "MailRecord":
+        return mail if isinstance(mail, cls) else cls(bodies, mail)
+
+    def __getitem__(self, key):
+        spilled = _SPILLED.get(key)
+        if spilled is not None:
+            ref = getattr(self, spilled)
+            return ref if ref is None or isinstance(ref, str) else self._bodies.get(ref)
+        slot = _FIELDS.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        spilled = _SPILLED.get(key)
+        if spilled is not None:
+            # Empty text costs nothing inline; anything else goes to disk
+            setattr(self, spilled, value if not value else self._bodies.put(value))
+        elif key in _FIELDS:
+            if key == "attachments":
+                value = tuple(value or ())
+            setattr(self, _FIELDS[key], value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key) -> bool:
+        if key in _SPILLED:
+            return True  # None until known, like the dicts; no disk read
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, other=(), **fields):
+        items = other.items() if hasattr(other, "items") else other
+        for key, value in items:
+            self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+
+    def keys(self) -> list:
+        return [k for k in list(_FIELDS) + list(_SPILLED) + list(self._extra or ()) if k in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self) -> str:
+        return f"MailRecord(uid={self.get('uid')!r}, subject={self.get('subject')!r})"
@@ -0,0 +1,184 @@
+import os
+import json
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+# ----------------- LOADED-LIST COUNTERS -----------------
+
+class MailStats:
+    # Running totals (loaded, replied, urgent, per category) over the loaded
+    # mail dicts. Changes go through add()/update() so each one costs O(1)
+    # instead of a rescan of the list; reset() is the only O(n) operation and
+    # is meant for when the whole list is replaced. Listeners are called
+    # (without arguments) after every change. Safe to share between threads.
+
+    def __init__(self, categories=()):
+        self.categories = list(categories)
+        self._lock = threading.Lock()
+        self._counted = {}  # id(mail) -> (mail, category, urgent, replied) as counted
+        self._listeners = []
+        self._clear()
+
+    def _clear(self):
+        self._counted.clear()
+        self.total = 0
+        self.replied = 0
+        self.urgent = 0
+        self.by_category = {c: 0 for c in self.categories}
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def _notify(self):
+        for fn in self._listeners:
+            fn()
+
+    def _count(self, mail: dict, sign: int):
+        # Caller holds the lock
+        if sign > 0:
+            state = (mail, mail.get("category", "Other"), bool(mail.get("urgent")), bool(mail.get("replied")))
+            self._counted[id(mail)] = state
+        else:
+            state = self._counted.pop(id(mail))
+        _, category, urgent, replied = state
+        self.total += sign
+        self.replied += sign * replied
+        self.urgent += sign * urgent
+        self.by_category[category] = self.by_category.get(category, 0) + sign
+
+    def reset(self, mails=()):
+        with self._lock:
+            self._clear()
+            for mail in mails:
+                if id(mail) not in self._counted:
+                    self._count(mail, 1)
+        self._notify()
+
+    def add(self, mails):
+        with self._lock:
+            for mail in mails:
+                if id(mail) not in self._counted:
+                    self._count(mail, 1)
+        self._notify()
+
+    def update(self, mail: dict, **fields):
+        # Set fields on `mail` and adjust the counters if it is in the loaded list
+        # (search results from the store may not be)
+        with self._lock:
+            tracked = id(mail) in self._counted
+            if tracked:
+                self._count(mail, -1)
+            mail.update(fields)
+            if tracked:
+                self._count(mail, 1)
+        if tracked:
+            self._notify()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"total": self.total, "replied": self.replied, "urgent": self.urgent,
+                    "categories": dict(self.by_category)}
+
+
+# ----------------- PERSISTED REPLY HISTORY -----------------
+
+def reply_latency(mail: dict, replied_at: datetime | None = None) -> float | None:
+    # Seconds between the message's Date header and the reply, None if unknown
+    try:
+        received = parsedate_to_datetime(mail.get("date") or "")
+    except (TypeError, ValueError, IndexError):
+        return None
+    if received is None:
+        return None
+    if received.tzinfo is None:
+        received = received.replace(tzinfo=timezone.utc)
+    latency = ((replied_at or datetime.now(timezone.utc)) - received).total_seconds()
+    return latency if latency >= 0 else None
+
+
+class ReplyHistory:
+    # Long-term reply aggregates per day, persisted as JSON so the dashboard can
+    # show them without reading the reply log:
+    #   {"YYYY-MM-DD": {"replied": n, "urgent": n, "categories": {cat: n},
+    #                   "latency_sum": seconds, "latency_count": n}}
+    # Days are local dates, like the log timestamps.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._days = {}
+        self._listeners = []
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._days = data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            self._days = {}
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._days, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def record(self, mail: dict, replied_at: datetime | None = None):
+        replied_at = replied_at or datetime.now().astimezone()
+        latency = reply_latency(mail, replied_at)
+        day_key = replied_at.strftime("%Y-%m-%d")
+        with self._lock:
+            day = self._days.setdefault(day_key, {"replied": 0, "urgent": 0, "categories": {},
+                                                  "latency_sum": 0.0, "latency_count": 0})
+            day["replied"] += 1
+            day["urgent"] += int(bool(mail.get("urgent")))
+            cat = mail.get("category", "Other")
+            day["categories"][cat] = day["categories"].get(cat, 0) + 1
+            if latency is not None:
+                day["latency_sum"] += latency
+                day["latency_count"] += 1
+        self.save()
+        for fn in self._listeners:
+            fn()
+
+    def totals(self, since: str | None = None) -> dict:
+        # Sums over all days (or days >= since, "YYYY-MM-DD"); avg_latency in seconds or None
+        replied = urgent = latency_count = 0
+        latency_sum = 0.0
+        categories = {}
+        with self._lock:
+            for day_key, day in self._days.items():
+                if since is not None and day_key < since:
+                    continue
+                replied += day.get("replied", 0)
+                urgent += day.get("urgent", 0)
+                latency_sum += day.get("latency_sum", 0.0)
+                latency_count += day.get("latency_count", 0)
+                for cat, n in day.get("categories", {}).items():
+                    categories[cat] = categories.get(cat, 0) + n
+        return {"replied": replied, "urgent": urgent, "categories": categories,
+                "avg_latency": latency_sum / latency_count if latency_count else None}
+
+    def days(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._days))
+
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "n/a"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} d"
@@ -0,0 +1,169 @@
+import os
+import email
+import email.message
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email.header import decode_header
+
+from attachment_store import AttachmentStore
+from classifier import classify_email
+from metrics import METRICS, instrumented, timed
+
+# ----------------- CONSTANTS -----------------
+
+ATTACH_DIR = "attachments"
+MAX_BODY_CHARS = 200_000  # body text kept per parsed record
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+POOL_MIN_MESSAGES = 200  # smaller batches are parsed inline (pool start-up costs more)
+
+
+# ----------------- PARSING -----------------
+
+@instrumented("decode_str")
+def decode_str(s):
+    if not s:
+        return ""
+    parts = decode_header(s)
+    out = []
+    for text, enc in parts:
+        if isinstance(text, bytes):
+            try:
+                out.append(text.decode(enc or "utf-8", errors="ignore"))
+            except Exception:
+                out.append(text.decode("utf-8", errors="ignore"))
+        else:
+            out.append(text)
+    return " ".join(out)
+
+
+@instrumented("extract_body")
+def extract_body(msg: email.message.Message):
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            disp = (part.get("Content-Disposition") or "").lower()
+            if ctype == "text/plain" and "attachment" not in disp:
+                try:
+                    return part.get_payload(decode=True).decode(errors="ignore")
+                except Exception:
+                    continue
+    else:
+        if msg.get_content_type() == "text/plain":
+            try:
+                return msg.get_payload(decode=True).decode(errors="ignore")
+            except Exception:
+                pass
+    return ""
+
+
+@instrumented("save_attachments")
+def save_attachments(msg: email.message.Message, uid: str, attach_dir: str = ATTACH_DIR,
+                     mailbox: tuple | None = None):
+    # Attachments are streamed into the content-addressed store; returns blob paths.
+    # mailbox: (account, folder, uidvalidity) of the UID, part of the manifest name
+    parts = []
+    if msg.is_multipart():
+        for part in msg.walk():
+            disp = (part.get("Content-Disposition") or "").lower()
+            if "attachment" in disp:
+                filename = part.get_filename()
+                parts.append((decode_str(filename) if filename else "", part))
+    if not parts:
+        return []
+    entries = AttachmentStore(attach_dir).save_message(uid, parts, mailbox)
+    METRICS.inc("bytes_total", sum(e.get("size", 0) for e in entries), stage="save_attachments", direction="out")
+    return [e["path"] for e in entries]
+
+
+def parse_record(uid: str, raw: bytes, max_body: int = MAX_BODY_CHARS,
+                 attach_dir: str = ATTACH_DIR, mailbox: tuple | None = None) -> dict:
+    # Raw RFC822 bytes -> compact, picklable record (runs in pool workers)
+    with timed("message_from_bytes"):
+        msg = email.message_from_bytes(raw)
+    METRICS.inc("bytes_total", len(raw), stage="message_from_bytes", direction="in")
+    subject = decode_str(msg.get("Subject", ""))
+    body = extract_body(msg)[:max_body]
+    category, urgent = classify_email(subject, body)
+    attach_paths = save_attachments(msg, uid, attach_dir, mailbox)
+    return {
+        "uid": uid,
+        "subject": subject,
+        "from": decode_str(msg.get("From", "")),
+        "date": decode_str(msg.get("Date", "")),
+        "message_id": str(msg.get("Message-ID", "")).strip(),
+        "in_reply_to": str(msg.get("In-Reply-To", "")).strip(),
+        "references": " ".join(str(msg.get("References", "")).split()),
+        "body": body,
+        "size": len(raw),
+        "category": category,
+        "urgent": urgent,
+        "attachments": attach_paths,
+        "attachment_count": len(attach_paths),
+    }
+
+
+def _init_worker():
+    # A forked worker starts with a copy of the parent's METRICS; drop it so
+    # drain() only sends back what the worker measured itself. (A module
+    # function, not METRICS.reset, so spawn/forkserver can pickle it.)
+    METRICS.reset()
+
+
+def _parse_args(args):
+    # Runs in a worker process: its metrics travel back with the record
+    return parse_record(*args), METRICS.drain()
+
+
+def _merged(result):
+    record, delta = result
+    METRICS.merge(delta)
+    return record
+
+
+# ----------------- PROCESS POOL PIPELINE -----------------
+
+class ParsePipeline:
+    # Parses (uid, raw) pairs in a process pool and yields records in input order.
+    # Input is consumed lazily with a bounded number of jobs in flight, so parsing
+    # overlaps with the network fetch that produces it.
+
+    def __init__(self, workers: int = PARSE_WORKERS, min_batch: int = POOL_MIN_MESSAGES,
+                 max_body: int = MAX_BODY_CHARS, attach_dir: str = ATTACH_DIR):
+        self.workers = max(1, int(workers))
+        self.min_batch = min_batch
+        self.max_body = max_body
+        self.attach_dir = attach_dir
+        self._pool = None
+        self._lock = threading.Lock()  # imap() may run from several sync threads
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            return self._pool
+
+    def imap(self, items, expected: int | None = None, mailbox: tuple | None = None):
+        # items: iterable of (uid, raw); expected: message count if known, used to
+        # skip the pool for small batches; mailbox: (account, folder, uidvalidity)
+        # the UIDs belong to
+        if self.workers <= 1 or (expected is not None and expected < self.min_batch):
+            for uid, raw in items:
+                yield parse_record(uid, raw, self.max_body, self.attach_dir, mailbox)
+            return
+
+        pool = self._executor()
+        pending = deque()
+        max_inflight = self.workers * 4
+        for uid, raw in items:
+            pending.append(pool.submit(_parse_args, (uid, raw, self.max_body, self.attach_dir, mailbox)))
+            while len(pending) >= max_inflight:
+                yield _merged(pending.popleft().result())
+        while pending:
+            yield _merged(pending.popleft().result())
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,289 @@
+import re
+import sqlite3
+import threading
+
+# ----------------- CONSTANTS -----------------
+
+STORE_BODY_CHARS = 20_000  # body text kept per stored message
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL DEFAULT 0,
+    uid INTEGER NOT NULL,
+    subject TEXT NOT NULL DEFAULT '',
+    sender TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    body TEXT,
+    body_partial INTEGER NOT NULL DEFAULT 0,
+    category TEXT NOT NULL DEFAULT 'Unclassified',
+    urgent INTEGER NOT NULL DEFAULT 0,
+    replied INTEGER NOT NULL DEFAULT 0,
+    attachment_count INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    message_id TEXT NOT NULL DEFAULT '',
+    in_reply_to TEXT NOT NULL DEFAULT '',
+    refs TEXT NOT NULL DEFAULT '',
+    UNIQUE (account, folder, uidvalidity, uid)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, body, content='messages', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, subject, sender, body)
+    VALUES (new.id, new.subject, new.sender, new.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.id, old.subject, old.sender, old.body);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF subject, sender, body ON messages
+WHEN old.subject IS NOT new.subject OR old.sender IS NOT new.sender OR old.body IS NOT new.body
+BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, subject, sender, body)
+    VALUES ('delete', old.id, old.subject, old.sender, old.body);
+    INSERT INTO messages_fts(rowid, subject, sender, body)
+    VALUES (new.id, new.subject, new.sender, new.body);
+END;
+"""
+
+# Columns added after the first release: (name, declaration) for ALTER TABLE
+_MIGRATIONS = [
+    ("message_id", "TEXT NOT NULL DEFAULT ''"),
+    ("in_reply_to", "TEXT NOT NULL DEFAULT ''"),
+    ("refs", "TEXT NOT NULL DEFAULT ''"),
+]
+
+# Re-fetching never downgrades what we already know about a message
+_UPSERT = """
+INSERT INTO messages (account, folder, uidvalidity, uid, subject, sender, date, body,
+                      body_partial, category, urgent, replied, attachment_count, size, message_id,
+                      in_reply_to, refs)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (account, folder, uidvalidity, uid) DO UPDATE SET
+    subject = excluded.subject,
+    sender = excluded.sender,
+    date = excluded.date,
+    body_partial = CASE WHEN length(coalesce(excluded.body, '')) >= length(coalesce(body, ''))
+                        THEN excluded.body_partial ELSE body_partial END,
+    body = CASE WHEN length(coalesce(excluded.body, '')) >= length(coalesce(body, ''))
+                THEN excluded.body ELSE body END,
+    category = CASE WHEN excluded.category = 'Unclassified' THEN category ELSE excluded.category END,
+    urgent = CASE WHEN excluded.category = 'Unclassified' THEN urgent ELSE excluded.urgent END,
+    replied = max(replied, excluded.replied),
+    attachment_count = max(attachment_count, excluded.attachment_count),
+    size = max(size, excluded.size),
+    message_id = CASE WHEN excluded.message_id = '' THEN message_id ELSE excluded.message_id END,
+    in_reply_to = CASE WHEN excluded.in_reply_to = '' THEN in_reply_to ELSE excluded.in_reply_to END,
+    refs = CASE WHEN excluded.refs = '' THEN refs ELSE excluded.refs END
+"""
+
+_COLUMNS = ("id, account, folder, uidvalidity, uid, subject, sender, date, body, body_partial, category, urgent, replied, "
+            "attachment_count, size, message_id, in_reply_to, refs")
+
+_UPDATABLE = {"category", "urgent", "replied", "body", "attachment_count"}
+
+
+def _fts_query(text: str) -> str:
+    # User text -> safe FTS5 query: every word must match, as a prefix
+    terms = re.findall(r"\w+", text or "")
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+# ----------------- STORE -----------------
+
+class MessageStore:
+    # Persistent message metadata + bounded body text (SQLite, WAL) with an FTS5
+    # index over subject/from/body. Safe to share between threads.
+
+    def __init__(self, path: str, body_chars: int = STORE_BODY_CHARS):
+        self.path = path
+        self.body_chars = body_chars
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        have = {row["name"] for row in self._db.execute("PRAGMA table_info(messages)")}
+        with self._db:
+            for name, decl in _MIGRATIONS:
+                if name not in have:
+                    self._db.execute(f"ALTER TABLE messages ADD COLUMN {name} {decl}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _bounded(self, text: str | None, partial: bool = False):
+        # (stored text, partial flag); truncated bodies count as partial
+        if text is None:
+            return None, 0
+        return text[:self.body_chars], int(partial or len(text) > self.body_chars)
+
+    @staticmethod
+    def _row_to_mail(row) -> dict:
+        # Partial text (preview or truncated body) is exposed as "preview" so the
+        # full body is still fetched when the message is opened
+        partial = bool(row["body_partial"])
+        return {
+            "store_id": row["id"],
+            "account": row["account"],
+            "folder": row["folder"],
+            "uidvalidity": row["uidvalidity"] or None,
+            "uid": str(row["uid"]),
+            "subject": row["subject"],
+            "from": row["sender"],
+            "date": row["date"],
+            "body": None if partial else row["body"],
+            "preview": row["body"] if partial else None,
+            "category": row["category"],
+            "urgent": bool(row["urgent"]),
+            "attachments": [],
+            "attachment_count": row["attachment_count"],
+            "size": row["size"],
+            "message_id": row["message_id"],
+            "in_reply_to": row["in_reply_to"],
+            "references": row["refs"],
+            "loaded": row["body"] is not None and not partial,
+            "replied": bool(row["replied"]),
+        }
+
+    def upsert_many(self, account: str, folder: str, uidvalidity: int | None, mails: list):
+        # One transaction per batch; sets mail["store_id"] on every mail
+        if not mails:
+            return
+        key = ((account or "").lower(), folder, uidvalidity or 0)
+        rows = []
+        for m in mails:
+            if m.get("body") is not None:
+                body, partial = self._bounded(m["body"])
+            else:
+                body, partial = self._bounded(m.get("preview"), partial=True)
+            rows.append(key + (
+                int(m["uid"]), m.get("subject", ""), m.get("from", ""), m.get("date", ""),
+                body, partial, m.get("category", "Unclassified"), int(bool(m.get("urgent"))),
+                int(bool(m.get("replied"))), int(m.get("attachment_count", 0)), int(m.get("size", 0)),
+                m.get("message_id") or "", m.get("in_reply_to") or "", m.get("references") or "",
+            ))
+        with self._lock, self._db:
+            self._db.executemany(_UPSERT, rows)
+            ids = {}
+            uids = [r[3] for r in rows]
+            for i in range(0, len(uids), 500):
+                part = uids[i:i + 500]
+                cur = self._db.execute(
+                    f"SELECT uid, id FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ? "
+                    f"AND uid IN ({','.join('?' * len(part))})", key + tuple(part))
+                ids.update({str(uid): rid for uid, rid in cur})
+        for m in mails:
+            m["store_id"] = ids.get(str(m["uid"]))
+
+    def update_many(self, updates: list):
+        # updates: [(store_id, {"category": ..., "replied": ...}), ...] in one transaction
+        with self._lock, self._db:
+            for store_id, fields in updates:
+                fields = {k: v for k, v in fields.items() if k in _UPDATABLE}
+                if store_id is None or not fields:
+                    continue
+                if "body" in fields:
+                    fields["body"], fields["body_partial"] = self._bounded(fields["body"])
+                cols = ", ".join(f"{k} = ?" for k in fields)
+                values = [int(v) if isinstance(v, bool) else v for v in fields.values()]
+                self._db.execute(f"UPDATE messages SET {cols} WHERE id = ?", values + [store_id])
+
+    def save_previews(self, previews: list):
+        # previews: [(store_id, text)]; only fills rows that have no text yet
+        rows = [(self._bounded(text)[0], sid) for sid, text in previews if sid is not None and text]
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE messages SET body = ?, body_partial = 1 WHERE id = ? AND body IS NULL", rows)
+
+    def update(self, mail: dict, **fields):
+        self.update_many([(mail.get("store_id"), fields)])
+
+    def count(self, account: str | None = None, folder: str | None = None,
+              uidvalidity: int | None = None) -> int:
+        where, args = self._scope(account, folder, uidvalidity)
+        with self._lock:
+            return self._db.execute(f"SELECT count(*) FROM messages {where}", args).fetchone()[0]
+
+    def recent(self, account: str, folder: str, uidvalidity: int | None, limit: int = 100) -> list[dict]:
+        where, args = self._scope(account, folder, uidvalidity)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM messages {where} ORDER BY uid DESC LIMIT ?",
+                args + [limit]).fetchall()
+        return [self._row_to_mail(r) for r in rows]
+
+    def iter_texts(self, batch: int = 1000):
+        # (sender, subject, body or preview text, category) for every stored message
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, sender, subject, coalesce(body, ''), category FROM messages "
+                    "WHERE id > ? ORDER BY id LIMIT ?", (last, batch)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for row in rows:
+                yield tuple(row)[1:]
+
+    def iter_threading(self, batch: int = 5000):
+        # What ThreadIndex needs from every stored message, as mail-like dicts
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, account, folder, uidvalidity, uid, subject, sender, message_id, in_reply_to, refs, "
+                    "category, urgent, replied FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                    (last, batch)).fetchall()
+            if not rows:
+                return
+            last = rows[-1]["id"]
+            for row in rows:
+                yield {
+                    "account": row["account"], "folder": row["folder"], "uidvalidity": row["uidvalidity"] or None,
+                    "uid": str(row["uid"]), "subject": row["subject"], "from": row["sender"],
+                    "message_id": row["message_id"],
+                    "in_reply_to": row["in_reply_to"], "references": row["refs"], "category": row["category"],
+                    "urgent": bool(row["urgent"]), "replied": bool(row["replied"]),
+                }
+
+    def search(self, text: str, account: str | None = None, folder: str | None = None,
+               uidvalidity: int | None = None, limit: int = 200) -> list[dict]:
+        query = _fts_query(text)
+        if not query:
+            return []
+        where, args = self._scope(account, folder, uidvalidity, prefix="m.")
+        where = where.replace("WHERE", "AND", 1)
+        sql = (f"SELECT {', '.join('m.' + c.strip() for c in _COLUMNS.split(','))} "
+               f"FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+               f"WHERE messages_fts MATCH ? {where} ORDER BY messages_fts.rowid DESC LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(sql, [query] + args + [limit]).fetchall()
+        return [self._row_to_mail(r) for r in rows]
+
+    @staticmethod
+    def _scope(account, folder, uidvalidity, prefix=""):
+        clauses, args = [], []
+        if account is not None:
+            clauses.append(f"{prefix}account = ?")
+            args.append(account.lower())
+        if folder is not None:
+            clauses.append(f"{prefix}folder = ?")
+            args.append(folder)
+        if uidvalidity is not None:
+            clauses.append(f"{prefix}uidvalidity = ?")
+            args.append(uidvalidity)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", args
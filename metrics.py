@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import pstats
+import functools
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# ----------------- CONSTANTS -----------------
+
+# Latency histogram bucket bounds (seconds); +Inf is implied
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_EXPORT_SEC = 15  # Exporter interval
+PREFIX = "emailassistant"
+
+
+# ----------------- REGISTRY -----------------
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-quantile (coarse, like Prometheus)
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    # Process-wide stage timings and counters. Timings are histograms keyed by
+    # stage; counters are keyed by (name, labels). Cheap enough to leave on:
+    # one perf_counter pair and a lock per observation. Safe to share between
+    # threads.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}  # stage -> Histogram
+        self._counters = {}  # (name, ((label, value), ...)) -> number
+        self.started = time.time()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            hist = self._hist.get(stage)
+            if hist is None:
+                hist = self._hist[stage] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timer(self, stage: str):
+        # with metrics.timer("stage"): ... -- an exception counts as an error
+        # for the stage (and propagates)
+        return _Timer(self, stage)
+
+    def drain(self) -> dict:
+        # Take everything recorded so far and start empty; merge() adds it to
+        # another registry (how parse-pool workers report to the parent)
+        with self._lock:
+            delta = {"hist": {stage: (h.counts, h.count, h.sum) for stage, h in self._hist.items()},
+                     "counters": self._counters}
+            self._hist = {}
+            self._counters = {}
+        return delta
+
+    def merge(self, delta: dict):
+        with self._lock:
+            for stage, (counts, count, total) in delta["hist"].items():
+                hist = self._hist.get(stage)
+                if hist is None:
+                    hist = self._hist[stage] = Histogram()
+                hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+                hist.count += count
+                hist.sum += total
+            for key, value in delta["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {"count": h.count, "sum_s": h.sum, "avg_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                        "p50_le_s": h.quantile(0.5), "p99_le_s": h.quantile(0.99),
+                        "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts))}
+                for stage, h in sorted(self._hist.items())
+            }
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {"started": self.started, "exported": time.time(), "stages": stages, "counters": counters}
+
+    def prometheus_text(self) -> str:
+        def labels_text(pairs) -> str:
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines = [f"# HELP {PREFIX}_stage_seconds Time spent per stage.",
+                 f"# TYPE {PREFIX}_stage_seconds histogram"]
+        with self._lock:
+            for stage, h in sorted(self._hist.items()):
+                cumulative = 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{_escape(stage)}",le="{bound}"}} '
+                                 f"{cumulative}")
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{_escape(stage)}"}} {h.sum:.6f}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{_escape(stage)}"}} {h.count}')
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(f"{PREFIX}_{name}{labels_text(labels)} {_number(value)}")
+        lines.append(f"# TYPE {PREFIX}_start_time_seconds gauge")
+        lines.append(f"{PREFIX}_start_time_seconds {self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, prom_path: str | None = None, json_path: str | None = None):
+        # Atomic writes, so a scraper never reads a half-written file
+        if prom_path:
+            _write_atomic(prom_path, self.prometheus_text())
+        if json_path:
+            _write_atomic(json_path, json.dumps(self.snapshot(), indent=1))
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "t0")
+
+    def __init__(self, metrics: Metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.t0
+        if exc_type is not None:
+            self.metrics.inc("errors_total", stage=self.stage)
+        self.metrics.observe(self.stage, elapsed)
+        return False
+
+
+def _number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, text: str):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+METRICS = Metrics()  # what the instrumented modules record into
+
+
+def timed(stage: str):
+    return METRICS.timer(stage)
+
+
+def instrumented(stage: str):
+    # Decorator form of timed()
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with METRICS.timer(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# ----------------- EXPORT -----------------
+
+class Exporter:
+    # Writes METRICS to a Prometheus text file (e.g. for node_exporter's
+    # textfile collector) and JSON every `interval` seconds, and once on stop().
+    # A failing export is kept in last_error; on_error(text) is called from the
+    # export thread when it starts failing or fails differently.
+
+    def __init__(self, prom_path: str, json_path: str, interval: float = METRICS_EXPORT_SEC,
+                 metrics: Metrics = METRICS, on_error=None):
+        self.prom_path = prom_path
+        self.json_path = json_path
+        self.interval = interval
+        self.metrics = metrics
+        self.on_error = on_error
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            previous = self.last_error
+            error = self.export()
+            if error and error != previous and self.on_error is not None:
+                self.on_error(error)
+
+    def export(self) -> str | None:
+        # None, or why the files could not be written
+        try:
+            self.metrics.export(self.prom_path, self.json_path)
+            self.last_error = None
+        except OSError as e:
+            self.last_error = f"Metrics export failed: {e}"
+        return self.last_error
+
+    def stop(self) -> str | None:
+        # Final export; returns its error like export()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        return self.export()
+
+
+# ----------------- ON-DEMAND PROFILING -----------------
+
+@contextmanager
+def profiled(name: str, out_dir: str, top: int = 30):
+    # cProfile + tracemalloc around one run (a fetch, a reply, a daemon cycle).
+    # Writes <out_dir>/<name>-<time>.prof (open with pstats/snakeviz) and a .txt
+    # with the top functions by cumulative time and the top allocation sites.
+    # Worker processes of the parse pool are not profiled.
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(10)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield base
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if not tracing:
+            tracemalloc.stop()
+        profiler.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"Profile of {name}; traced memory now {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n\n")
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(top)
+            f.write("\nTop allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:top]:
+                f.write(f"{stat}\n")
@@ -0,0 +1,245 @@
+import time
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from smtp_pool import SendOutcomeUnknown
+
+# ----------------- CONSTANTS -----------------
+
+REPLY_CONCURRENCY = 2  # parallel sends (keep <= SMTP pool size)
+REPLY_RATE_PER_MIN = 30  # sustained sends per minute across all workers
+REPLY_BURST = 5  # sends allowed back-to-back before the rate limit applies
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent (
+    key TEXT PRIMARY KEY,
+    recipient TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL,
+    error TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+);
+"""
+
+
+def reply_key(mail: dict, account: str, folder: str, uidvalidity: int | None) -> str:
+    # Message-ID identifies a message across folders, re-fetches and UIDVALIDITY
+    # changes; the mailbox position is only a fallback for messages without one
+    message_id = (mail.get("message_id") or "").strip()
+    if message_id:
+        return message_id
+    return f"uid:{(account or '').lower()}/{folder}/{uidvalidity or 0}/{mail['uid']}"
+
+
+# ----------------- SENT LEDGER -----------------
+
+class SentLedger:
+    # Persistent record of replies, written before the send ("pending") and after
+    # it ("sent"/"failed"). A key that is pending or sent is never claimed again,
+    # so a crash mid-send errs on the side of not replying twice.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def claim(self, key: str, recipient: str = "") -> bool:
+        # True if the caller may send: the key is new or its last attempt failed
+        with self._lock, self._db:
+            row = self._db.execute("SELECT state FROM sent WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != "failed":
+                return False
+            self._db.execute(
+                "INSERT INTO sent (key, recipient, state, error, updated) VALUES (?, ?, 'pending', '', ?) "
+                "ON CONFLICT (key) DO UPDATE SET recipient = excluded.recipient, state = 'pending', "
+                "error = '', updated = excluded.updated",
+                (key, recipient, time.time()))
+            return True
+
+    def _set(self, key: str, state: str, error: str = ""):
+        with self._lock, self._db:
+            self._db.execute("UPDATE sent SET state = ?, error = ?, updated = ? WHERE key = ?",
+                             (state, error, time.time(), key))
+
+    def mark_sent(self, key: str):
+        self._set(key, "sent")
+
+    def mark_failed(self, key: str, error: str = ""):
+        self._set(key, "failed", error[:500])
+
+    def mark_unknown(self, key: str, error: str = ""):
+        # The send may have gone through: stays pending (never claimed again)
+        self._set(key, "pending", error[:500])
+
+    def mark_error(self, key: str, error: Exception):
+        # After a failed send: retryable unless its outcome is unknown
+        if isinstance(error, SendOutcomeUnknown):
+            self.mark_unknown(key, str(error))
+        else:
+            self.mark_failed(key, str(error))
+
+    def replied(self, keys) -> set:
+        # Keys among `keys` that were sent (or may have been, if left pending)
+        keys = list(keys)
+        found = set()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                cur = self._db.execute(
+                    f"SELECT key FROM sent WHERE state != 'failed' AND key IN ({','.join('?' * len(part))})",
+                    part)
+                found.update(k for k, in cur)
+        return found
+
+    def pending(self) -> list[str]:
+        # Sends interrupted by a crash; whether they went out is unknown
+        with self._lock:
+            return [k for k, in self._db.execute("SELECT key FROM sent WHERE state = 'pending'")]
+
+
+# ----------------- RATE LIMIT -----------------
+
+class RateLimiter:
+    # Token bucket shared by all send workers
+
+    def __init__(self, per_minute: float = REPLY_RATE_PER_MIN, burst: int = REPLY_BURST):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, cancel: threading.Event | None = None) -> bool:
+        # Block until a send is allowed; False if cancelled while waiting
+        if not self.interval:
+            return not (cancel and cancel.is_set())
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) / self.interval)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                delay = (1 - self._tokens) * self.interval
+            if cancel is not None:
+                if cancel.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+
+
+# ----------------- BULK REPLY JOB -----------------
+
+class ReplyJob:
+    # Sends prepared replies in the background with bounded concurrency and a
+    # rate limit. items: [(ledger key, recipient, message, context)]; on_sent(context)
+    # runs in a worker thread after each successful send. Progress is read from
+    # the counters (or summary()) by the UI; nothing here blocks the caller.
+
+    def __init__(self, send, ledger: SentLedger, items: list, concurrency: int = REPLY_CONCURRENCY,
+                 per_minute: float = REPLY_RATE_PER_MIN, burst: int = REPLY_BURST, on_sent=None):
+        self.send = send
+        self.ledger = ledger
+        self.items = items
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(per_minute, burst)
+        self.on_sent = on_sent or (lambda context: None)
+        self.total = len(items)
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []  # (recipient, message) of failed sends
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        # Block until the job finishes; True if it did within `timeout`
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.done
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.skipped + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self) -> float:
+        # Successful sends per minute
+        return self.sent / self.elapsed * 60 if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        state = "cancelled" if self.cancelled and self.done else ("done" if self.done else "running")
+        return (f"Bulk reply {state}: {self.processed}/{self.total} "
+                f"(sent {self.sent}, skipped {self.skipped}, failed {self.failed}) "
+                f"in {self.elapsed:.0f}s, {self.rate:.1f}/min")
+
+    def _run(self):
+        try:
+            # Already-replied messages are skipped up front so they don't use up
+            # rate-limit tokens; claim() still guards against races per send
+            replied = self.ledger.replied(key for key, *_ in self.items)
+            self.skipped += sum(1 for key, *_ in self.items if key in replied)
+            todo = [item for item in self.items if item[0] not in replied]
+            with ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+                list(ex.map(self._send_one, todo))
+        finally:
+            self.finished = time.perf_counter()
+
+    def _count(self, attr: str):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _send_one(self, item):
+        key, recipient, msg, context = item
+        if not self.limiter.wait(self._cancel):
+            return
+        if not self.ledger.claim(key, recipient):
+            self._count("skipped")
+            return
+        try:
+            self.send(msg)
+        except Exception as e:
+            self.ledger.mark_error(key, e)
+            with self._lock:
+                self.failed += 1
+                self.errors.append((recipient, str(e)))
+            return
+        self.ledger.mark_sent(key)
+        self._count("sent")
+        try:
+            self.on_sent(context)
+        except Exception:
+            traceback.print_exc()
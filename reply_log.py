@@ -0,0 +1,357 @@
+import io
+import os
+import csv
+import glob
+import json
+import atexit
+import bisect
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from metrics import METRICS, instrumented, timed
+from settings import LOG_CSV_PATH
+
+# ----------------- CONSTANTS -----------------
+
+LOG_FLUSH_ROWS = 50  # buffered replies written in one append
+LOG_FLUSH_SEC = 2.0  # ...or after this long, whichever comes first
+LOG_ROTATE_BYTES = 50 * 1024 * 1024  # start a new file past this size
+LOG_ROTATE_DAYS = 30  # ...or when the current file's first row is this old
+
+# ----------------- REPLY LOG (CSV) -----------------
+
+LOG_FIELDS = [
+    "timestamp",
+    "from",
+    "subject",
+    "category",
+    "urgent",
+    "attachments",
+    "mode",  # manual/bulk/daemon
+]
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def ensure_log_csv(path: str = LOG_CSV_PATH):
+    if not os.path.exists(path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(LOG_FIELDS)
+
+
+def rotated_paths(path: str = LOG_CSV_PATH) -> list[str]:
+    # Rotated files (email_log-YYYYmmdd-HHMMSS.csv), oldest first
+    root, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(root)}-*{ext}"))
+
+
+def _row(mail: dict, mode: str) -> list:
+    # Line breaks are flattened so every row is exactly one line (the
+    # summary resumes from byte offsets at line boundaries)
+    def flat(value):
+        return " ".join(str(value).splitlines())
+
+    return [
+        datetime.now().strftime(_TS_FORMAT),
+        flat(mail.get("from", "")),
+        flat(mail.get("subject", "")),
+        flat(mail.get("category", "")),
+        "1" if mail.get("urgent") else "0",
+        mail.get("attachment_count", len(mail.get("attachments", []))),
+        mode,
+    ]
+
+
+class ReplyLog:
+    # Buffered CSV writer: rows are collected in memory and appended in one
+    # write per LOG_FLUSH_ROWS rows or LOG_FLUSH_SEC seconds, so a bulk reply
+    # job does not reopen the file for every message. Before a flush the file
+    # is rotated to email_log-<time>.csv when it is over LOG_ROTATE_BYTES or its
+    # first row is older than LOG_ROTATE_DAYS. Safe to share between threads.
+    # Rows still buffered when the process dies are lost (at most
+    # LOG_FLUSH_SEC worth); the sent ledger remains the record of what was sent.
+
+    def __init__(self, path: str = LOG_CSV_PATH, flush_rows: int = LOG_FLUSH_ROWS,
+                 flush_sec: float = LOG_FLUSH_SEC, rotate_bytes: int = LOG_ROTATE_BYTES,
+                 rotate_days: float = LOG_ROTATE_DAYS):
+        self.path = path
+        self.flush_rows = max(1, flush_rows)
+        self.flush_sec = flush_sec
+        self.rotate_bytes = rotate_bytes
+        self.rotate_age = timedelta(days=rotate_days)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._timer = None
+        self._started = None  # timestamp of the current file's first row, once known
+        self.flushes = 0
+        self.rotations = 0
+
+    def append(self, mail: dict, mode: str = "manual"):
+        with self._lock:
+            self._buffer.append(_row(mail, mode))
+            if len(self._buffer) < self.flush_rows:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_sec, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            with timed("log_flush"):
+                self._maybe_rotate()
+                ensure_log_csv(self.path)
+                buf = io.StringIO()
+                csv.writer(buf).writerows(rows)
+                text = buf.getvalue()
+                with open(self.path, "a", newline="", encoding="utf-8") as f:
+                    f.write(text)
+            METRICS.inc("bytes_total", len(text), stage="log_flush", direction="out")
+            if self._started is None:
+                self._started = self._first_timestamp()
+            self.flushes += 1
+
+    def close(self):
+        self.flush()
+
+    def _first_timestamp(self) -> datetime | None:
+        try:
+            with open(self.path, "r", newline="", encoding="utf-8") as f:
+                f.readline()  # header
+                first = next(csv.reader([f.readline()]), None)
+            return datetime.strptime(first[0], _TS_FORMAT) if first else None
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _maybe_rotate(self):
+        # Caller holds the lock
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if self._started is None:
+            self._started = self._first_timestamp()
+        too_old = self._started is not None and datetime.now() - self._started >= self.rotate_age
+        if size < self.rotate_bytes and not too_old:
+            return
+        root, ext = os.path.splitext(self.path)
+        target = f"{root}-{datetime.now():%Y%m%d-%H%M%S}{ext}"
+        n = 1
+        while os.path.exists(target):
+            n += 1
+            target = f"{root}-{datetime.now():%Y%m%d-%H%M%S}-{n}{ext}"
+        os.replace(self.path, target)
+        self._started = None
+        self.rotations += 1
+        METRICS.inc("rotations_total", stage="log_flush")
+
+
+_logs = {}  # path -> ReplyLog shared by log_reply() callers
+_logs_lock = threading.Lock()
+
+
+def reply_log(path: str = LOG_CSV_PATH) -> ReplyLog:
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = ReplyLog(path)
+        return log
+
+
+@instrumented("log_reply")
+def log_reply(mail: dict, mode: str = "manual", path: str = LOG_CSV_PATH):
+    reply_log(path).append(mail, mode)
+
+
+@atexit.register
+def flush_logs():
+    # Write out everything buffered (called on exit; call it before reading the log)
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        log.flush()
+
+
+# ----------------- SUMMARY WITH CHECKPOINT -----------------
+
+LOG_INDEX_EVERY = 1024  # rows between entries of the sparse timestamp index
+_TS_LEN = len("2026-01-01 00:00:00")
+
+
+def _is_timestamp(text: str) -> bool:
+    return len(text) == _TS_LEN and text[4] == "-" and text[10] == " " and text[13] == ":"
+
+
+def _checkpoint_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".checkpoint.json"
+
+
+def _fingerprint(f) -> str | None:
+    # Header + first row identify a log file across rotation (renaming keeps
+    # them, a new file has a different first row); None until it has a row
+    f.seek(0)
+    head = f.readline()
+    first = f.readline()
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(head + first).hexdigest()
+
+
+def _empty_entry() -> dict:
+    # Per-file checkpoint: rows counted up to `offset`, their first/last
+    # timestamps and a sparse [timestamp, byte offset] index every LOG_INDEX_EVERY rows
+    return {"offset": 0, "total": 0, "urgent": 0, "categories": {}, "first": None, "last": None,
+            "index": []}
+
+
+def _scan(f, entry: dict):
+    # Add the complete rows after entry["offset"] to entry's counts and index, in place
+    f.seek(0)
+    header = next(csv.reader([f.readline().decode("utf-8")]), LOG_FIELDS)
+    start = max(entry["offset"], f.tell())
+    f.seek(start)
+    data = f.read()
+    end = data.rfind(b"\n") + 1  # a row still being written is left for next time
+    if end == 0:
+        return
+
+    # Index pass over raw lines: rows are one line each, timestamp first
+    # (continuation lines of multi-line rows in older logs are skipped)
+    row_no = entry["total"]
+    pos = 0
+    while pos < end:
+        ts = data[pos:pos + _TS_LEN].decode("utf-8", "replace")
+        if _is_timestamp(ts):
+            if row_no % LOG_INDEX_EVERY == 0:
+                entry["index"].append([ts, start + pos])
+            if entry["first"] is None or ts < entry["first"]:
+                entry["first"] = ts
+            if entry["last"] is None or ts > entry["last"]:
+                entry["last"] = ts
+            row_no += 1
+        pos = data.index(b"\n", pos) + 1
+
+    text = io.StringIO(data[:end].decode("utf-8"), newline="")
+    for row in csv.DictReader(text, fieldnames=header):
+        entry["total"] += 1
+        cat = row.get("category") or "Other"
+        entry["categories"][cat] = entry["categories"].get(cat, 0) + 1
+        if (row.get("urgent") or "").lower() in ("1", "true", "yes"):
+            entry["urgent"] += 1
+    entry["offset"] = start + end
+
+
+def update_checkpoint(path: str = LOG_CSV_PATH) -> list[tuple[str, dict]]:
+    # Bring <log>.checkpoint.json up to date with the current and rotated log
+    # files, reading only rows appended since the last call. Returns
+    # [(file path, checkpoint entry)], oldest file first.
+    flush_logs()
+    files = [p for p in rotated_paths(path) + [path] if os.path.exists(p)]
+    if not files:
+        raise FileNotFoundError("No log CSV found.")
+
+    cp_path = _checkpoint_path(path)
+    try:
+        with open(cp_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if not isinstance(checkpoint, dict):
+            checkpoint = {}
+    except (OSError, ValueError):
+        checkpoint = {}
+
+    seen = {}
+    result = []
+    for file_path in files:
+        with open(file_path, "rb") as f:
+            fp = _fingerprint(f)
+            if fp is None:
+                continue  # header only
+            entry = checkpoint.get(fp)
+            if (not isinstance(entry, dict) or "index" not in entry
+                    or entry["offset"] > os.fstat(f.fileno()).st_size):
+                entry = _empty_entry()  # new, from an older format, or truncated: count it again
+            _scan(f, entry)
+            seen[fp] = entry
+            result.append((file_path, entry))
+
+    tmp = cp_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(seen, f)
+    os.replace(tmp, cp_path)
+    return result
+
+
+def summarize_log(path: str = LOG_CSV_PATH, categories=()) -> dict:
+    # {"total", "urgent", "categories": {category: count}} over the whole log,
+    # rotated files included, from the checkpointed counts
+    counts = {c: 0 for c in categories}
+    total = urgent_count = 0
+    for _, entry in update_checkpoint(path):
+        total += entry["total"]
+        urgent_count += entry["urgent"]
+        for cat, n in entry["categories"].items():
+            counts[cat] = counts.get(cat, 0) + n
+    return {"total": total, "urgent": urgent_count, "categories": counts}
+
+
+# ----------------- TIME-RANGE READS -----------------
+
+LOG_ORDER_SLACK_SEC = 60  # rows from concurrent writers may be this far out of timestamp order
+
+
+def iter_log_rows(path: str = LOG_CSV_PATH, start: datetime | None = None, end: datetime | None = None,
+                  stats: dict | None = None):
+    # Yield rows (dicts keyed by the header) with start <= timestamp < end.
+    # Files whose first/last timestamps miss the range are not opened, and the
+    # sparse index seeks to the last indexed row before `start`, so only the
+    # range (plus up to LOG_INDEX_EVERY rows either side) is read. stats, if
+    # given, gets "bytes" and "files" read.
+    lo = start.strftime(_TS_FORMAT) if start else None
+    hi = end.strftime(_TS_FORMAT) if end else None
+    slack = timedelta(seconds=LOG_ORDER_SLACK_SEC)
+    seek_to = (start - slack).strftime(_TS_FORMAT) if start else None
+    stop_at = (end + slack).strftime(_TS_FORMAT) if end else None
+    if stats is not None:
+        stats.setdefault("bytes", 0)
+        stats.setdefault("files", 0)
+
+    for file_path, entry in update_checkpoint(path):
+        if entry["first"] is None or (lo and entry["last"] < lo) or (hi and entry["first"] >= hi):
+            continue
+        with open(file_path, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]), LOG_FIELDS)
+            pos = f.tell()
+            if seek_to:
+                i = bisect.bisect_left([ts for ts, _ in entry["index"]], seek_to)
+                if i > 0:
+                    pos = entry["index"][i - 1][1]
+            f.seek(pos)
+            first_pos = pos
+            try:
+                while pos < entry["offset"]:
+                    line = f.readline()
+                    if not line:
+                        break
+                    pos += len(line)
+                    ts = line[:_TS_LEN].decode("utf-8", "replace")
+                    if not _is_timestamp(ts):
+                        continue
+                    if stop_at and ts >= stop_at:
+                        break
+                    if (lo and ts < lo) or (hi and ts >= hi):
+                        continue
+                    row = next(csv.reader([line.decode("utf-8")]), None)
+                    if row:
+                        yield dict(zip(header, row))
+            finally:
+                if stats is not None:
+                    stats["bytes"] += pos - first_pos
+                    stats["files"] += 1
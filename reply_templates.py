@@ -0,0 +1,396 @@
+import os
+import re
+import json
+import threading
+import time
+from email.mime.text import MIMEText
+
+from settings import TEMPLATE_DIR
+
+# ----------------- CONSTANTS -----------------
+
+TEMPLATE_EXT = ".txt"
+VARIABLES_FILE = "variables.json"  # static variables, e.g. {"your_name": "Jane at Acme"}
+RELOAD_CHECK_SEC = 1.0  # template files are re-checked at most this often
+EXTRACT_CHARS = 5000  # body prefix searched for order/invoice numbers
+
+# Built-in templates; ensure_templates() writes them into TEMPLATE_DIR to be edited.
+# {name} inserts a variable, {?name}...{/name} is kept only when it is non-empty,
+# {^name}...{/name} only when it is empty; {{ and }} are literal braces.
+DEFAULT_TEMPLATES = {
+    "Billing / Payment": """Hi {sender_name},
+
+Thank you for your message about billing/payment. We have received your request and will review the details shortly.
+
+{?invoice_number}We will start with invoice {invoice_number}.{/invoice_number}{^invoice_number}If this is about a specific invoice, please include the invoice number or date.{/invoice_number}
+
+Best regards,
+{your_name}
+""",
+    "Order / Purchase": """Hi {sender_name},
+
+Thank you for contacting us about your order.
+
+{?order_number}We will check the status of order {order_number} and get back to you.{/order_number}{^order_number}We will check the order status and get back to you. If you have an order ID or tracking number, please include it.{/order_number}
+
+Best regards,
+{your_name}
+""",
+    "Support Request": """Hi {sender_name},
+
+Thank you for reaching out! We have received your support request.
+
+We will review the issue and respond with an update as soon as possible.
+
+Best regards,
+{your_name}
+""",
+    "Client Lead": """Hi {sender_name},
+
+Thank you for your interest!
+
+Please share some details about your requirement (scope, timeline, and budget) so we can suggest the best next steps.
+
+Best regards,
+{your_name}
+""",
+    None: """Hi {sender_name},
+
+Thank you for your email. We have received your message and will look into it shortly.
+
+Best regards,
+{your_name}
+""",
+}
+
+# Variables every template can use (plus anything in variables.json)
+VARIABLES = ("sender_name", "sender_email", "subject", "date", "category", "account", "your_name",
+             "order_number", "invoice_number")
+
+_TOKEN_RE = re.compile(r"\{\{|\}\}|\{([?^/]?)(\w+)\}")
+# "<word> #123", "<word> no. 12", "<word>: A-1" (marked, any length) or "<word> 12345" (unmarked:
+# at least 5 characters, so "order 10 more units" has no order number)
+_REFERENCE = r"[A-Z0-9][A-Z0-9-]*\d[A-Z0-9-]*"
+_MARKED = r"(?:no\b\.?|number\b|id\b|#|:)\s*[:#]?\s*"
+_ORDER_RE = re.compile(rf"\border\b\s*(?:{_MARKED}({_REFERENCE})|(?=[A-Z0-9-]{{5}})({_REFERENCE}))", re.I)
+_INVOICE_RE = re.compile(rf"\binvoice\b\s*(?:{_MARKED}({_REFERENCE})|(?=[A-Z0-9-]{{5}})({_REFERENCE}))", re.I)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+# ----------------- COMPILED TEMPLATES -----------------
+
+def compile_template(text: str, name: str = "template") -> list:
+    # Template text -> nested parts: str, ("var", name), ("if"/"unless", name, parts).
+    # Parsed once; rendering is then a walk over the parts.
+    root = []
+    stack = [(None, root)]
+    pos = 0
+    for m in _TOKEN_RE.finditer(text):
+        parts = stack[-1][1]
+        if m.start() > pos:
+            parts.append(text[pos:m.start()])
+        pos = m.end()
+        token = m.group(0)
+        if token in ("{{", "}}"):
+            parts.append(token[0])
+            continue
+        kind, var = m.group(1), m.group(2)
+        if kind in ("?", "^"):
+            section = []
+            parts.append(("if" if kind == "?" else "unless", var, section))
+            stack.append((var, section))
+        elif kind == "/":
+            if stack[-1][0] != var:
+                raise TemplateError(f"{name}: unexpected {{/{var}}}")
+            stack.pop()
+        else:
+            parts.append(("var", var))
+    if len(stack) > 1:
+        raise TemplateError(f"{name}: {{?{stack[-1][0]}}} is never closed")
+    if pos < len(text):
+        root.append(text[pos:])
+    return _merge_literals(root)
+
+
+def _merge_literals(parts: list) -> list:
+    out = []
+    for part in parts:
+        if isinstance(part, tuple) and part[0] != "var":
+            part = (part[0], part[1], _merge_literals(part[2]))
+        if isinstance(part, str) and out and isinstance(out[-1], str):
+            out[-1] += part
+        else:
+            out.append(part)
+    return out
+
+
+def template_variables(parts: list) -> set:
+    names = set()
+    for part in parts:
+        if isinstance(part, tuple):
+            names.add(part[1])
+            if part[0] != "var":
+                names |= template_variables(part[2])
+    return names
+
+
+def render(parts: list, values: dict) -> str:
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+        elif part[0] == "var":
+            out.append(str(values.get(part[1], "")))
+        elif bool(values.get(part[1])) == (part[0] == "if"):
+            out.append(render(part[2], values))
+    return "".join(out)
+
+
+# ----------------- TEMPLATE DIRECTORY -----------------
+
+def template_slug(category: str | None) -> str:
+    # "Billing / Payment" -> "billing-payment"; None -> "default"
+    if not category:
+        return "default"
+    return re.sub(r"[^a-z0-9]+", "-", category.lower()).strip("-") or "default"
+
+
+def ensure_templates(root: str = TEMPLATE_DIR):
+    # Writes the built-in templates into a new (or empty) template directory
+    os.makedirs(root, exist_ok=True)
+    if any(name.endswith(TEMPLATE_EXT) for name in os.listdir(root)):
+        return
+    for category, text in DEFAULT_TEMPLATES.items():
+        with open(os.path.join(root, template_slug(category) + TEMPLATE_EXT), "w", encoding="utf-8") as f:
+            f.write(text)
+    with open(os.path.join(root, VARIABLES_FILE), "w", encoding="utf-8") as f:
+        json.dump({"your_name": ""}, f, indent=2)
+
+
+class TemplateSet:
+    # Reply templates loaded from a directory and compiled once:
+    #   <root>/<category-slug>.txt            e.g. billing-payment.txt, default.txt
+    #   <root>/<account>/<category-slug>.txt  variant for one sending account
+    #   <root>/variables.json, <root>/<account>/variables.json
+    # Lookup: account+category, account default, category, default, built-in.
+    # Files are re-stat'ed at most every RELOAD_CHECK_SEC and only changed files
+    # are recompiled, so edits apply without a restart. A file that fails to
+    # compile is reported and the previous version (or the built-in) is used.
+
+    def __init__(self, root: str = TEMPLATE_DIR, check_sec: float = RELOAD_CHECK_SEC):
+        self.root = root
+        self.check_sec = check_sec
+        self._lock = threading.Lock()
+        self._files = {}  # key ("billing-payment.txt", "<account>/default.txt") -> (mtime_ns, size, parts/dict)
+        self._checked = 0.0
+        self.reloads = 0
+        self._errors = []  # problems found loading template files, until take_errors()
+        self._builtin = {category: compile_template(text, template_slug(category))
+                         for category, text in DEFAULT_TEMPLATES.items()}
+
+    def _scan(self) -> dict:
+        # -> {lookup key: (path, mtime_ns, size)}; keys use lower-cased account
+        # folder names so they match case-insensitively
+        found = {}
+
+        def add(folder: str, entry):
+            if entry.is_file() and (entry.name.endswith(TEMPLATE_EXT) or entry.name == VARIABLES_FILE):
+                st = entry.stat()
+                found[os.path.join(folder, entry.name)] = (entry.path, st.st_mtime_ns, st.st_size)
+
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return found
+        for entry in entries:
+            if not entry.is_dir():
+                add("", entry)
+                continue
+            try:
+                for sub in os.scandir(entry.path):
+                    add(entry.name.lower(), sub)
+            except OSError:
+                continue
+        return found
+
+    def _load(self, path: str, previous):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            if path.endswith(VARIABLES_FILE):
+                data = json.loads(text)
+                if not isinstance(data, dict):
+                    raise TemplateError(f"{path}: expected a JSON object")
+                return {k: str(v) for k, v in data.items()}
+            parts = compile_template(text, path)
+            unknown = template_variables(parts) - set(VARIABLES)
+            if unknown:
+                self._errors.append(f"Template {path}: variables {', '.join(sorted(unknown))} "
+                                    f"only come from variables.json")
+            return parts
+        except (OSError, ValueError) as e:
+            self._errors.append(f"Template {path} not loaded: {e}")
+            return previous
+
+    def take_errors(self) -> list[str]:
+        # Problems found since the last call (each reported once; a file is
+        # only reloaded when it changes)
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked < self.check_sec:
+                return
+            self._checked = now
+            files = {}
+            for key, (path, mtime, size) in self._scan().items():
+                old = self._files.get(key)
+                if old is not None and old[:2] == (mtime, size):
+                    files[key] = old
+                    continue
+                # A file that fails with nothing to fall back on is kept as None,
+                # so it is not reloaded (and reported) again until it changes
+                loaded = self._load(path, old[2] if old else None)
+                files[key] = (mtime, size, loaded)
+                self.reloads += old is not None and loaded is not None
+            self._files = files
+
+    def _get(self, *names):
+        for name in names:
+            entry = self._files.get(os.path.join(*name))
+            if entry is not None and entry[2] is not None:
+                return entry[2]
+        return None
+
+    def template(self, category: str | None, account: str = "") -> list:
+        self.refresh()
+        slug = template_slug(category) + TEMPLATE_EXT
+        default = template_slug(None) + TEMPLATE_EXT
+        account = (account or "").lower()
+        names = [(account, slug), (account, default)] if account else []
+        parts = self._get(*names, (slug,), (default,))
+        if parts is None:
+            parts = self._builtin.get(category, self._builtin[None])
+        return parts
+
+    def variables(self, account: str = "") -> dict:
+        # Static variables: root variables.json, overridden per account
+        self.refresh()
+        values = dict(self._get((VARIABLES_FILE,)) or {})
+        if account:
+            values.update(self._get((account.lower(), VARIABLES_FILE)) or {})
+        return values
+
+    def render(self, mail: dict, account: str = "") -> str:
+        return self.render_many([mail], account)[0]
+
+    def render_many(self, mails, account: str = "") -> list[str]:
+        # Bulk API: one freshness check and one variables lookup for the whole batch
+        self.refresh()
+        static = self.variables(account)
+        by_category = {}
+        out = []
+        for mail in mails:
+            category = mail.get("category")
+            parts = by_category.get(category)
+            if parts is None:
+                parts = by_category[category] = self.template(category, account)
+            out.append(render(parts, reply_variables(mail, account, static)))
+        return out
+
+
+_default_set = None
+_default_lock = threading.Lock()
+
+
+def default_templates() -> TemplateSet:
+    global _default_set
+    with _default_lock:
+        if _default_set is None:
+            _default_set = TemplateSet(TEMPLATE_DIR)
+        return _default_set
+
+
+# ----------------- VARIABLES -----------------
+
+def parse_sender(sender_raw: str):
+    # "Name <addr>" -> (addr, name); bare address -> (addr, None)
+    if "<" in sender_raw and ">" in sender_raw:
+        addr = sender_raw.split("<")[-1].split(">")[0].strip()
+        name = sender_raw.split("<")[0].strip().strip('"')
+    else:
+        addr = sender_raw.strip()
+        name = None
+    return addr, name
+
+
+def extract_reference(pattern, *texts) -> str:
+    for text in texts:
+        m = pattern.search(text or "")
+        if m:
+            return m.group(m.lastindex)
+    return ""
+
+
+def reply_variables(mail: dict, account: str = "", static: dict | None = None) -> dict:
+    addr, name = parse_sender(mail.get("from") or "")
+    subject = mail.get("subject") or ""
+    body = (mail.get("body") or mail.get("preview") or "")[:EXTRACT_CHARS]
+    values = dict(static or {})
+    values.update({
+        "sender_name": name or "there",
+        "sender_email": addr,
+        "subject": subject,
+        "date": mail.get("date") or "",
+        "category": mail.get("category") or "",
+        "account": account,
+        "order_number": extract_reference(_ORDER_RE, subject, body),
+        "invoice_number": extract_reference(_INVOICE_RE, subject, body),
+    })
+    values["your_name"] = values.get("your_name") or account
+    return values
+
+
+# ----------------- REPLY MESSAGES -----------------
+
+def _reply_message(mail: dict, from_addr: str, addr: str, text: str) -> MIMEText:
+    msg = MIMEText(text)
+    msg["Subject"] = f"Re: {mail['subject'] or ''}"
+    msg["From"] = from_addr
+    msg["To"] = addr
+    if mail.get("message_id"):
+        # RFC 5322 3.6.4: the parent's References followed by its Message-ID
+        refs = (mail.get("references") or "").split()
+        if mail["message_id"] not in refs:
+            refs.append(mail["message_id"])
+        msg["In-Reply-To"] = mail["message_id"]
+        msg["References"] = " ".join(refs)
+    return msg
+
+
+def build_reply_message(mail: dict, from_addr: str, templates: TemplateSet | None = None):
+    # -> (MIMEText, recipient address); ValueError if the sender can't be parsed
+    addr, _ = parse_sender(mail["from"])
+    if not addr or "@" not in addr:
+        raise ValueError(f"Cannot parse email from: {mail['from']}")
+    text = (templates or default_templates()).render(mail, from_addr)
+    return _reply_message(mail, from_addr, addr, text), addr
+
+
+def build_reply_messages(mails, from_addr: str, templates: TemplateSet | None = None) -> list:
+    # Bulk form of build_reply_message: [(mail, MIMEText, addr)], skipping
+    # messages whose sender can't be parsed
+    valid = []
+    for mail in mails:
+        addr, _ = parse_sender(mail["from"])
+        if addr and "@" in addr:
+            valid.append((mail, addr))
+    texts = (templates or default_templates()).render_many([m for m, _ in valid], from_addr)
+    return [(mail, _reply_message(mail, from_addr, addr, text), addr)
+            for (mail, addr), text in zip(valid, texts)]
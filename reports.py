@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+from reply_log import iter_log_rows
+from settings import LOG_CSV_PATH
+
+# Period reports over the reply log. Only the rows in the requested range are
+# read (see reply_log.iter_log_rows); rendering to PDF lives in app.py so this
+# module stays free of GUI/PDF imports and works in the headless daemon.
+
+# ----------------- PERIODS & RANGES -----------------
+
+AUTO_MODES = ("bulk", "daemon")  # modes counted as automatic replies
+
+
+def _week(ts: str) -> str:
+    year, week, _ = datetime.strptime(ts[:10], "%Y-%m-%d").isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+PERIODS = {
+    "day": lambda ts: ts[:10],
+    "week": _week,
+    "month": lambda ts: ts[:7],
+}
+
+
+def _month_start(day: datetime, months_back: int = 0) -> datetime:
+    month = day.year * 12 + day.month - 1 - months_back
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+# label -> now -> (start, end, period); None = unbounded
+REPORT_RANGES = {
+    "Last 7 days": lambda now: (datetime(now.year, now.month, now.day) - timedelta(days=6), None, "day"),
+    "Last 30 days": lambda now: (datetime(now.year, now.month, now.day) - timedelta(days=29), None, "week"),
+    "This month": lambda now: (_month_start(now), None, "day"),
+    "Last month": lambda now: (_month_start(now, 1), _month_start(now), "week"),
+    "Last 12 months": lambda now: (_month_start(now, 11), None, "month"),
+    "All time": lambda now: (None, None, "month"),
+}
+
+
+# ----------------- REPORT -----------------
+
+def _empty_section() -> dict:
+    # categories: {category: [replies, urgent]}
+    return {"total": 0, "urgent": 0, "categories": {}, "modes": {}}
+
+
+def _add(section: dict, category: str, urgent: bool, mode: str):
+    section["total"] += 1
+    section["urgent"] += urgent
+    counts = section["categories"].setdefault(category, [0, 0])
+    counts[0] += 1
+    counts[1] += urgent
+    section["modes"][mode] = section["modes"].get(mode, 0) + 1
+
+
+def build_report(path: str = LOG_CSV_PATH, start: datetime | None = None, end: datetime | None = None,
+                 period: str = "month", categories=()) -> dict:
+    # {"start", "end", "period", "totals": section, "sections": [(label, section)],
+    #  "bytes_read"}; a section has total, urgent, categories {cat: [n, urgent]}
+    # and modes {mode: n}. Periods without replies are left out.
+    label_of = PERIODS[period]
+    sections = {}
+    totals = _empty_section()
+    for c in categories:
+        totals["categories"][c] = [0, 0]
+    stats = {}
+    for row in iter_log_rows(path, start, end, stats=stats):
+        ts = row.get("timestamp", "")
+        category = row.get("category") or "Other"
+        urgent = (row.get("urgent") or "").lower() in ("1", "true", "yes")
+        mode = row.get("mode") or "manual"
+        label = label_of(ts)
+        if label not in sections:
+            sections[label] = _empty_section()
+        _add(sections[label], category, urgent, mode)
+        _add(totals, category, urgent, mode)
+    return {"start": start, "end": end, "period": period, "totals": totals,
+            "sections": sorted(sections.items()), "bytes_read": stats.get("bytes", 0)}
+
+
+def mode_split(section: dict) -> tuple[int, int]:
+    # (manual, automatic) reply counts
+    auto = sum(n for mode, n in section["modes"].items() if mode in AUTO_MODES)
+    return section["total"] - auto, auto
+
+
+def range_text(report: dict) -> str:
+    start = report["start"].strftime("%Y-%m-%d") if report["start"] else "beginning"
+    end = (report["end"] - timedelta(seconds=1)).strftime("%Y-%m-%d") if report["end"] else "now"
+    return f"{start} to {end}"
+
+
+def format_report(report: dict) -> str:
+    # Plain-text rendering (headless `triage report`)
+    def section_lines(section):
+        manual, auto = mode_split(section)
+        lines = [f"  replies: {section['total']}  urgent: {section['urgent']}  "
+                 f"manual: {manual}  automatic: {auto}"]
+        for cat, (n, urg) in section["categories"].items():
+            lines.append(f"    {cat:<20} {n:>7} {urg:>7} urgent")
+        return lines
+
+    out = [f"Reply report, {range_text(report)} (per {report['period']})", "Total:"]
+    out += section_lines(report["totals"])
+    for label, section in report["sections"]:
+        out.append(f"{label}:")
+        out += section_lines(section)
+    return "\n".join(out)
@@ -0,0 +1,30 @@
+import os
+
+from mailparse import ATTACH_DIR
+
+# ----------------- CONSTANTS & PATHS -----------------
+# Shared by the desktop app and the headless daemon (no GUI imports here)
+
+APP_NAME = "EmailAssistantPro"
+LOG_DIR = "logs"
+DATA_DIR = "data"
+
+LOG_CSV_PATH = os.path.join(LOG_DIR, "email_log.csv")
+LOG_PDF_PATH = os.path.join(LOG_DIR, "email_log_summary.pdf")
+SYNC_STATE_PATH = os.path.join(DATA_DIR, "sync_state.json")
+STORE_PATH = os.path.join(DATA_DIR, "messages.db")
+LEDGER_PATH = os.path.join(DATA_DIR, "sent_ledger.db")
+CLASSIFY_CACHE_PATH = os.path.join(DATA_DIR, "classify_cache.db")  # (category, urgent) by content hash
+MODEL_PATH = os.path.join(DATA_DIR, "category_model.npz")  # trained classifier (python -m triage train)
+HISTORY_PATH = os.path.join(DATA_DIR, "reply_history.json")  # per-day reply aggregates
+BODY_SPILL_DIR = DATA_DIR  # where each running app keeps its own temporary file of loaded message text
+ACCOUNTS_PATH = os.path.join(DATA_DIR, "accounts.json")  # mailboxes to sync besides the GUI login
+METRICS_PROM_PATH = os.path.join(LOG_DIR, "metrics.prom")  # Prometheus text format (textfile collector)
+METRICS_JSON_PATH = os.path.join(LOG_DIR, "metrics.json")
+PROFILE_DIR = os.path.join(LOG_DIR, "profiles")  # on-demand cProfile/tracemalloc captures
+TEMPLATE_DIR = "templates"  # reply templates (<category>.txt, <account>/<category>.txt)
+
+
+def ensure_dirs():
+    for path in (LOG_DIR, DATA_DIR, ATTACH_DIR):
+        os.makedirs(path, exist_ok=True)
@@ -0,0 +1,276 @@
+import re
+import ssl
+import copy
+import time
+import queue
+import smtplib
+import threading
+from collections import deque
+from email.utils import getaddresses
+
+from metrics import METRICS, instrumented
+
+# ----------------- CONSTANTS -----------------
+
+SMTP_POOL_SIZE = 3  # authenticated sessions kept for concurrent sends
+SMTP_NOOP_AFTER_SEC = 30  # idle sessions older than this are checked with NOOP before use
+SMTP_MAX_IDLE_SEC = 240  # idle sessions older than this are assumed dropped by the server
+SMTP_SEND_RETRIES = 1  # extra attempts on a fresh session after a disconnect
+
+_EOL_RE = re.compile(rb"(?:\r\n|\n|\r(?!\n))")
+_DOT_RE = re.compile(rb"(?m)^\.")
+
+
+class SendOutcomeUnknown(smtplib.SMTPException):
+    # The session failed after the message data was written: the server may have
+    # accepted the message, so it must not be sent again
+    pass
+
+
+@instrumented("smtp_connect")
+def connect_smtp(host: str, port: int, use_ssl: bool, user: str, password: str, timeout: float = 30):
+    if use_ssl:
+        context = ssl.create_default_context()
+        conn = smtplib.SMTP_SSL(host, port, context=context, timeout=timeout)
+    else:
+        conn = smtplib.SMTP(host, port, timeout=timeout)
+        conn.starttls()
+    conn.login(user, password)
+    return conn
+
+
+# ----------------- PIPELINED SEND -----------------
+
+def _envelope(msg):
+    from_addr = getaddresses(msg.get_all("Sender", []) or msg.get_all("From", []))
+    to_addrs = getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []) + msg.get_all("Bcc", []))
+    return (from_addr[0][1] if from_addr else ""), [a for _, a in to_addrs if a]
+
+
+def _send_data(conn, payload: bytes):
+    # Message data + final dot after a 354 reply. From the first byte written on,
+    # a lost session or 421 leaves it unknown whether the server took the message.
+    try:
+        conn.send(payload + b".\r\n")
+        code, resp = conn.getreply()
+    except (smtplib.SMTPServerDisconnected, OSError) as e:
+        raise SendOutcomeUnknown(f"connection lost after the message data was sent: {e}") from e
+    METRICS.inc("bytes_total", len(payload) + 3, stage="send_message", direction="out")
+    if code == 421:
+        raise SendOutcomeUnknown(f"server closed the session after the message data was sent: {code} {resp!r}")
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+def send_pipelined(conn, msg):
+    # MAIL FROM + RCPT TO + DATA in one write (RFC 2920) instead of one round trip
+    # each; one command at a time when the session can't pipeline. Raises
+    # SendOutcomeUnknown for failures after the message data started going out.
+    from_addr, to_addrs = _envelope(msg)
+    text = f"{from_addr}{''.join(to_addrs)}"
+    if not text.isascii() or not to_addrs:
+        # SMTPUTF8 and other corner cases: smtplib does not say how far it got
+        try:
+            return conn.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError) as e:
+            raise SendOutcomeUnknown(f"connection lost while sending: {e}") from e
+
+    if msg.get_all("Bcc"):
+        msg = copy.deepcopy(msg)
+        del msg["Bcc"]
+    payload = _DOT_RE.sub(b"..", _EOL_RE.sub(b"\r\n", msg.as_bytes()))
+    if not payload.endswith(b"\r\n"):
+        payload += b"\r\n"
+    size = f" SIZE={len(payload)}" if conn.has_extn("size") else ""
+
+    cmds = [f"MAIL FROM:<{from_addr}>{size}"] + [f"RCPT TO:<{a}>" for a in to_addrs] + ["DATA"]
+    if conn.does_esmtp and conn.has_extn("pipelining"):
+        conn.send("".join(c + "\r\n" for c in cmds))
+        replies = [conn.getreply() for _ in cmds]
+    else:
+        replies = []
+        for c in cmds:
+            conn.send(c + "\r\n")
+            replies.append(conn.getreply())
+
+    code, resp = replies[0]
+    mail_ok = code == 250
+    refused = {}
+    for addr, (rcode, rresp) in zip(to_addrs, replies[1:]):
+        if rcode not in (250, 251):
+            refused[addr] = (rcode, rresp)
+    data_code, data_resp = replies[-1]
+
+    if not mail_ok or len(refused) == len(to_addrs) or data_code != 354:
+        if data_code == 354:
+            conn.send(b".\r\n")  # server accepted DATA anyway; end an empty message
+            conn.getreply()
+        conn.rset()
+        if not mail_ok:
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        raise smtplib.SMTPDataError(data_code, data_resp)
+
+    _send_data(conn, payload)
+    return refused
+
+
+# ----------------- SESSION POOL -----------------
+
+class SmtpPool:
+    # Up to `size` authenticated SMTP sessions shared by sending threads. Sessions
+    # are health-checked with NOOP after being idle, replaced transparently when
+    # the server dropped them, and a send that hits a disconnect before the
+    # message data went out is retried on a fresh session. After that point it
+    # raises SendOutcomeUnknown and is never resent.
+
+    def __init__(self, connect, size: int = SMTP_POOL_SIZE, retries: int = SMTP_SEND_RETRIES):
+        self.connect = connect
+        self.size = max(1, size)
+        self.retries = retries
+        self._idle = queue.LifoQueue()  # (conn, last_used) - most recently used first
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self.sends = 0
+        self.failures = 0
+        self.connects = 0
+        self.reconnects = 0  # sessions replaced because they were dropped or broken
+        self.pipelined = 0
+        self.latencies = deque(maxlen=1000)  # seconds per successful send
+
+    # -- sessions --
+
+    def _new_session(self):
+        conn = self.connect()
+        with self._lock:
+            self.connects += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self.reconnects += 1
+        METRICS.inc("reconnects_total", stage="smtp")
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _healthy(self, conn, last_used: float) -> bool:
+        idle = time.monotonic() - last_used
+        if idle > SMTP_MAX_IDLE_SEC:
+            return False
+        if idle > SMTP_NOOP_AFTER_SEC:
+            try:
+                return conn.noop()[0] == 250
+            except Exception:
+                return False
+        return True
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._new_session()
+                if self._healthy(conn, last_used):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable: bool = True):
+        if reusable:
+            self._idle.put((conn, time.monotonic()))
+        else:
+            self._discard(conn)
+        self._slots.release()
+
+    def warm_up(self):
+        # Open one session now so bad credentials fail at connect time
+        self._release(self._acquire())
+
+    # -- sending --
+
+    def send_message(self, msg) -> float:
+        # Returns the send latency in seconds
+        attempt = 0
+        while True:
+            conn = self._acquire()
+            t0 = time.perf_counter()
+            try:
+                pipelined = conn.does_esmtp and conn.has_extn("pipelining")
+                send_pipelined(conn, msg)
+            except SendOutcomeUnknown:
+                self._release(conn, reusable=False)
+                self._count_failure()
+                raise
+            except smtplib.SMTPResponseException as e:
+                # 421 = service closing the session; anything else is a real refusal
+                self._release(conn, reusable=e.smtp_code != 421)
+                self._count_failure()
+                if e.smtp_code != 421 or attempt >= self.retries:
+                    raise
+            except smtplib.SMTPServerDisconnected:
+                self._release(conn, reusable=False)
+                self._count_failure()
+                if attempt >= self.retries:
+                    raise
+            except smtplib.SMTPException:
+                # Refused recipients etc.: the session itself is still fine
+                self._release(conn)
+                self._count_failure()
+                raise
+            except OSError:
+                self._release(conn, reusable=False)
+                self._count_failure()
+                if attempt >= self.retries:
+                    raise
+            else:
+                elapsed = time.perf_counter() - t0
+                self._release(conn)
+                with self._lock:
+                    self.sends += 1
+                    self.pipelined += int(bool(pipelined))
+                    self.latencies.append(elapsed)
+                METRICS.observe("send_message", elapsed)
+                return elapsed
+            attempt += 1
+            METRICS.inc("retries_total", stage="send_message")
+
+    def _count_failure(self):
+        with self._lock:
+            self.failures += 1
+        METRICS.inc("errors_total", stage="send_message")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self.latencies)
+        p50 = lat[len(lat) // 2] if lat else 0.0
+        return {
+            "sends": self.sends,
+            "failures": self.failures,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "pipelined": self.pipelined,
+            "latency_p50_ms": p50 * 1000,
+            "latency_last_ms": (self.latencies[-1] * 1000) if self.latencies else 0.0,
+        }
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
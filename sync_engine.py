@@ -0,0 +1,305 @@
+import json
+import time
+import queue
+import asyncio
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+from imap_fetch import (
+    ENVELOPE_ITEMS, FETCH_CHUNK_SIZE, FetchStats, attachment_parts, find_text_part, header_field, iter_fetch,
+    parse_envelope, search_new_uids, search_uids, select_folder,
+)
+from mail_record import MailRecord
+from mailparse import decode_str
+
+# ----------------- CONSTANTS -----------------
+
+FETCH_LIMIT = 20  # newest messages fetched per mailbox when there is no sync mark
+FETCH_PAGE_SIZE = 500  # new messages fetched, stored and marked at a time after that
+CONNS_PER_ACCOUNT = 2  # concurrent IMAP connections per account (servers cap these)
+SYNC_THREADS = 16  # threads running blocking imaplib calls for the event loop
+IMAP_NOOP_AFTER_SEC = 60  # idle connections older than this are checked with NOOP
+
+
+def load_accounts(path: str) -> list[dict]:
+    # Accounts to sync: [{"email", "imap_host", "imap_port", "ssl", "folders"}], plus
+    # optional "smtp_host"/"smtp_port" for replies and "password_env" for the
+    # headless daemon. Passwords are not stored here; the GUI reads them from
+    # the keyring, the daemon from the environment.
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    accounts = []
+    for a in data if isinstance(data, list) else []:
+        if not isinstance(a, dict) or not a.get("email") or not a.get("imap_host"):
+            continue
+        accounts.append({
+            "email": a["email"].strip(),
+            "imap_host": a["imap_host"].strip(),
+            "imap_port": int(a.get("imap_port") or 993),
+            "ssl": bool(a.get("ssl", True)),
+            "folders": list(a.get("folders") or ["INBOX"]),
+            "smtp_host": (a.get("smtp_host") or "").strip(),
+            "smtp_port": int(a.get("smtp_port") or 465),
+            "password_env": (a.get("password_env") or "").strip(),
+        })
+    return accounts
+
+
+def mail_key(mail: dict) -> tuple:
+    # UIDs are only unique within one folder; key in-memory caches by mailbox too
+    return mail.get("account"), mail.get("folder"), mail["uid"]
+
+
+def mail_sort_key(mail: dict) -> float:
+    try:
+        return parsedate_to_datetime(mail.get("date") or "").timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return 0.0
+
+
+# ----------------- ONE MAILBOX -----------------
+
+def mail_from_envelope(uid: str, fields: dict) -> dict:
+    env = parse_envelope(fields.get("ENVELOPE"))
+    return {
+        "uid": uid,
+        "subject": decode_str(env["subject"]),
+        "from": decode_str(env["from"]),
+        "date": env["date"],
+        "message_id": env["message_id"].strip(),
+        "in_reply_to": env["in_reply_to"].strip(),
+        "references": header_field(fields),
+        "body": None,  # fetched on demand
+        "category": "Unclassified",
+        "urgent": False,
+        "attachments": [],
+        "attachment_count": len(attachment_parts(fields.get("BODYSTRUCTURE"))),
+        "text_part": find_text_part(fields.get("BODYSTRUCTURE")),
+        "preview": None,  # first CLASSIFY_BYTES of the text part, for classification
+        "loaded": False,
+        "replied": False,
+    }
+
+
+def fetch_pages(conn, account: str, folder: str, uidvalidity: int | None, last_uid: int | None,
+                limit: int = FETCH_LIMIT, lazy: bool = False, pipeline=None,
+                chunk_size: int = FETCH_CHUNK_SIZE, stats: FetchStats | None = None, progress=None,
+                bodies=None, page_size: int = FETCH_PAGE_SIZE):
+    # Yields (mails, mark) pages from the selected folder, mails newest first;
+    # store each page, then save `mark` as the folder's last UID. With last_uid
+    # None (first sync, UIDVALIDITY reset) there is one page: the newest `limit`
+    # messages, older mail stays on the server unsynced. Otherwise every
+    # message above last_uid comes back, `page_size` per page, oldest page
+    # first, so a saved mark never passes a message that was not stored.
+    # progress(done, total) is called per message over all pages. With a
+    # BodyStore in `bodies` each mail becomes a compact MailRecord as soon as
+    # it is parsed.
+    if last_uid is not None:
+        uids = search_new_uids(conn, last_uid)
+        pages = [uids[i:i + page_size] for i in range(0, len(uids), page_size)]
+    else:
+        uids = search_uids(conn, "ALL")
+        pages = [uids[-limit:]] if uids else []
+    total = sum(len(page) for page in pages)
+    done = 0
+    # Lazy mode only pulls envelope/structure; bodies come later
+    items = ENVELOPE_ITEMS if lazy else "(RFC822)"
+    for page in pages:
+        ids_to_fetch = list(reversed(page))
+        fetched = iter_fetch(conn, ids_to_fetch, items, chunk_size=chunk_size, use_uid=True, stats=stats)
+        if lazy:
+            mails = (mail_from_envelope(uid, fields) for uid, fields in fetched if "ENVELOPE" in fields)
+        else:
+            # Parse + classify in the process pool; records come back in fetch order.
+            # Whether the pool is worth starting depends on the whole run, not the page.
+            raws = ((uid, fields["RFC822"]) for uid, fields in fetched if fields.get("RFC822"))
+            mails = (dict(rec, loaded=True, replied=False)
+                     for rec in pipeline.imap(raws, expected=total,
+                                              mailbox=((account or "").lower(), folder, uidvalidity)))
+
+        out = []
+        for mail in mails:
+            mail.update(account=(account or "").lower(), folder=folder, uidvalidity=uidvalidity)
+            if bodies is not None:
+                mail = MailRecord.from_dict(mail, bodies)
+            out.append(mail)
+            done += 1
+            if progress:
+                progress(done, total)
+        yield out, page[-1]
+
+
+def fetch_new(conn, account: str, folder: str, uidvalidity: int | None, last_uid: int | None,
+              limit: int = FETCH_LIMIT, **kwargs):
+    # The first page of fetch_pages(): (mails, mark), or ([], None) when nothing is new
+    return next(fetch_pages(conn, account, folder, uidvalidity, last_uid, limit, **kwargs), ([], None))
+
+
+def sync_mailbox(conn, account: str, folder: str, store, sync_state, pipeline=None,
+                 limit: int = FETCH_LIMIT, lazy: bool = False, page_size: int = FETCH_PAGE_SIZE) -> dict:
+    # Select + incremental fetch + persist for one mailbox (blocking)
+    t0 = time.perf_counter()
+    stats = FetchStats()
+    _, uidvalidity = select_folder(conn, folder, readonly=True)
+    last_uid = sync_state.last_uid(account, folder, uidvalidity)
+    pages = []
+    for page, mark in fetch_pages(conn, account, folder, uidvalidity, last_uid, limit=limit,
+                                  lazy=lazy, pipeline=pipeline, stats=stats, page_size=page_size):
+        store.upsert_many(account, folder, uidvalidity, page)
+        sync_state.update(account, folder, uidvalidity, mark)
+        pages.append(page)
+    mails = [mail for page in reversed(pages) for mail in page]  # newest first
+    return {
+        "account": account,
+        "folder": folder,
+        "uidvalidity": uidvalidity,
+        "incremental": last_uid is not None,  # False: first sync or UIDVALIDITY reset
+        "new": mails,
+        "stats": stats,
+        "elapsed": time.perf_counter() - t0,
+        "error": None,
+    }
+
+
+# ----------------- CONNECTIONS -----------------
+
+class _ImapPool:
+    # Up to `size` logged-in connections for one account
+
+    def __init__(self, connect, size: int):
+        self.connect = connect
+        self._idle = queue.LifoQueue()  # (conn, last_used)
+        self._slots = threading.BoundedSemaphore(max(1, size))
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if time.monotonic() - last_used < IMAP_NOOP_AFTER_SEC:
+                    return conn
+                try:
+                    if conn.noop()[0] == "OK":
+                        return conn
+                except Exception:
+                    pass
+                _logout(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, reusable: bool = True):
+        if reusable:
+            self._idle.put((conn, time.monotonic()))
+        else:
+            _logout(conn)
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _logout(conn)
+
+
+def _logout(conn):
+    try:
+        conn.logout()
+    except Exception:
+        pass
+
+
+# ----------------- ENGINE -----------------
+
+class SyncEngine:
+    # Syncs many (account, folder) mailboxes concurrently. imaplib is blocking,
+    # so each mailbox sync runs in a thread pool and an asyncio loop schedules
+    # them, with at most conns_per_account connections open per account. Total
+    # time is close to the slowest mailbox rather than the sum.
+
+    def __init__(self, store, sync_state, pipeline=None, conns_per_account: int = CONNS_PER_ACCOUNT,
+                 limit: int = FETCH_LIMIT, lazy: bool = False):
+        self.store = store
+        self.sync_state = sync_state
+        self.pipeline = pipeline
+        self.conns_per_account = max(1, conns_per_account)
+        self.limit = limit
+        self.lazy = lazy
+        self.accounts = {}  # account (lowercase) -> {"folders": [...], "pool": _ImapPool}
+        self._executor = ThreadPoolExecutor(max_workers=SYNC_THREADS, thread_name_prefix="imap-sync")
+
+    def add_account(self, account: str, connect, folders=("INBOX",)):
+        # connect() -> logged-in imaplib connection; replaces an existing entry
+        self.remove_account(account)
+        self.accounts[account.lower()] = {
+            "folders": list(folders) or ["INBOX"],
+            "pool": _ImapPool(connect, self.conns_per_account),
+        }
+
+    def remove_account(self, account: str):
+        entry = self.accounts.pop(account.lower(), None)
+        if entry:
+            entry["pool"].close()
+
+    @property
+    def sources(self) -> list[tuple[str, str]]:
+        return [(account, folder) for account, a in self.accounts.items() for folder in a["folders"]]
+
+    def has_account(self, account: str | None) -> bool:
+        return (account or "").lower() in self.accounts
+
+    def call(self, account: str, folder: str | None, fn):
+        # Run fn(conn) on a pooled connection of `account` (blocking), with
+        # `folder` selected first unless None. Used for on-demand body/preview
+        # fetches of messages in any synced mailbox.
+        pool = self.accounts[account.lower()]["pool"]
+        conn = pool.acquire()
+        ok = False
+        try:
+            if folder is not None:
+                select_folder(conn, folder, readonly=True)
+            result = fn(conn)
+            ok = True
+            return result
+        finally:
+            pool.release(conn, reusable=ok)
+
+    def _sync_one(self, account: str, folder: str) -> dict:
+        try:
+            return self.call(account, None, lambda conn: sync_mailbox(
+                conn, account, folder, self.store, self.sync_state, self.pipeline, self.limit, self.lazy))
+        except Exception as e:
+            traceback.print_exc()
+            return {"account": account, "folder": folder, "uidvalidity": None, "incremental": False,
+                    "new": [], "stats": None, "elapsed": 0.0, "error": str(e)}
+
+    async def sync_all(self) -> list[dict]:
+        # One result dict per mailbox, in self.sources order; failures are
+        # reported in result["error"] and don't stop the other mailboxes
+        loop = asyncio.get_running_loop()
+        limits = {account: asyncio.Semaphore(self.conns_per_account) for account in self.accounts}
+
+        async def one(account, folder):
+            async with limits[account]:
+                return await loop.run_in_executor(self._executor, self._sync_one, account, folder)
+
+        return await asyncio.gather(*(one(account, folder) for account, folder in self.sources))
+
+    def sync(self) -> list[dict]:
+        # Blocking entry point for callers outside an event loop (GUI worker thread)
+        return asyncio.run(self.sync_all())
+
+    def close(self):
+        for account in list(self.accounts):
+            self.remove_account(account)
+        self._executor.shutdown(wait=False)
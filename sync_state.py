@@ -0,0 +1,65 @@
+import os
+import json
+import threading
+
+
+# ----------------- UID HIGH-WATER MARKS -----------------
+
+class SyncState:
+    # Persists {account/folder: {"uidvalidity": int, "last_uid": int}} as JSON so
+    # incremental fetches survive restarts.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        self.load()
+
+    @staticmethod
+    def _key(account: str, folder: str) -> str:
+        return f"{(account or '').lower()}/{folder}"
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._data = data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            self._data = {}
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def get(self, account: str, folder: str) -> dict | None:
+        with self._lock:
+            entry = self._data.get(self._key(account, folder))
+            return dict(entry) if entry else None
+
+    def last_uid(self, account: str, folder: str, uidvalidity: int | None) -> int | None:
+        # High-water mark, or None when unknown or UIDVALIDITY changed (full resync needed)
+        entry = self.get(account, folder)
+        if not entry or uidvalidity is None or entry.get("uidvalidity") != uidvalidity:
+            return None
+        return int(entry.get("last_uid", 0))
+
+    def update(self, account: str, folder: str, uidvalidity: int | None, last_uid: int):
+        key = self._key(account, folder)
+        with self._lock:
+            entry = self._data.get(key) or {}
+            if entry.get("uidvalidity") != uidvalidity:
+                entry = {"uidvalidity": uidvalidity, "last_uid": 0}
+            entry["last_uid"] = max(int(entry.get("last_uid", 0)), int(last_uid))
+            self._data[key] = entry
+        self.save()
+
+    def reset(self, account: str, folder: str):
+        with self._lock:
+            self._data.pop(self._key(account, folder), None)
+        self.save()
@@ -0,0 +1,96 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_servers import FakeImapServer, Mailbox  # noqa: E402
+from imap_fetch import select_folder  # noqa: E402
+from imap_idle import connect_imap  # noqa: E402
+from mailgen import MailboxSpec, generate  # noqa: E402
+from mailparse import ParsePipeline  # noqa: E402
+from message_store import MessageStore  # noqa: E402
+from sync_engine import fetch_pages, sync_mailbox  # noqa: E402
+from sync_state import SyncState  # noqa: E402
+
+# Incremental sync against the offline fake IMAP server (benchmarks/fake_servers.py):
+#   python -m unittest discover tests
+
+USER = "test@example.com"
+LIMIT = 5
+
+
+class IncrementalSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.raws = generate(MailboxSpec(count=3 * LIMIT + 3, body_words=(5, 20), attach_ratio=0))
+        self.box = Mailbox(self.raws[:LIMIT + 1])
+        self.server = FakeImapServer({"INBOX": self.box}).start()
+        self.conn = connect_imap("127.0.0.1", self.server.port, False, USER, "secret")
+        self.store = MessageStore(os.path.join(self.tmp, "messages.db"))
+        self.state = SyncState(os.path.join(self.tmp, "sync_state.json"))
+        self.pipeline = ParsePipeline(1)
+
+    def tearDown(self):
+        self.conn.logout()
+        self.server.stop()
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def stored_uids(self) -> set:
+        return {int(m["uid"]) for m in self.store.recent(USER, "INBOX", self.box.uidvalidity, 1000)}
+
+    def test_first_sync_takes_newest_limit(self):
+        result = sync_mailbox(self.conn, USER, "INBOX", self.store, self.state, self.pipeline, limit=LIMIT)
+        self.assertEqual(len(result["new"]), LIMIT)
+        self.assertEqual(self.stored_uids(), set(range(2, LIMIT + 2)))
+        self.assertEqual(self.state.last_uid(USER, "INBOX", self.box.uidvalidity), LIMIT + 1)
+
+    def test_backlog_over_limit_reaches_store(self):
+        # limit + N new messages between two syncs: none may be skipped
+        sync_mailbox(self.conn, USER, "INBOX", self.store, self.state, self.pipeline, limit=LIMIT)
+        for raw in self.raws[LIMIT + 1:]:
+            self.box.append(raw)
+        top = self.box.messages[-1][0]
+        result = sync_mailbox(self.conn, USER, "INBOX", self.store, self.state, self.pipeline,
+                              limit=LIMIT, lazy=True)
+        self.assertEqual([int(m["uid"]) for m in result["new"]], list(range(top, LIMIT + 1, -1)))
+        self.assertEqual(self.stored_uids(), set(range(2, top + 1)))
+        self.assertEqual(self.state.last_uid(USER, "INBOX", self.box.uidvalidity), top)
+
+    def test_pages_are_oldest_first_with_their_own_mark(self):
+        for raw in self.raws[LIMIT + 1:]:
+            self.box.append(raw)
+        _, uidvalidity = select_folder(self.conn, "INBOX", readonly=True)
+        pages = list(fetch_pages(self.conn, USER, "INBOX", uidvalidity, 1, limit=LIMIT, lazy=True,
+                                 page_size=LIMIT))
+        self.assertEqual([mark for _, mark in pages], [6, 11, 16, 18])
+        for mails, mark in pages:
+            self.assertEqual(int(mails[0]["uid"]), mark)  # newest first within a page
+
+    def test_pool_decision_sees_whole_backlog(self):
+        # The first-sync limit does not cut pages down below the pool threshold
+        for raw in self.raws[LIMIT + 1:]:
+            self.box.append(raw)
+        _, uidvalidity = select_folder(self.conn, "INBOX", readonly=True)
+        sizes = []
+        pipeline = self.pipeline
+
+        class Recorder:
+            def imap(self, items, expected=None, mailbox=None):
+                sizes.append(expected)
+                return pipeline.imap(items, expected, mailbox)
+
+        pages = list(fetch_pages(self.conn, USER, "INBOX", uidvalidity, 1, limit=LIMIT,
+                                 pipeline=Recorder(), page_size=LIMIT))
+        self.assertEqual(sizes, [17] * len(pages))
+        self.assertEqual(sum(len(mails) for mails, _ in pages), 17)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,234 @@
+import re
+import threading
+
+from metrics import METRICS
+from sync_engine import mail_sort_key
+
+# ----------------- CONSTANTS -----------------
+
+THREAD_MAX_REFS = 5  # References ids used per message: the thread root + the most recent ones
+
+_MSG_ID_RE = re.compile(r"<[^<>\s]+>")
+_ADDRESS_RE = re.compile(r"<([^<>]*)>")
+# "Re: ", "AW: ", "Fwd: ", "RE[2]: " ... ; only the reply forms link by subject
+_PREFIX_RE = re.compile(r"^\s*(re|aw|sv|antw|fwd?|wg|tr)\s*(\[\d+\])?\s*:\s*", re.IGNORECASE)
+_REPLY_PREFIXES = {"re", "aw", "sv", "antw"}
+
+
+def message_ids(text: str) -> list:
+    # "<a@x> <b@y>" (References/In-Reply-To header text) -> ["<a@x>", "<b@y>"]
+    return _MSG_ID_RE.findall(text or "")
+
+
+def normalize_subject(subject: str) -> tuple[str, bool]:
+    # ("order 123", True) for "Re: AW: Order  123"; True when a reply prefix was stripped
+    text = subject or ""
+    is_reply = False
+    while True:
+        m = _PREFIX_RE.match(text)
+        if not m:
+            break
+        is_reply = is_reply or m.group(1).lower() in _REPLY_PREFIXES
+        text = text[m.end():]
+    return " ".join(text.lower().split()), is_reply
+
+
+def thread_refs(mail) -> list:
+    # Message-IDs this message points at: References (root + newest, capped), else In-Reply-To
+    refs = message_ids(mail.get("references"))
+    if len(refs) > THREAD_MAX_REFS:
+        refs = refs[:1] + refs[-(THREAD_MAX_REFS - 1):]
+    parent = message_ids(mail.get("in_reply_to"))[:1]
+    if parent and parent[0] not in refs:
+        refs += parent
+    return refs
+
+
+def thread_depth(mail) -> int:
+    # How far into its conversation a message is (0 = it started it)
+    refs = thread_refs(mail)
+    if refs:
+        return len(refs)
+    return 1 if normalize_subject(mail.get("subject"))[1] else 0
+
+
+def _address(sender: str) -> str:
+    # "Name <a@b.com>" -> "a@b.com" (cheaper than parseaddr; only compared for equality)
+    m = _ADDRESS_RE.search(sender or "")
+    return (m.group(1) if m else sender or "").strip().lower()
+
+
+def _position(mail) -> tuple:
+    # Order within a thread: Date header, then depth for undated/equal dates
+    return mail_sort_key(mail), thread_depth(mail)
+
+
+def _node(mail) -> str:
+    # Message-ID, or the mailbox position for messages without one
+    ids = message_ids(mail.get("message_id"))
+    if ids:
+        return ids[0]
+    return (f"{(mail.get('account') or '').lower()}/{mail.get('folder') or ''}/"
+            f"{mail.get('uidvalidity') or 0}/{mail.get('uid')}")
+
+
+# ----------------- INDEX -----------------
+
+class Thread:
+    __slots__ = ("size", "category", "urgent", "replied")
+
+    def __init__(self):
+        self.size = 0  # messages seen (referenced-only ids do not count)
+        self.category = ""  # "" until a message in it is classified
+        self.urgent = False
+        self.replied = False  # any message in it was answered
+
+
+class ThreadIndex:
+    # Groups messages into conversations. Message-IDs are nodes of a union-find
+    # forest: each message is joined with the ids in its References and
+    # In-Reply-To headers, so adding one costs a few dict lookups however large
+    # the thread is. A reply ("Re: ...") without those headers joins the first
+    # other message from the same sender, to the same account, with the same
+    # normalized subject; replies seen before that message wait for it. Messages
+    # can come from the loaded list or the store in any order; adding one again
+    # only refreshes its thread's replied/category state. Safe to share between
+    # threads.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parent = {}  # id -> parent id (roots point at themselves)
+        self._threads = {}  # root id -> Thread, for sets holding at least one message
+        self._seen = set()  # ids of messages added
+        # (account, sender, normalized subject) -> [anchor id, anchor is not a headerless reply]
+        self._subjects = {}
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _find(self, node: str) -> str:
+        parent = self._parent
+        p = parent.setdefault(node, node)
+        while p != node:
+            grand = parent[p]
+            parent[node] = grand  # path halving
+            node, p = p, grand
+        return node
+
+    def _union(self, a: str, b: str):
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return
+        ta, tb = self._threads.get(ra), self._threads.get(rb)
+        if tb is None or (ta is not None and ta.size >= tb.size):
+            ra, rb, ta, tb = rb, ra, tb, ta
+        # rb absorbs ra: the larger thread, or the only one of the two with messages
+        self._parent[ra] = rb
+        if ta is not None:
+            del self._threads[ra]
+            tb.size += ta.size
+            tb.replied = tb.replied or ta.replied
+            if not tb.category:
+                tb.category, tb.urgent = ta.category, ta.urgent
+
+    def _add(self, mail) -> Thread:
+        node = _node(mail)
+        if node not in self._seen:
+            self._seen.add(node)
+            root = self._find(node)
+            thread = self._threads.get(root)
+            if thread is None:
+                thread = self._threads[root] = Thread()
+            thread.size += 1
+            refs = thread_refs(mail)
+            for ref in refs:
+                self._union(node, ref)
+            subject, is_reply = normalize_subject(mail.get("subject"))
+            if subject:
+                key = ((mail.get("account") or "").lower(), _address(mail.get("from")), subject)
+                if is_reply and not refs:
+                    # Headerless reply: join the anchor, or wait as one for the original
+                    entry = self._subjects.setdefault(key, [node, False])
+                    if entry[0] != node:
+                        self._union(node, entry[0])
+                else:
+                    entry = self._subjects.get(key)
+                    if entry is None:
+                        self._subjects[key] = [node, True]
+                    elif not entry[1]:
+                        # Replies indexed before their original: join them now
+                        self._union(node, entry[0])
+                        entry[:] = [node, True]
+        thread = self._threads[self._find(node)]
+        if mail.get("replied"):
+            thread.replied = True
+        category = mail.get("category")
+        if category and category != "Unclassified" and not thread.category:
+            thread.category, thread.urgent = category, bool(mail.get("urgent"))
+        return thread
+
+    def thread(self, mail) -> Thread:
+        # The message's thread (adding the message first if it is new)
+        with self._lock:
+            return self._add(mail)
+
+    def add_many(self, mails) -> int:
+        # Locks per message: `mails` may be a long store scan
+        n = 0
+        for mail in mails:
+            with self._lock:
+                self._add(mail)
+            n += 1
+        return n
+
+    def mark_replied(self, mail):
+        with self._lock:
+            self._add(mail).replied = True
+
+    def classify_many(self, mails, classify, reuse: bool = True) -> list:
+        # (category, urgent) for each of `mails`, classifying one message per
+        # thread (the earliest of `mails` in it) and giving its result to the
+        # rest. With reuse, a thread that already has a category is not
+        # classified at all. classify(representatives) -> [(category, urgent)]
+        # is called once, outside the lock. Threads may be merged meanwhile, so
+        # each result goes to its representative's thread as it is now; when two
+        # were merged, the earlier representative's result is kept.
+        mails = list(mails)
+        with self._lock:
+            for mail in mails:
+                self._add(mail)
+            threads = [self._threads[self._find(_node(m))] for m in mails]
+        groups = {}
+        for mail, thread in zip(mails, threads):
+            groups.setdefault(thread, []).append(mail)
+        todo = [t for t in groups if not (reuse and t.category)]
+        reps = [min(groups[t], key=_position) for t in todo]
+        results = classify(reps) if reps else []
+        METRICS.inc("thread_skipped_total", len(mails) - len(reps), stage="classify")
+        with self._lock:
+            written = set()
+            for rep, (category, urgent) in sorted(zip(reps, results), key=lambda r: _position(r[0])):
+                thread = self._threads[self._find(_node(rep))]
+                if thread not in written:
+                    written.add(thread)
+                    thread.category, thread.urgent = category, bool(urgent)
+            return [(t.category, t.urgent) for t in (self._threads[self._find(_node(m))] for m in mails)]
+
+    def reply_targets(self, mails) -> list:
+        # The messages of `mails` that should get an auto-reply: one per thread
+        # (the latest in it), and none for threads already answered
+        mails = list(mails)
+        with self._lock:
+            for mail in mails:
+                self._add(mail)
+            threads = [self._threads[self._find(_node(m))] for m in mails]
+        best = {}
+        for mail, thread in zip(mails, threads):
+            if thread.replied:
+                continue
+            current = best.get(thread)
+            if current is None or _position(mail) > _position(current):
+                best[thread] = mail
+        chosen = {id(m) for m in best.values()}
+        METRICS.inc("thread_skipped_total", len(mails) - len(chosen), stage="reply")
+        return [m for m in mails if id(m) in chosen]
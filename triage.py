@@ -0,0 +1,378 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import traceback
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from category_model import HybridClassifier, load_classifier, train_from_log
+from classify_cache import ClassificationCache
+from imap_idle import IdleWatcher, connect_imap
+from mail_stats import ReplyHistory, format_duration
+from mailparse import PARSE_WORKERS, ParsePipeline
+from message_store import MessageStore
+from metrics import METRICS_EXPORT_SEC, Exporter, profiled, timed
+from reply_jobs import REPLY_CONCURRENCY, REPLY_RATE_PER_MIN, ReplyJob, SentLedger, reply_key
+from reply_log import ensure_log_csv, flush_logs, log_reply
+from reports import PERIODS, build_report, format_report
+from reply_templates import build_reply_messages, default_templates, ensure_templates
+from settings import (
+    ACCOUNTS_PATH, CLASSIFY_CACHE_PATH, HISTORY_PATH, LEDGER_PATH, LOG_CSV_PATH, METRICS_JSON_PATH, METRICS_PROM_PATH,
+    MODEL_PATH, PROFILE_DIR, STORE_PATH, SYNC_STATE_PATH, ensure_dirs,
+)
+from smtp_pool import SmtpPool, connect_smtp
+from sync_engine import FETCH_LIMIT, SyncEngine, load_accounts
+from sync_state import SyncState
+from thread_index import ThreadIndex
+
+# Headless fetch -> classify -> auto-reply loop. Deliberately imports nothing
+# from the GUI stack (customtkinter, keyring, fpdf) so it runs on a server:
+#
+#   python -m triage run --watch
+
+# ----------------- CONSTANTS -----------------
+
+WATCH_INTERVAL_SEC = 5 * 60  # time between cycles in --watch mode (unless IDLE wakes us)
+DEFAULT_PASSWORD_ENV = "EMAIL_ASSISTANT_PASSWORD"
+
+
+def log(text: str):
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {text}", flush=True)
+
+
+def account_password(account: dict) -> str:
+    env = account.get("password_env") or DEFAULT_PASSWORD_ENV
+    password = os.environ.get(env, "")
+    if not password:
+        raise RuntimeError(f"No password for {account['email']}: set ${env}")
+    return password
+
+
+# ----------------- ENGINE -----------------
+
+class Triage:
+    # Owns the store, ledger, sync engine and one SMTP pool per replying account.
+    # cycle() runs one sync -> classify -> reply pass over all accounts.
+
+    def __init__(self, accounts: list, reply: bool = True, reply_backlog: bool = False,
+                 limit: int = FETCH_LIMIT, workers: int = PARSE_WORKERS,
+                 concurrency: int = REPLY_CONCURRENCY, per_minute: float = REPLY_RATE_PER_MIN):
+        ensure_dirs()
+        ensure_log_csv()
+        ensure_templates()
+        self.accounts = accounts
+        self.reply = reply
+        self.reply_backlog = reply_backlog  # also answer mail found on a first (non-incremental) sync
+        self.concurrency = concurrency
+        self.per_minute = per_minute
+        self.store = MessageStore(STORE_PATH)
+        self.sync_state = SyncState(SYNC_STATE_PATH)
+        self.ledger = SentLedger(LEDGER_PATH)
+        self.classifier, error = load_classifier()
+        if error:
+            log(error)
+        self.classify_cache = ClassificationCache(CLASSIFY_CACHE_PATH, self.classifier)
+        self.threads = ThreadIndex()  # conversations, so each is classified and answered once
+        self.threads.add_many(self.store.iter_threading())
+        self.history = ReplyHistory(HISTORY_PATH)
+        self.pipeline = ParsePipeline(workers)
+        self.engine = SyncEngine(self.store, self.sync_state, self.pipeline, limit=limit)
+        self.smtp = {}  # account (lowercase) -> (from address, SmtpPool)
+        self.job = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        for acc in accounts:
+            password = account_password(acc)
+            host, port, use_ssl, user = acc["imap_host"], acc["imap_port"], acc["ssl"], acc["email"]
+            self.engine.add_account(
+                user, lambda h=host, p=port, s=use_ssl, u=user, pw=password: connect_imap(h, p, s, u, pw),
+                acc["folders"])
+            if reply and acc["smtp_host"]:
+                pool = SmtpPool(lambda h=acc["smtp_host"], p=acc["smtp_port"], s=use_ssl, u=user, pw=password:
+                                connect_smtp(h, p, s, u, pw))
+                self.smtp[user.lower()] = (user, pool)
+
+    def cycle(self) -> dict:
+        with timed("cycle"):
+            return self._cycle()
+
+    def _cycle(self) -> dict:
+        t0 = time.perf_counter()
+        results = self.engine.sync()
+        for r in results:
+            if r["error"]:
+                log(f"{r['account']}/{r['folder']}: sync failed: {r['error']}")
+        new = [m for r in results for m in r["new"]]
+        self.threads.add_many(new)
+
+        # Full fetches are classified by the rules while parsing; this catches
+        # leftovers (which take their thread's category when it has one), or
+        # redoes everything, one message per thread, when a trained model is loaded
+        model = isinstance(self.classifier, HybridClassifier)
+        pending = new if model else [m for m in new if m["category"] == "Unclassified"]
+        if pending:
+            labels = self.threads.classify_many(pending, self.classify_mails, reuse=not model)
+            for mail, (cat, urg) in zip(pending, labels):
+                mail["category"], mail["urgent"] = cat, urg
+            self.store.update_many([(m.get("store_id"), {"category": m["category"], "urgent": m["urgent"]})
+                                    for m in pending])
+
+        sent = failed = skipped = threaded = 0
+        if self.reply:
+            backlog_ok = {(r["account"], r["folder"]) for r in results if r["incremental"] or self.reply_backlog}
+            candidates = [m for m in new if (m["account"], m["folder"]) in backlog_ok]
+            job, threaded = self.send_replies(candidates)
+            if job:
+                sent, failed, skipped = job.sent, job.failed, job.skipped
+                for recipient, error in job.errors:
+                    log(f"reply to {recipient} failed: {error}")
+
+        summary = {
+            "mailboxes": len(results),
+            "errors": sum(1 for r in results if r["error"]),
+            "new": len(new),
+            "sent": sent,
+            "failed": failed,
+            "skipped": skipped,
+            "threaded": threaded,
+            "elapsed": time.perf_counter() - t0,
+        }
+        log(f"cycle: {summary['mailboxes']} mailboxes, {summary['new']} new, {sent} replied, "
+            f"{failed} failed, {skipped} already replied, {threaded} skipped by threading, "
+            f"{summary['elapsed']:.1f}s")
+        return summary
+
+    def classify_mails(self, mails: list) -> list:
+        return self.classify_cache.classify_many((m["subject"], m.get("body") or m.get("preview") or "")
+                                                 for m in mails)
+
+    def send_replies(self, mails: list) -> tuple[ReplyJob | None, int]:
+        # (job, messages left out because their thread is answered or gets a reply already)
+        candidates = [m for m in mails if m.get("account") in self.smtp and not m.get("replied")
+                      and m["category"] != "Unclassified"]
+        targets = self.threads.reply_targets(candidates)
+        by_account = {}
+        for mail in targets:
+            by_account.setdefault(mail["account"], []).append(mail)
+        items = []
+        for account, batch in by_account.items():
+            for mail, msg, addr in build_reply_messages(batch, self.smtp[account][0]):
+                key = reply_key(mail, mail["account"], mail["folder"], mail.get("uidvalidity"))
+                items.append((key, addr, msg, mail))
+        for error in default_templates().take_errors():
+            log(error)
+        if not items:
+            return None, len(candidates) - len(targets)
+
+        def send(msg):
+            # Each reply goes out through the account it is sent from
+            return self.smtp[msg["From"].lower()][1].send_message(msg)
+
+        def on_sent(mail):
+            mail["replied"] = True
+            self.threads.mark_replied(mail)
+            self.store.update(mail, replied=True)
+            log_reply(mail, mode="daemon")
+            self.history.record(mail)
+
+        self.job = ReplyJob(send, self.ledger, items, concurrency=self.concurrency,
+                            per_minute=self.per_minute, on_sent=on_sent)
+        self.job.start()
+        self.job.wait()
+        return self.job, len(candidates) - len(targets)
+
+    def run(self, watch: bool = False, interval: float = WATCH_INTERVAL_SEC, push: bool = False,
+            profile: bool = False):
+        # One cycle, or cycles until stop(): every `interval` seconds, or as soon
+        # as an IMAP IDLE watcher reports new mail (push=True). profile=True
+        # captures cProfile/tracemalloc output for the first cycle.
+        watchers = []
+        if watch and push:
+            for acc in self.accounts:
+                password = account_password(acc)
+                watcher = IdleWatcher(
+                    lambda a=acc, pw=password: connect_imap(a["imap_host"], a["imap_port"], a["ssl"],
+                                                            a["email"], pw),
+                    on_new=self._wake.set, folder=acc["folders"][0],
+                    on_status=lambda text, a=acc: log(f"{a['email']}: {text}"), poll_sec=int(interval))
+                watcher.start()
+                watchers.append(watcher)
+        try:
+            while True:
+                try:
+                    with profiled("cycle", PROFILE_DIR) if profile else nullcontext():
+                        self.cycle()
+                except Exception as e:
+                    traceback.print_exc()
+                    log(f"cycle failed: {e}")
+                if profile:
+                    log(f"profile written to {PROFILE_DIR}")
+                    profile = False
+                if not watch or self._stop.is_set():
+                    break
+                self._wake.wait(interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+        finally:
+            for watcher in watchers:
+                watcher.stop()
+
+    def stop(self):
+        # Ends run() after the current cycle; an in-progress reply job stops early
+        self._stop.set()
+        self._wake.set()
+        if self.job:
+            self.job.cancel()
+
+    def close(self):
+        for _, pool in self.smtp.values():
+            pool.close()
+        self.engine.close()
+        self.pipeline.shutdown()
+        flush_logs()
+        self.store.close()
+        self.ledger.close()
+        self.classify_cache.close()
+
+
+# ----------------- CLI -----------------
+
+def cmd_run(args) -> int:
+    accounts = load_accounts(args.accounts)
+    if not accounts:
+        print(f"No accounts configured in {args.accounts}", file=sys.stderr)
+        return 2
+    try:
+        triage = Triage(accounts, reply=not args.no_reply, reply_backlog=args.reply_backlog,
+                        limit=args.limit, workers=args.workers)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    def on_signal(signum, frame):
+        log("stopping...")
+        triage.stop()
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    # The loop runs in a worker thread so signals are handled promptly
+    exporter = Exporter(METRICS_PROM_PATH, METRICS_JSON_PATH, args.metrics_interval, on_error=log)
+    if args.metrics_interval > 0:
+        exporter.start()
+    worker = threading.Thread(target=triage.run, kwargs={
+        "watch": args.watch, "interval": args.interval, "push": args.push, "profile": args.profile},
+        daemon=True)
+    log(f"triage: {len(accounts)} accounts, {len(triage.engine.sources)} mailboxes, "
+        f"replies {'on' if triage.smtp else 'off'}{', watching' if args.watch else ''}")
+    worker.start()
+    while worker.is_alive():
+        worker.join(0.5)
+    triage.close()
+    error = exporter.stop()
+    if error:
+        log(error)
+    return 0
+
+
+def cmd_status(args) -> int:
+    ensure_dirs()
+    store = MessageStore(STORE_PATH)
+    ledger = SentLedger(LEDGER_PATH)
+    try:
+        print(f"stored messages: {store.count()}")
+        totals = ReplyHistory(HISTORY_PATH).totals()
+        print(f"replies sent (all time): {totals['replied']}, {totals['urgent']} urgent, "
+              f"avg latency {format_duration(totals['avg_latency'])}")
+        pending = ledger.pending()
+        print(f"replies with unknown outcome (interrupted or cut-off sends): {len(pending)}")
+        for key in pending[:20]:
+            print(f"  {key}")
+    finally:
+        store.close()
+        ledger.close()
+    return 0
+
+
+def cmd_report(args) -> int:
+    try:
+        start = datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+        end = datetime.strptime(args.until, "%Y-%m-%d") + timedelta(days=1) if args.until else None
+    except ValueError as e:
+        print(f"Bad date: {e}", file=sys.stderr)
+        return 2
+    try:
+        report = build_report(args.log, start, end, args.period)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(format_report(report))
+    return 0
+
+
+def cmd_train(args) -> int:
+    ensure_dirs()
+    store = MessageStore(STORE_PATH)
+    try:
+        report = train_from_log(store, args.log, args.model)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        store.close()
+    print(f"trained on {report['examples']} labelled messages -> {report['path']}")
+    for category, n in sorted(report["categories"].items()):
+        print(f"  {category}: {n}")
+    if "test" in report:
+        print(f"held-out accuracy ({report['test']} messages): model {report['model_accuracy']:.1%}, "
+              f"model + rules {report['hybrid_accuracy']:.1%}, rules only {report['rules_accuracy']:.1%}")
+    return 0
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m triage", description="Headless email triage")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="sync, classify and auto-reply")
+    run.add_argument("--watch", action="store_true", help="keep running, one cycle per interval")
+    run.add_argument("--interval", type=float, default=WATCH_INTERVAL_SEC, help="seconds between cycles")
+    run.add_argument("--push", action="store_true", help="with --watch: wake up on IMAP IDLE notifications")
+    run.add_argument("--no-reply", action="store_true", help="sync and classify only")
+    run.add_argument("--reply-backlog", action="store_true",
+                     help="also reply to mail found on a mailbox's first sync")
+    run.add_argument("--accounts", default=ACCOUNTS_PATH, help="accounts JSON file")
+    run.add_argument("--limit", type=int, default=FETCH_LIMIT, help="newest messages per mailbox on first sync")
+    run.add_argument("--workers", type=int, default=PARSE_WORKERS, help="parse processes")
+    run.add_argument("--profile", action="store_true",
+                     help=f"cProfile/tracemalloc capture of the first cycle into {PROFILE_DIR}")
+    run.add_argument("--metrics-interval", type=float, default=METRICS_EXPORT_SEC,
+                     help=f"seconds between writes of {METRICS_PROM_PATH} and .json (0: only on exit)")
+    run.set_defaults(func=cmd_run)
+
+    status = sub.add_parser("status", help="show store and sent-ledger state")
+    status.set_defaults(func=cmd_status)
+
+    report = sub.add_parser("report", help="reply counts per day/week/month from the reply log")
+    report.add_argument("--since", help="first day (YYYY-MM-DD), default: start of the log")
+    report.add_argument("--until", help="last day (YYYY-MM-DD), inclusive, default: today")
+    report.add_argument("--period", choices=list(PERIODS), default="month", help="section length")
+    report.add_argument("--log", default=LOG_CSV_PATH, help="reply log CSV")
+    report.set_defaults(func=cmd_report)
+
+    train = sub.add_parser("train", help="learn categories from the reply log and stored messages (needs NumPy)")
+    train.add_argument("--log", default=LOG_CSV_PATH, help="reply log CSV")
+    train.add_argument("--model", default=MODEL_PATH, help="model file to write")
+    train.set_defaults(func=cmd_train)
+
+    args = p.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import itertools
+import threading
+import traceback
+
+# ----------------- CONSTANTS -----------------
+
+FRAME_MS = 16  # drain interval: coalesced updates are applied at most once per frame
+
+
+# ----------------- UI DISPATCHER -----------------
+
+class UiDispatcher:
+    # Hands widget updates from background threads to the Tk thread. Tk is not
+    # thread-safe, so workers never touch widgets themselves: they call() work
+    # that must run in order (dialogs, popups opening/closing) or latest() keyed
+    # updates (status text, progress, dashboard), of which only the newest per
+    # key is applied. The queue is drained from root.after every FRAME_MS, so a
+    # fetch of N messages costs one redraw per frame instead of N.
+    # Both run immediately when called on the Tk thread.
+
+    def __init__(self, root, frame_ms: int = FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self._ui_thread = threading.get_ident()
+        self._pending = {}  # key -> (fn, args, kwargs), in posting order
+        self._lock = threading.Lock()
+        self._seq = itertools.count()  # unique keys for ordered call()s
+        self._running = False
+        self.applied = 0
+        self.coalesced = 0  # updates replaced by a newer one before they were applied
+
+    def on_ui_thread(self) -> bool:
+        return threading.get_ident() == self._ui_thread
+
+    def call(self, fn, *args, **kwargs):
+        if self.on_ui_thread():
+            fn(*args, **kwargs)
+            return
+        with self._lock:
+            self._pending[("call", next(self._seq))] = (fn, args, kwargs)
+
+    def latest(self, key, fn, *args, **kwargs):
+        # A newer update replaces a pending one with the same key and takes its
+        # place after everything posted in between (e.g. after a popup close)
+        with self._lock:
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            if not self.on_ui_thread():
+                self._pending[key] = (fn, args, kwargs)
+                return
+        fn(*args, **kwargs)
+
+    def start(self):
+        self._running = True
+        self.root.after(self.frame_ms, self._drain)
+
+    def close(self):
+        # Stop draining; later posts are dropped with the pending ones
+        self._running = False
+        with self._lock:
+            self._pending.clear()
+
+    def _pop(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            key = next(iter(self._pending))
+            return self._pending.pop(key)
+
+    def _drain(self):
+        if not self._running:
+            return
+        # Reschedule first: a modal dialog opened by a callback runs its own event
+        # loop, and later updates should keep flowing while it is open
+        try:
+            self.root.after(self.frame_ms, self._drain)
+        except Exception:
+            self._running = False  # root destroyed
+            return
+        # Only what was queued when the frame started; a busy worker can't starve the loop
+        with self._lock:
+            budget = len(self._pending)
+        for _ in range(budget):
+            item = self._pop()
+            if item is None:
+                break
+            fn, args, kwargs = item
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+            self.applied += 1
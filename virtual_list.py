@@ -0,0 +1,239 @@
+import customtkinter as ctk
+
+# ----------------- CONSTANTS -----------------
+
+ROW_HEIGHT = 22  # pixels per list row
+WHEEL_ROWS = 3  # rows scrolled per mouse-wheel notch
+
+
+# ----------------- ROW VIEW (no Tk) -----------------
+
+class RowView:
+    # Display order over a backing list: filter + stable sort produce a list of
+    # positions into `items`, so changing either never copies or rebuilds rows.
+    # With a group key only the first row of each group is shown (collapsed
+    # threads); group_size() tells how many rows it stands for.
+
+    def __init__(self):
+        self.items = []
+        self.order = []  # positions in self.items, in display order
+        self._filter = None
+        self._sort_key = None
+        self._reverse = False
+        self._group = None
+        self._sizes = {}  # id(shown item) -> rows in its group, when grouping
+        self._index = None  # id(item) -> display row, built on demand
+
+    def set_items(self, items):
+        self.items = items
+        self.rebuild()
+
+    def set_view(self, predicate=None, key=None, reverse: bool = False, group=None):
+        # key=None keeps the backing order (reversed if reverse=True); group(item)
+        # -> hashable collapses rows with equal values into the first one shown
+        self._filter = predicate
+        self._sort_key = key
+        self._reverse = reverse
+        self._group = group
+        self.rebuild()
+
+    def rebuild(self):
+        items = self.items
+        order = range(len(items))
+        if self._filter is not None:
+            keep = self._filter
+            order = [i for i in order if keep(items[i])]
+        if self._sort_key is not None:
+            key = self._sort_key
+            order = sorted(order, key=lambda i: key(items[i]), reverse=self._reverse)
+        elif self._reverse:
+            order = list(reversed(order))
+        self._sizes = {}
+        if self._group is not None:
+            group = self._group
+            first, sizes = {}, {}
+            for i in order:
+                g = group(items[i])
+                if g in sizes:
+                    sizes[g] += 1
+                else:
+                    sizes[g] = 1
+                    first[g] = i
+            order = list(first.values())
+            self._sizes = {id(items[i]): sizes[g] for g, i in first.items()}
+        self.order = list(order)
+        self._index = None
+
+    def group_size(self, item) -> int:
+        return self._sizes.get(id(item), 1)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, row: int):
+        return self.items[self.order[row]]
+
+    def row_of(self, item) -> int | None:
+        if self._index is None:
+            items = self.items
+            self._index = {id(items[pos]): row for row, pos in enumerate(self.order)}
+        return self._index.get(id(item))
+
+
+# ----------------- VIRTUALIZED LIST WIDGET -----------------
+
+class VirtualList(ctk.CTkFrame):
+    # Scrollable list that only draws the rows currently on screen: one canvas
+    # text item per visible slot, re-pointed at different data rows on scroll.
+    # Tk work per refresh is O(visible rows), independent of the item count.
+    # formatter(item) -> (text, color or None); on_select(item) on click/arrow keys.
+
+    def __init__(self, master, formatter, on_select=None, row_height: int = ROW_HEIGHT, **kwargs):
+        super().__init__(master, **kwargs)
+        self.formatter = formatter
+        self.on_select = on_select
+        self.row_height = row_height
+        self.view = RowView()
+        self.top = 0  # first visible display row
+        self.selected = None  # selected item; survives sorting and filtering
+        self._slots = []  # (background rect id, text id) per visible row
+
+        self.font = ctk.CTkFont(size=12)
+        self.canvas = ctk.CTkCanvas(self, highlightthickness=0, bd=0)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", self._on_resize)
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_to(self.top - WHEEL_ROWS))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_to(self.top + WHEEL_ROWS))
+        self.canvas.bind("<Up>", lambda e: self._step(-1))
+        self.canvas.bind("<Down>", lambda e: self._step(1))
+        self.canvas.bind("<Prior>", lambda e: self._step(-self.page))
+        self.canvas.bind("<Next>", lambda e: self._step(self.page))
+
+    # -- data --
+
+    def set_items(self, items):
+        # items is kept by reference; call again (or refresh) after mutating it
+        self.view.set_items(items)
+        self._after_rebuild()
+
+    def set_view(self, predicate=None, key=None, reverse: bool = False, group=None):
+        # Filter + sort (+ collapse) in one pass; the widget itself is not rebuilt
+        self.view.set_view(predicate, key, reverse, group)
+        self.top = 0
+        self._after_rebuild()
+
+    def refresh(self, rebuild: bool = False):
+        # Re-draw visible rows from the data; rebuild=True also re-applies
+        # filter/sort (needed when the fields they look at changed)
+        if rebuild:
+            self.view.rebuild()
+            self._after_rebuild()
+        else:
+            self.redraw()
+
+    def update_item(self, item):
+        # Re-draw one row in place if it is on screen
+        row = self.view.row_of(item)
+        if row is not None and self.top <= row < self.top + len(self._slots):
+            self._draw_slot(row - self.top, self._colors())
+
+    def select(self, item, notify: bool = True):
+        self.selected = item
+        row = self.view.row_of(item) if item is not None else None
+        if row is not None and not (self.top <= row < self.top + self.page):
+            self.scroll_to(row - self.page // 2)
+        else:
+            self.redraw()
+        if notify and item is not None and self.on_select:
+            self.on_select(item)
+
+    def _after_rebuild(self):
+        if self.selected is not None and self.view.row_of(self.selected) is None:
+            self.selected = None
+        self.scroll_to(self.top)
+
+    # -- scrolling --
+
+    @property
+    def page(self) -> int:
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def scroll_to(self, row: int):
+        self.top = max(0, min(int(row), len(self.view) - self.page))
+        self.redraw()
+
+    def yview(self, *args):
+        # Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units"|"pages")
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * len(self.view))
+        elif args[0] == "scroll":
+            n = int(args[1])
+            self.scroll_to(self.top + (n * self.page if args[2] == "pages" else n))
+
+    def _on_wheel(self, event):
+        self.scroll_to(self.top - WHEEL_ROWS * (1 if event.delta > 0 else -1))
+
+    def _step(self, delta: int):
+        if not len(self.view):
+            return
+        row = self.view.row_of(self.selected) if self.selected is not None else None
+        row = 0 if row is None else max(0, min(len(self.view) - 1, row + delta))
+        self.select(self.view[row])
+
+    # -- drawing --
+
+    def _colors(self):
+        mode = 0 if ctk.get_appearance_mode() == "Light" else 1
+        theme = ctk.ThemeManager.theme
+        return (theme["CTkTextbox"]["fg_color"][mode], theme["CTkTextbox"]["text_color"][mode],
+                theme["CTkButton"]["fg_color"][mode])
+
+    def _on_resize(self, event=None):
+        needed = self.canvas.winfo_height() // self.row_height + 1
+        bg, fg, _ = self._colors()
+        self.canvas.configure(bg=bg)
+        while len(self._slots) < needed:
+            y = len(self._slots) * self.row_height
+            rect = self.canvas.create_rectangle(0, y, 10_000, y + self.row_height, width=0, fill=bg)
+            text = self.canvas.create_text(6, y + self.row_height // 2, anchor="w", font=self.font, fill=fg)
+            self._slots.append((rect, text))
+        while len(self._slots) > needed:
+            rect, text = self._slots.pop()
+            self.canvas.delete(rect, text)
+        self.scroll_to(self.top)
+
+    def redraw(self):
+        colors = self._colors()
+        for i in range(len(self._slots)):
+            self._draw_slot(i, colors)
+        total = len(self.view)
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + self.page) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _draw_slot(self, i: int, colors):
+        rect, text = self._slots[i]
+        row = self.top + i
+        if row >= len(self.view):
+            self.canvas.itemconfigure(rect, state="hidden")
+            self.canvas.itemconfigure(text, state="hidden")
+            return
+        item = self.view[row]
+        bg, fg, sel = colors
+        label, color = self.formatter(item)
+        self.canvas.itemconfigure(rect, state="normal", fill=sel if item is self.selected else bg)
+        self.canvas.itemconfigure(text, state="normal", text=label, fill=color or fg)
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        row = self.top + event.y // self.row_height
+        if row < len(self.view):
+            self.select(self.view[row])